@@ -0,0 +1,93 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+"""
+Measures how fast looking-glass responses are parsed into columns and how
+long the first and repeated per-location views take.
+
+Responses are generated with every RIS collector and a configurable number
+of peers each, shaped like the RIPEstat looking-glass data call.
+
+    python -m benchmarks.lg_parse --collectors 26 --peers 400
+"""
+
+# Import Third Party Modules
+import argparse
+import json
+import random
+import statistics
+import time
+# Import Throne Modules
+from src.parsers import lg_parser
+
+LOCATIONS = (
+    'Amsterdam, Netherlands', 'London, United Kingdom', 'Paris, France', 'Amsterdam, Netherlands',
+    'Geneva, Switzerland', 'Vienna, Austria', 'Otemachi, Japan', 'Stockholm, Sweden',
+    'Zurich, Switzerland', 'Milan, Italy', 'New York, NY, USA', 'Frankfurt, Germany',
+    'Moscow, Russia', 'Palo Alto, California, USA', 'Sao Paulo, Brazil', 'Miami, Florida, USA',
+    'Montevideo, Uruguay', 'Johannesburg, South Africa', 'Istanbul, Turkey', 'Bucharest, Romania',
+    'Singapore, Singapore', 'Dubai, United Arab Emirates', 'Madrid, Spain', 'Oslo, Norway',
+    'Budapest, Hungary', 'Riga, Latvia',
+)
+
+def make_response(collectors, peers, seed=0):
+    rng = random.Random(seed)
+    rrcs = []
+    for number in range(collectors):
+        rrc_peers = []
+        for _ in range(peers):
+            path = [rng.randrange(1, 400000) for _ in range(rng.randrange(1, 8))] + [13335]
+            rrc_peers.append({
+                'asn_origin': '13335',
+                'as_path': ' '.join(map(str, path)),
+                'community': ' '.join(f'{path[0]}:{rng.randrange(65535)}' for _ in range(rng.randrange(6))),
+                'last_updated': '2024-01-01T00:00:00',
+                'prefix': '1.1.1.0/24',
+                'peer': f'192.0.2.{rng.randrange(256)}',
+                'origin': 'IGP',
+                'next_hop': f'192.0.2.{rng.randrange(256)}',
+                'latest_time': '2024-01-01T08:00:00',
+            })
+        rrcs.append({'rrc': f'RRC{number:02}', 'location': LOCATIONS[number % len(LOCATIONS)], 'peers': rrc_peers})
+    return {
+        'status': 'ok', 'time': '2024-01-01T08:00:00', 'cached': False,
+        'data': {'rrcs': rrcs, 'query_time': '2024-01-01T08:00:00', 'latest_time': '2024-01-01T08:00:00'},
+    }
+
+def _median_ms(func, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+def run(collectors, peers, runs):
+    body = json.dumps(make_response(collectors, peers))
+    response = json.loads(body)
+    routes = lg_parser._LGParse(response).parse()
+    # Views are cached per parse, so the first view is timed on fresh parses
+    fresh = iter([lg_parser._LGParse(response).parse() for _ in range(runs)])
+    return {
+        'peers': len(routes),
+        'decode_ms': _median_ms(lambda: json.loads(body), runs),
+        'parse_ms': _median_ms(lambda: lg_parser._LGParse(response).parse(), runs),
+        'first_view_ms': _median_ms(lambda: next(fresh).view('US-NY'), runs),
+        'cached_view_ms': _median_ms(lambda: routes.view('US-NY'), runs),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--collectors', type=int, default=len(LOCATIONS))
+    parser.add_argument('--peers', type=int, default=400, help='Peers per collector.')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+    results = run(args.collectors, args.peers, args.runs)
+    print(f"{results['peers']} peers from {args.collectors} collectors")
+    print(f"json decode      {results['decode_ms']:>8.2f} ms")
+    print(f"parse            {results['parse_ms']:>8.2f} ms  ({results['peers'] / results['parse_ms'] * 1000:,.0f} peers/s)")
+    print(f"first view       {results['first_view_ms']:>8.4f} ms")
+    print(f"cached view      {results['cached_view_ms']:>8.4f} ms")
+
+if __name__ == '__main__':
+    main()
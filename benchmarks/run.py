@@ -0,0 +1,263 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+"""
+Runs the offline benchmark suite and writes a JSON report.
+
+Nothing leaves the machine: every upstream is answered by benchmarks.stub
+from the recorded fixtures plus a few large synthetic responses. The suite
+measures
+
+  parse    throughput of the response parsers on recorded and large responses
+  cli      in-process latency of each command against the stub, without
+           interpreter startup
+  startup  wall time of fresh `throne` processes (benchmarks.startup)
+
+With --baseline the report is compared against an earlier one and the run
+fails when any timing got slower by more than the tolerance.
+
+    python -m benchmarks.run --output report.json
+    python -m benchmarks.run --baseline report.json --tolerance 0.25
+"""
+
+# Import Third Party Modules
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+# Import Throne Modules
+from benchmarks import lg_parse, startup, stub
+
+# Large synthetic responses and the route each one is served under
+LARGE_LG_ADDRESS = '203.0.113.1'
+LARGE_DOMAIN = 'large.example'
+LARGE_HOST = '203.0.113.2'
+LARGE_ASN = 'AS64496'
+
+# Commands timed against the stub, by report name
+COMMANDS = {
+    'ip geo': ['ip', 'geo', '1.1.1.1'],
+    'ip geo (250 addresses)': ['ip', 'geo', '--format', 'csv'] + [f'198.51.100.{n}' for n in range(250)],
+    'ip info --all': ['ip', 'info', '1.1.1.1', '--all'],
+    'bgp asn': ['bgp', 'asn', '13335'],
+    'bgp prefix': ['bgp', 'prefix', '1.1.1.0/24'],
+    'bgp lg': ['bgp', 'lg', '1.1.1.1'],
+    'bgp lg --all (large)': ['bgp', 'lg', LARGE_LG_ADDRESS, '--all'],
+    'bgp paths (large)': ['bgp', 'paths', LARGE_LG_ADDRESS, '1.1.1.0/24', '--format', 'ndjson'],
+    'bgp prefixes': ['bgp', 'prefixes', '13335', '--count-addresses'],
+    'bgp prefixes --aggregate (large)': ['bgp', 'prefixes', LARGE_ASN, '--aggregate', '--count-addresses'],
+    'whois domain': ['whois', 'domain', 'example.com'],
+    'pdb asn': ['pdb', 'asn', '13335'],
+    'pdb ix': ['pdb', 'ix', 'AMS-IX'],
+    'pdb fac': ['pdb', 'fac', 'Equinix'],
+    'shodan info': ['shodan', 'info'],
+    'shodan dns resolve': ['shodan', 'dns', '-q', 'resolve', 'cloudflare.com', 'google.com', 'netflix.com', 'reddit.com'],
+    'shodan dns reverse': ['shodan', 'dns', '-q', 'reverse', '1.1.1.1', '8.8.8.8', '208.67.222.222', '208.67.220.220'],
+    'shodan dns domain': ['shodan', 'dns', '-q', 'domain', 'example.com'],
+    'shodan dns domain (large)': ['shodan', 'dns', '-q', 'domain', LARGE_DOMAIN],
+    'shodan search': ['shodan', 'search', '1.1.1.1'],
+    'shodan search (large)': ['shodan', 'search', LARGE_HOST],
+}
+
+def large_fixtures(scale=1):
+    """
+    Returns synthetic responses far larger than the recorded ones, shaped
+    like them, and the stub routes that serve them.
+    """
+    domain = stub.load_fixture('shodan_dns_domain')
+    domain['data'] = [
+        dict(record, subdomain=f'host{n:05}')
+        for n in range(2000 * scale) for record in domain['data'][:4]
+    ]
+    host = stub.load_fixture('shodan_host')
+    banner = host['data'][0]
+    host['data'] = [
+        dict(banner, port=1024 + n, _shodan=dict(banner['_shodan'], module=f'module{n % 50}'))
+        for n in range(2000 * scale)
+    ]
+    host['ports'] = [record['port'] for record in host['data']]
+    announced = stub.load_fixture('announced_prefixes')
+    timelines = announced['data']['prefixes'][0]['timelines']
+    # Mostly adjacent /24s with a covering /22 now and then, like a transit network
+    announced['data']['prefixes'] = [
+        {'prefix': f'{10 + n // 65536}.{n // 256 % 256}.{n % 256}.0/{22 if n % 16 == 0 else 24}', 'timelines': timelines}
+        for n in range(20000 * scale) if n % 7
+    ]
+    fixtures = {
+        'looking_glass_large': lg_parse.make_response(26, 400 * scale),
+        'shodan_dns_domain_large': domain,
+        'shodan_dns_resolve_large': {f'host{n}.example.com': f'198.51.{n // 256 % 256}.{n % 256}' for n in range(20000 * scale)},
+        'shodan_dns_reverse_large': {f'198.51.{n // 256 % 256}.{n % 256}': [f'host{n}.example.com'] for n in range(20000 * scale)},
+        'shodan_host_large': host,
+        'announced_prefixes_large': announced,
+    }
+    routes = {
+        f'stat.ripe.net/data/looking-glass/data.json?resource={LARGE_LG_ADDRESS}': 'looking_glass_large',
+        f'api.shodan.io/dns/domain/{LARGE_DOMAIN}': 'shodan_dns_domain_large',
+        f'api.shodan.io/shodan/host/{LARGE_HOST}': 'shodan_host_large',
+        f'stat.ripe.net/data/announced-prefixes/data.json?resource={LARGE_ASN}': 'announced_prefixes_large',
+    }
+    return fixtures, routes
+
+def _median_ms(func, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def _throughput(func, items, runs):
+    median_ms = _median_ms(func, runs)
+    return {'items': items, 'median_ms': median_ms, 'items_per_second': items / median_ms * 1000 if median_ms else None}
+
+def run_parse(fixtures, runs):
+    """
+    Times each parser on the recorded response and a large synthetic one.
+    """
+    from src.parsers import lg_parser, shodan_parser
+    recorded = stub.load_fixtures()
+
+    def lg(response):
+        return lambda: lg_parser._LGParse(response).parse()
+
+    def dns(response, query_type):
+        return lambda: shodan_parser._DNS(json_result=response, query_type=query_type).parse()
+
+    def ip_search(response):
+        return lambda: shodan_parser._IPSearch(json_result=response, query=response['ip_str']).parse()
+
+    def domain(response):
+        return lambda: list(shodan_parser._DNSDomain(response['domain']).parse([response]))
+
+    # A single api-info response parses in microseconds, so it is timed in bulk
+    api_info_repeat = 10000
+    def api_info(response):
+        def parse():
+            for _ in range(api_info_repeat):
+                shodan_parser._APIInfo(response).parse()
+        return parse
+
+    peers = lambda response: sum(len(rrc['peers']) for rrc in response['data']['rrcs'])
+    cases = {
+        'lg': (lg(recorded['looking_glass']), peers(recorded['looking_glass'])),
+        'lg (large)': (lg(fixtures['looking_glass_large']), peers(fixtures['looking_glass_large'])),
+        'dns resolve': (dns(recorded['shodan_dns_resolve'], 'resolve'), len(recorded['shodan_dns_resolve'])),
+        'dns resolve (large)': (dns(fixtures['shodan_dns_resolve_large'], 'resolve'), len(fixtures['shodan_dns_resolve_large'])),
+        'dns reverse': (dns(recorded['shodan_dns_reverse'], 'reverse'), len(recorded['shodan_dns_reverse'])),
+        'dns reverse (large)': (dns(fixtures['shodan_dns_reverse_large'], 'reverse'), len(fixtures['shodan_dns_reverse_large'])),
+        'dns domain': (domain(recorded['shodan_dns_domain']), len(recorded['shodan_dns_domain']['data'])),
+        'dns domain (large)': (domain(fixtures['shodan_dns_domain_large']), len(fixtures['shodan_dns_domain_large']['data'])),
+        'ip search': (ip_search(recorded['shodan_host']), len(recorded['shodan_host']['data'])),
+        'ip search (large)': (ip_search(fixtures['shodan_host_large']), len(fixtures['shodan_host_large']['data'])),
+        'api info': (api_info(recorded['shodan_api_info']), api_info_repeat),
+    }
+    return {name: _throughput(func, items, runs) for name, (func, items) in cases.items()}
+
+def run_cli(runs):
+    """
+    Times every command in COMMANDS in-process with the response cache off.
+    """
+    from click.testing import CliRunner
+    from bin.throne import cli
+    runner = CliRunner()
+    results = {}
+    for name, args in COMMANDS.items():
+        invoke = lambda: runner.invoke(cli, ['--no-cache'] + args)
+        # The first call imports the command's modules and opens connections
+        response = invoke()
+        result = {'median_ms': _median_ms(invoke, runs), 'exit_code': response.exit_code}
+        if response.exit_code != 0:
+            result['error'] = str(response.exception or response.output.strip().splitlines()[-1:])
+        results[name] = result
+    return results
+
+def run(runs, startup_runs, scale=1):
+    fixtures, routes = large_fixtures(scale)
+    server = stub.start(fixtures, routes)
+    # src reads ~/.throne/config.yml on import, so HOME has to point at the
+    # benchmark config before the first throne module is loaded
+    home = tempfile.mkdtemp(prefix='throne-bench-')
+    os.environ['HOME'] = home
+    stub.write_config(home)
+    stub.install(server.url)
+    report = {
+        'meta': {
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'runs': runs,
+            'scale': scale,
+        },
+        'parse': run_parse(fixtures, runs),
+        'cli': run_cli(runs),
+        'startup': {name: {'median_ms': median} for name, median in startup.run(startup_runs).items()},
+    }
+    report['meta']['stub_requests'] = server.hits
+    server.shutdown()
+    return report
+
+def compare(report, baseline, tolerance):
+    """
+    Returns (section, name, baseline ms, current ms) for every timing that
+    is slower than the baseline by more than tolerance (a fraction).
+    """
+    regressions = []
+    for section in ('parse', 'cli', 'startup'):
+        for name, result in report.get(section, {}).items():
+            before = baseline.get(section, {}).get(name, {}).get('median_ms')
+            if before and result['median_ms'] > before * (1 + tolerance):
+                regressions.append((section, name, before, result['median_ms']))
+    return regressions
+
+def _print_report(report, baseline):
+    def change(section, name, value):
+        before = (baseline or {}).get(section, {}).get(name, {}).get('median_ms')
+        return f"{(value - before) / before:>+8.1%}" if before else ''
+    print(f"{'parse':<28} {'items':>8} {'ms':>10} {'items/s':>12}")
+    for name, result in report['parse'].items():
+        print(f"{name:<28} {result['items']:>8} {result['median_ms']:>10.3f} {result['items_per_second']:>12,.0f} {change('parse', name, result['median_ms'])}")
+    print(f"\n{'cli':<28} {'ms':>10}")
+    for name, result in report['cli'].items():
+        failed = f"  exit {result['exit_code']}: {result.get('error')}" if result['exit_code'] else ''
+        print(f"{name:<28} {result['median_ms']:>10.2f} {change('cli', name, result['median_ms'])}{failed}")
+    print(f"\n{'startup':<28} {'ms':>10}")
+    for name, result in report['startup'].items():
+        print(f"{name:<28} {result['median_ms']:>10.1f} {change('startup', name, result['median_ms'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--startup-runs', type=int, default=10)
+    parser.add_argument('--scale', type=int, default=1, help='Multiplies the size of the synthetic responses.')
+    parser.add_argument('--output', '-o', metavar='FILE', help='Writes the JSON report to FILE.')
+    parser.add_argument('--baseline', '-b', metavar='FILE', help='Compares against a report from an earlier run.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown against the baseline, as a fraction.')
+    args = parser.parse_args()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report = run(args.runs, args.startup_runs, args.scale)
+    _print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    failed = [name for name, result in report['cli'].items() if result['exit_code']]
+    if failed:
+        print(f"\n{len(failed)} commands failed against the stub: {', '.join(failed)}")
+    regressions = compare(report, baseline, args.tolerance) if baseline else []
+    if regressions:
+        print(f"\n{len(regressions)} timings regressed by more than {args.tolerance:.0%}:")
+        for section, name, before, after in regressions:
+            print(f"  {section}/{name}: {before:.2f} ms -> {after:.2f} ms")
+    if failed or regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+"""
+Measures CLI startup time and fails when `throne --help` exceeds a budget.
+
+Each command is started as a fresh interpreter, the median wall time over
+several runs is reported next to a bare `python -c pass` for reference, and
+`python -X importtime` lists the slowest imports of one run.
+
+    python -m benchmarks.startup --budget-ms 80
+"""
+
+# Import Third Party Modules
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    'python': 'pass',
+    'throne --help': "from bin.throne import cli; cli(['--help'], prog_name='throne')",
+    'throne bgp --help': "from bin.throne import cli; cli(['bgp', '--help'], prog_name='throne')",
+}
+
+def _time(code, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, stdout=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def slowest_imports(code, module='bin.throne', count=10):
+    """
+    Returns (cumulative milliseconds, name) for module and its slowest direct
+    imports as reported by `python -X importtime`.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, capture_output=True, text=True)
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # importtime prints children before their parent
+        if depth == 0 and name.strip() == module:
+            return [(int(cumulative) / 1000, module)] + sorted(children, reverse=True)[:count]
+        if depth == 0:
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+    return []
+
+def run(runs):
+    return {name: _time(code, runs) for name, code in COMMANDS.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--budget-ms', type=float, default=80.0, help='Maximum median time for `throne --help`.')
+    parser.add_argument('--relative', action='store_true', help='Apply the budget to the time on top of a bare interpreter.')
+    args = parser.parse_args()
+    results = run(args.runs)
+    for name, median in results.items():
+        print(f"{name:<20} {median:>7.1f} ms")
+    print("\nImports of `throne --help` (cumulative):")
+    for cumulative, name in slowest_imports(COMMANDS['throne --help']):
+        print(f"{cumulative:>7.1f} ms  {name}")
+    measured = results['throne --help']
+    if args.relative:
+        measured -= results['python']
+    if measured > args.budget_ms:
+        print(f"\n`throne --help` took {measured:.1f} ms, over the {args.budget_ms:.0f} ms budget.")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
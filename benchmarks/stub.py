@@ -0,0 +1,184 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+"""
+A local HTTP server that answers like every upstream throne talks to, from
+the recorded responses in benchmarks/fixtures.
+
+Requests are expected in the form install() rewrites them to, i.e.
+/<upstream host>/<path>?<query>. The fixture is picked by the longest
+matching route prefix, so large synthetic responses can be added under a
+more specific prefix next to the recorded ones.
+
+    python -m benchmarks.stub --port 8080
+    python -m benchmarks.stub bgp lg 1.1.1.1
+"""
+
+# Import Third Party Modules
+import argparse
+import http.server
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Route prefix (host + path + query) -> fixture name
+ROUTES = {
+    'stat.ripe.net/data/prefix-overview/': 'prefix_overview',
+    'stat.ripe.net/data/as-overview/': 'as_overview',
+    'stat.ripe.net/data/looking-glass/': 'looking_glass',
+    'stat.ripe.net/data/announced-prefixes/': 'announced_prefixes',
+    'api.throne.dev/whois/ip': 'whois_ip',
+    'api.throne.dev/whois/asn': 'whois_asn',
+    'api.throne.dev/whois/domain': 'whois_domain',
+    'ip-api.com/json/': 'ip_api',
+    'api.shodan.io/api-info': 'shodan_api_info',
+    'api.shodan.io/dns/resolve': 'shodan_dns_resolve',
+    'api.shodan.io/dns/reverse': 'shodan_dns_reverse',
+    'api.shodan.io/dns/domain/': 'shodan_dns_domain',
+    'api.shodan.io/shodan/host/': 'shodan_host',
+    'www.peeringdb.com/api/org': 'pdb_org',
+    'www.peeringdb.com/api/ix': 'pdb_ix',
+    'www.peeringdb.com/api/fac': 'pdb_fac',
+}
+
+def load_fixture(name):
+    """
+    Returns a recorded response decoded from benchmarks/fixtures.
+    """
+    with open(os.path.join(FIXTURES, f'{name}.json'), 'rb') as f:
+        return json.load(f)
+
+def load_fixtures():
+    return {name: load_fixture(name) for name in set(ROUTES.values())}
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _send(self, status, body):
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.hits += 1
+        route = self.path.lstrip('/')
+        matches = [prefix for prefix in self.server.routes if route.startswith(prefix)]
+        if not matches:
+            self._send(404, b'{"error": "No fixture for this request."}')
+            return
+        self._send(200, self.server.bodies[self.server.routes[max(matches, key=len)]])
+
+    def do_POST(self):
+        # ip-api batch lookups answer every address with the single lookup fixture
+        self.server.hits += 1
+        queries = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        record = self.server.fixtures['ip_api']
+        self._send(200, json.dumps([dict(record, query=query) for query in queries]).encode())
+
+    def log_message(self, *args):
+        pass
+
+def _server(port, fixtures=None, routes=None, latency=0.0):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+    server.daemon_threads = True
+    server.fixtures = dict(load_fixtures(), **(fixtures or {}))
+    server.bodies = {name: json.dumps(body).encode() for name, body in server.fixtures.items()}
+    server.routes = dict(ROUTES, **(routes or {}))
+    server.latency = latency
+    server.hits = 0
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    return server
+
+def start(fixtures=None, routes=None, latency=0.0):
+    """
+    Starts the stub on a free local port in a background thread. fixtures
+    and routes are added to the recorded ones. Pass the server's `url` to
+    install().
+    """
+    server = _server(0, fixtures, routes, latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_config(home):
+    """
+    Writes a config.yml under home with fake API keys and no client-side
+    throttling, and makes it the config throne reads.
+    """
+    from src import config
+    from src.parsers.ratelimit import RATE_LIMITS
+    os.makedirs(os.path.join(home, '.throne'))
+    path = os.path.join(home, '.throne', 'config.yml')
+    settings = {
+        'throne_key': 'Bearer benchmark',
+        'shodan_key': 'benchmark',
+        'rate_limits': {key: None for key in RATE_LIMITS},
+    }
+    # JSON is valid YAML, so the config does not need yaml to be written
+    with open(path, 'w') as f:
+        json.dump(settings, f, indent=2)
+    # src.config may have been imported under the previous HOME
+    config.config_file = path
+    config.reload_config()
+
+class _StubPool():
+    # Wraps the transport's pool manager and sends every request to the stub
+    # instead, e.g. https://stat.ripe.net/data/... ->
+    # http://127.0.0.1:8080/stat.ripe.net/data/... Everything else, such as
+    # the pool settings the transport tunes, is the wrapped manager's.
+    def __init__(self, pool, url):
+        self.pool = pool
+        self.url = url.rstrip('/')
+
+    def urlopen(self, method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        return self.pool.urlopen(method, f"{self.url}/{parts.netloc}{url.split(parts.netloc, 1)[1]}", *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+def install(url):
+    """
+    Points the process-wide throne transport at the stub at url, so every
+    command in this process is answered from the fixtures.
+    """
+    from src.parsers.transport import get_transport
+    transport = get_transport()
+    if not isinstance(transport.pool, _StubPool):
+        transport.pool = _StubPool(transport.pool, url)
+    transport.pool.url = url.rstrip('/')
+    return transport
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated upstream latency in seconds.')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='A throne command to run against the stub instead of serving.')
+    args = parser.parse_args()
+    if not args.command:
+        server = _server(args.port, latency=args.latency)
+        print(f"Serving fixtures on {server.url}")
+        server.serve_forever()
+        return
+    home = tempfile.mkdtemp(prefix='throne-stub-')
+    os.environ['HOME'] = home
+    write_config(home)
+    server = start(latency=args.latency)
+    install(server.url)
+    from bin.throne import cli
+    cli(args.command, prog_name='throne')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+"""
+Measures how lookup throughput of the thread-pool batch mode scales with the
+number of worker threads.
+
+A local HTTP server answers every request after a fixed delay that stands in
+for upstream latency, so the numbers only depend on client-side overhead.
+
+    python -m benchmarks.threads --requests 400 --latency 0.02
+"""
+
+# Import Third Party Modules
+import argparse
+import http.server
+import json
+import socket
+import threading
+import time
+# Import Throne Modules
+from src.parsers import json_request
+from src.parsers.batch import bounded_map
+from src.parsers.response_cache import get_cache
+from src.parsers.transport import get_transport
+
+BODY = json.dumps({'status': 'ok', 'data': {'resource': '192.0.2.0/24', 'asns': [{'asn': 64496}]}}).encode()
+
+def _start_server(latency):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run(requests, latency, thread_counts):
+    server = _start_server(latency)
+    get_cache().enabled = False
+    get_transport().reserve(max(thread_counts))
+    base = f'http://127.0.0.1:{server.server_port}/data/'
+    fetch = lambda n: json_request._JSONRequest().get_json(url=f'{base}{n}')
+    results = []
+    for threads in thread_counts:
+        start = time.perf_counter()
+        errors = sum(1 for _, _, error in bounded_map(fetch, range(requests), workers=threads) if error)
+        elapsed = time.perf_counter() - start
+        results.append({'threads': threads, 'seconds': elapsed, 'requests_per_second': requests / elapsed, 'errors': errors})
+    server.shutdown()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.02, help='Simulated upstream latency in seconds.')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+    results = run(args.requests, args.latency, args.threads)
+    single = results[0]['requests_per_second']
+    print(f"{'threads':>8} {'req/s':>10} {'speedup':>8} {'errors':>7}")
+    for result in results:
+        print(f"{result['threads']:>8} {result['requests_per_second']:>10.1f} {result['requests_per_second'] / single:>7.1f}x {result['errors']:>7}")
+
+if __name__ == '__main__':
+    main()
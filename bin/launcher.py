@@ -0,0 +1,17 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Modules
+import sys
+
+def main():
+    """
+    The `throne` entry point. Hands the command to a running `throne serve`
+    daemon when there is one, and only imports the CLI when there is not.
+    """
+    from src.parsers.daemon_client import forward
+    exit_code = forward(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+    from bin.throne import cli
+    cli(prog_name='throne')
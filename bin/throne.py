@@ -2,14 +2,10 @@
 # SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
 
 # Import Modules
+import importlib
 import logging
+import os
 import click
-from src.bgp import bgp
-from src.peeringdb import pdb
-from src.ip import ip
-from src.shodan import shodan
-from src.whois import whois
-from src.api import api
 
 class Throne:
     def __init__(self):
@@ -17,10 +13,78 @@ class Throne:
 
 pass_throne = click.make_pass_decorator(Throne)
 
-@click.group()
+# Subcommands are only imported when they are invoked. The help text is kept
+# here so `throne --help` does not have to import every module to list them.
+LAZY_COMMANDS = {
+    'api': ('src.api', 'Retrieve API keys from the throne API'),
+    'bgp': ('src.bgp', 'Retrieve BGP related information.'),
+    'cache': ('src.cache', 'Manage the local response cache.'),
+    'ip': ('src.ip', 'Retrieve IP related information.'),
+    'pdb': ('src.peeringdb', 'Retrieve information from PeeringDB.'),
+    'serve': ('src.serve', 'Run a local daemon that answers throne commands.'),
+    'shodan': ('src.shodan', 'Retrieve information from Shodan.'),
+    'whois': ('src.whois', 'Retrieve WHOIS information on domains.'),
+}
+
+class LazyGroup(click.Group):
+    # A click group that imports a subcommand's module on first use.
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(LAZY_COMMANDS))
+
+    def get_command(self, ctx, cmd_name):
+        command = super().get_command(ctx, cmd_name)
+        if command is None and cmd_name in LAZY_COMMANDS:
+            module = importlib.import_module(LAZY_COMMANDS[cmd_name][0])
+            command = getattr(module, cmd_name)
+            self.add_command(command)
+        return command
+
+    def parse_args(self, ctx, args):
+        # The subcommand and its arguments label the --timings report
+        args = list(args)
+        rest = super().parse_args(ctx, args)
+        ctx.meta['throne.command'] = args[len(args) - len(rest) - 1:]
+        return rest
+
+    def format_commands(self, ctx, formatter):
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in self.commands:
+                command = self.commands[name]
+                if command.hidden:
+                    continue
+                rows.append((name, command.get_short_help_str(formatter.width)))
+            else:
+                rows.append((name, LAZY_COMMANDS[name][1]))
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+def _report_timings(ctx, output_format, output):
+    # Collects spans for the rest of the run and reports them when the
+    # command has finished, whether or not it failed
+    from src.parsers.timings import get_timings
+    from src.parsers.transport import rate_limit_stats
+    get_timings().start()
+    command = ' '.join(ctx.meta.get('throne.command', []))
+    def write():
+        if output_format == 'json':
+            report = get_timings().json_lines(command, rate_limit_stats())
+        else:
+            report = get_timings().table(command, rate_limit_stats())
+        click.echo(report, file=output, err=output is None)
+    ctx.call_on_close(write)
+
+@click.group(cls=LazyGroup)
 @click.option("--verbose", "-v", is_flag=True, help="Enables verbose mode.")
+@click.option("--no-cache", is_flag=True, help="Neither reads from nor writes to the response cache.")
+@click.option("--refresh", is_flag=True, help="Ignores cached responses and stores fresh ones.")
+@click.option("--record", metavar="DIR", type=click.Path(file_okay=False), help="Stores every upstream exchange in DIR. Bypasses the response cache.")
+@click.option("--replay", metavar="DIR", type=click.Path(exists=True, file_okay=False), help="Answers every request from the exchanges stored in DIR by --record, without network access.")
+@click.option("--timings", is_flag=True, help="Reports the time spent in each request phase, decoding, parsing and rendering. THRONE_TIMINGS=json (or table) does the same, json writing one span record per line.")
+@click.option("--timings-file", type=click.File('w'), envvar='THRONE_TIMINGS_FILE', help="Writes the --timings report to FILE instead of stderr.", metavar="FILE")
 @click.pass_context
-def cli(ctx, verbose):
+def cli(ctx, verbose, no_cache, refresh, record, replay, timings, timings_file):
     """
     Throne is a command line tool to query various things on the internet.
     """
@@ -28,10 +92,22 @@ def cli(ctx, verbose):
         LOG_FORMAT = ('[%(asctime)s] [%(levelname)s] [%(filename)s:%(lineno)s] '
    '[%(funcName)s()] %(message)s')
         logging.basicConfig(level=logging.DEBUG, format=LOG_FORMAT)
-
-cli.add_command(bgp)
-cli.add_command(pdb)
-cli.add_command(ip)
-cli.add_command(shodan)
-cli.add_command(whois)
-cli.add_command(api)
\ No newline at end of file
+    if no_cache or refresh:
+        from src.parsers.response_cache import get_cache
+        get_cache().enabled = not no_cache
+        get_cache().refresh = refresh
+    if record and replay:
+        raise click.UsageError("--record and --replay cannot be used together.")
+    if record or replay:
+        from src.parsers.recorder import _Recorder
+        from src.parsers.response_cache import get_cache
+        from src.parsers.transport import get_transport
+        # Cached responses would never reach the recorder
+        get_cache().enabled = False
+        get_transport().recorder = _Recorder(record or replay, 'record' if record else 'replay')
+    from src.parsers.daemon_client import TIMINGS_FORMATS, TIMINGS_OFF, timings_setting
+    setting = timings_setting()
+    if setting not in TIMINGS_OFF and setting not in TIMINGS_FORMATS:
+        raise click.UsageError(f"THRONE_TIMINGS must be one of {', '.join(TIMINGS_FORMATS)}, or {', '.join(v for v in TIMINGS_OFF if v)} to turn it off.")
+    if timings or setting in TIMINGS_FORMATS:
+        _report_timings(ctx, TIMINGS_FORMATS.get(setting, 'table'), timings_file)
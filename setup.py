@@ -19,10 +19,10 @@ setup(
     install_requires=[
         'Click',
         'colorama',
-        'requests',
+        'urllib3>=1.26,<2',
         'pyyaml'
     ],
     entry_points={
-        'console_scripts': ['throne=bin.throne:cli']
+        'console_scripts': ['throne=bin.launcher:main']
     }
 )
\ No newline at end of file
@@ -6,9 +6,12 @@ import logging
 import click
 import yaml
 import os
-from requests import request
+import json as jsonlib
 from pathlib import Path
 from getpass import getpass
+# Import Throne Modules
+from src.config import load_config, reload_config
+from src.parsers.transport import get_transport
 
 # Set log variable for verbose output
 log = logging.getLogger(__name__)
@@ -17,12 +20,6 @@ log = logging.getLogger(__name__)
 home = os.environ['HOME']
 config_file = f'{home}/.throne/config.yml'
 
-try:
-    config = yaml.safe_load(open(config_file))
-    throne_apikey = config['throne_key']
-except:
-    pass
-
 # URLS
 THRONE_API = 'https://api.throne.dev/'
 
@@ -65,8 +62,8 @@ def set(username, password, scope):
         else:
             payload = f"username={username}&password={password}&scope={scope}"
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-        response = request("POST", url, headers=headers, data=payload)
-        json = response.json()
+        response = get_transport().request("POST", url, headers=headers, body=payload)
+        json = jsonlib.loads(response.data.decode('utf-8', 'ignore'))
         for k in json.items():
             if "error" in k:
                 click.secho(f"Unable to authenticate. Error: {json['error']} - Reason: {json['error_description']}", fg="red")
@@ -76,6 +73,7 @@ def set(username, password, scope):
                 with open(config_file, 'r+') as throne_config:
                     yaml.safe_dump(throne_username, throne_config)
                     yaml.safe_dump(throne_apikey, throne_config)
+                reload_config()
                 click.secho("Successfully set throne API key.", fg="green")
     except:
         raise
@@ -85,14 +83,11 @@ def get():
     """
     Use this command to get your username to the throne API.
     """
-    try:
-        config = yaml.safe_load(open(config_file))
-        username = config['throne_username']
-        if username != "":
-            print(username)
-        else:
-            print("No username is set.")
-    except FileNotFoundError:
+    if not os.path.exists(config_file):
         print("A config file could not be found. Please run throne api set to create it.")
-    except:
-        raise
\ No newline at end of file
+        return
+    username = load_config().get('throne_username', "")
+    if username != "":
+        print(username)
+    else:
+        print("No username is set.")
\ No newline at end of file
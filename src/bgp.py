@@ -3,34 +3,25 @@
 
 # Import Third Party Modules
 import click
+import itertools
+import json
 import logging
-import os
-import yaml
-from requests import request
+import sys
+import time
 # Import Throne Modules
-from src.parsers import json_request
+from src.client import Client
 from src.parsers import lg_parser
+from src.parsers.as_graph import _ASGraph
+from src.parsers.route_index import build_index, get_route_index
+from src.parsers.batch import read_lines
+from src.parsers.watch import _PrefixWatcher
 from src.exceptions import ThroneLookupFailed
 
 # Set log variable for verbose output
 log = logging.getLogger(__name__)
 
-# Get home directory
-home = os.path.expanduser("~")
-config_file = f'{home}/.throne/config.yml'
-
-try:
-    config = yaml.safe_load(open(config_file))
-    throne_apikey = config['throne_key']
-except:
-    throne_apikey = None
-
 # URLs
-#THRONE_API = "https://api.throne.dev/"
-#THRONE_API = "http://10.0.3.18:8080/"
 BOOTSTRAP_URL = 'https://rdap-bootstrap.arin.net/bootstrap'
-RIPESTAT_ASOverview = 'https://stat.ripe.net/data/as-overview/data.json?resource='
-THRONE_API = 'https://api.throne.dev/'
 
 @click.group()
 def bgp():
@@ -39,121 +30,275 @@ def bgp():
     """
     pass
 
+def _render_asn(info):
+    # Renders an ASNInfo from Client.lookup_asn_many
+    click.secho("---Basic ASN Info--", fg='green')
+    click.echo(f"AS#: {info.asn}\nHolder: {info.holder}\nAnnounced: {info.announced}")
+    click.secho("---AS Block Info---", fg='green')
+    click.echo(f"AS Block: {info.block.resource}\nName: {info.block.name}\nDescription: {info.block.desc}")   
+    try:
+        if info.error is not None:
+            raise info.error
+        rir = info.rir
+        click.secho(f'---{rir}/{info.handle} Contact Information---', fg='green')
+        if "RIPE" in rir:
+            log.debug("Detected RIPE as RIR...all non-abuse contacts are filtered by RIPE. See RIPE database docs for more information.")
+        for ent in info.entities:
+            delimeter = "/"
+            kind = delimeter.join(ent.roles).title()
+            click.secho(f'{ent.name} ({kind}):')
+            email = ent.email if ent.email is not None else "None"
+            address = ent.address if ent.address is not None else "None"
+            phone = ent.phone if ent.phone is not None else "None"
+            click.echo(" Entity Address: " + address + "\n Entity Phone: " + phone + "\n Entity Email: " + email)
+            if "RIPE" in rir:
+                click.secho("\nSome of these details may be filtered by RIPE. To verify this information please visit https://apps.db.ripe.net/db-web-ui/query.", fg='red')
+    except:
+        raise ThroneLookupFailed("Failed to get additional RIR data.")
+
 @bgp.command()
 @click.argument('as_number', nargs=1, metavar="ASNUM")
 def asn(as_number):
     """
     Gets information on the specified AS number.
     """
-    if throne_apikey:
-        url = '{0}{1}'.format(RIPESTAT_ASOverview, as_number)
-        response = json_request._JSONRequest().get_json(url=url)
-        # Take RIPEStat JSON response and put it as the JSON variable
-        json = response
-        asn = json['data']['resource']
-        as_block = json['data']['block']['resource']
-        block_desc = json['data']['block']['desc']
-        block_name = json['data']['block']['name']
-        holder = json['data']['holder']
-        announced = json['data']['announced']
-        click.secho("---Basic ASN Info--", fg='green')
-        click.echo(f"AS#: {asn}\nHolder: {holder}\nAnnounced: {announced}")
-        click.secho("---AS Block Info---", fg='green')
-        click.echo(f"AS Block: {as_block}\nName: {block_name}\nDescription: {block_desc}")   
-        try:
-            url = '{0}whois/asn?query={1}'.format(THRONE_API, as_number)
-            headers = {'Authorization': f'{throne_apikey}'}
-            response = request("GET", url, headers=headers)
-            result = response.json()
-            rir = result['rir']
-            handle = result['handle']
-            click.secho(f'---{rir}/{handle} Contact Information---', fg='green')
-            if "RIPE" in rir:
-                log.debug("Detected RIPE as RIR...all non-abuse contacts are filtered by RIPE. See RIPE database docs for more information.")
-            for ent in result['entities']:
-                name = ent['name']
-                kind = ent['roles']
-                delimeter = "/"
-                kind = delimeter.join(kind).title()
-                click.secho(f'{name} ({kind}):')
-                if ent['email'] is not None:
-                    email = ent['email']
-                else:
-                    email = "None"
-                if ent['address'] is not None:
-                    address = ent['address']
-                else:
-                    address = "None"
-                if ent['phone'] is not None:
-                    phone = ent['phone']
-                else:
-                    phone = "None"
-                if "RIPE" in rir:
-                    click.echo(" Entity Address: " + address + "\n Entity Phone: " + phone + "\n Entity Email: " + email)
-                    click.secho("\nSome of these details may be filtered by RIPE. To verify this information please visit https://apps.db.ripe.net/db-web-ui/query.", fg='red')
-                else:
-                    click.echo(" Entity Address: " + address + "\n Entity Phone: " + phone + "\n Entity Email: " + email)
-        except:
-            raise ThroneLookupFailed("Failed to get additional RIR data.")
-    if throne_apikey is None:
+    client = Client()
+    if client.throne_key:
+        for info in client.lookup_asn_many([as_number]):
+            _render_asn(info)
+    else:
         click.secho("throne API key required! Run `throne api set` to configure your API key.", fg="red")
         click.secho("If you do not have an account, please register for one by visting https://api.throne.dev/auth/login and click 'Sign Up' at the bottom of the prompt", fg="red")
 
 @bgp.command()
+@click.option('--offline', '-o', is_flag=True, help="Answers from the local route index built by `throne bgp index build`.")
 @click.argument('prefix', nargs=1, metavar="ADDRESS_OR_PREFIX")
-def prefix(prefix):
+def prefix(prefix, offline):
     """
     Gets prefix information for specified prefix or ip address.
     """
-    url = f"https://stat.ripe.net/data/prefix-overview/data.json?resource={prefix}"
-    response = request("GET", url)
-    if response.status_code == 200:
-        json = response.json()
-        prefix = json['data']['resource']
-        asn_int = json['data']['asns'][0]['asn']
-        asn = asn_int
-        holder = json['data']['asns'][0]['holder']
-        ip_block = json['data']['block']['resource']
-        block_desc = json['data']['block']['desc']
-        block_name = json['data']['block']['name']
-        click.echo(f"Prefix: {prefix} \n Announced By: {asn} \n Holder: {holder}")
-        click.echo("---")
-        click.echo(f"IP Block: {ip_block} \n Name: {block_name} \n Description: {block_desc}")
+    if offline:
+        match = get_route_index().lookup(prefix)
+        if match is None:
+            click.secho(f"{prefix} is not covered by any prefix in the local route index.", fg="red")
+        else:
+            click.echo(f"Prefix: {match[0]} \n Announced By: {match[1]}")
+        return
+    info = Client().lookup_prefix(prefix)
+    origin = info.asns[0]
+    click.echo(f"Prefix: {info.prefix} \n Announced By: {origin.asn} \n Holder: {origin.holder}")
+    click.echo("---")
+    click.echo(f"IP Block: {info.block.resource} \n Name: {info.block.name} \n Description: {info.block.desc}")
+
+def _as_label(as_number):
+    return f"AS{as_number.strip().upper().lstrip('AS')}"
+
+def _render_prefix_set(title, prefix_set, count_addresses):
+    click.secho(f"---{title}---", fg='green')
+    if len(prefix_set):
+        click.echo('\n'.join(prefix_set.prefixes()))
+    click.echo(f"Prefixes: {len(prefix_set)}")
+    if count_addresses:
+        addresses = prefix_set.addresses()
+        click.echo(f"IPv4 Addresses: {addresses[4]}\nIPv6 Addresses: {addresses[6]}")
+
+@bgp.command()
+@click.option('--aggregate', '-a', is_flag=True, help="Collapses the prefixes into the fewest prefixes covering the same addresses.")
+@click.option('--count-addresses', '-c', is_flag=True, help="Shows how many addresses the prefixes cover, overlaps counted once.")
+@click.option(
+    '--set', 'operation', type=click.Choice(['union', 'intersection', 'difference']), default=None,
+    help="Combines the address space of every ASNUM: all of it, the part all of them announce, or the part the first announces and none of the others do."
+)
+@click.option('--threads', '-t', '--concurrency', 'threads', default=4, show_default=True, help="Number of AS numbers fetched at once.", metavar="NUMBER")
+@click.argument('as_numbers', nargs=-1, required=True, metavar="ASNUM...")
+def prefixes(as_numbers, aggregate, count_addresses, operation, threads):
+    """
+    Lists the prefixes announced by one or more AS numbers.\n
+    Prefixes are kept as packed integers, so the address space of large
+    transit networks can be aggregated and compared across many AS numbers
+    cheaply. --set results are always aggregated.
+    """
+    labels = list(dict.fromkeys(_as_label(as_number) for as_number in as_numbers))
+    if operation is not None and len(labels) < 2:
+        raise click.UsageError("--set needs at least two AS numbers.")
+    announced = {}
+    for label, prefix_set, error in Client().announced_prefixes_many(labels, workers=threads):
+        if error is not None:
+            if operation is not None:
+                raise ThroneLookupFailed(f"Failed to get the prefixes announced by {label}: {error}")
+            click.secho(f"Failed to get the prefixes announced by {label}: {error}", fg='red')
+            continue
+        announced[label] = prefix_set
+    if operation is None:
+        for label in labels:
+            if label in announced:
+                prefix_set = announced[label].aggregate() if aggregate else announced[label]
+                _render_prefix_set(f"{label} Announced Prefixes", prefix_set, count_addresses)
+        return
+    result = announced[labels[0]]
+    for label in labels[1:]:
+        result = getattr(result, operation)(announced[label])
+    _render_prefix_set(f"{operation.title()} of {', '.join(labels)}", result, count_addresses)
+
+@bgp.command()
+@click.option('--input', '-i', 'input_file', type=click.File('r'), default=None, help="Reads prefixes and addresses line by line from FILE ('-' for stdin).", metavar="FILE")
+@click.option('--interval', default=300.0, show_default=True, help="Seconds between polls of each covering route.", metavar="SECONDS")
+@click.option('--threads', '-t', '--concurrency', '-c', 'threads', default=4, show_default=True, help="Number of polls running at once.", metavar="NUMBER")
+@click.option('--resolve-every', default=10, show_default=True, help="Re-check which route covers each target every NUMBER intervals.", metavar="NUMBER")
+@click.option('--duration', default=None, type=float, help="Stops after SECONDS instead of running until interrupted.", metavar="SECONDS")
+@click.argument('targets', nargs=-1, metavar="[ADDRESS_OR_PREFIX]...")
+def watch(targets, input_file, interval, threads, resolve_every, duration):
+    """
+    Watches prefixes and prints routing changes as NDJSON events.\n
+    Targets covered by the same announced route are polled once. Polls are
+    spread evenly over the interval. Events: origin_change, collector_added,
+    collector_withdrawn, path_change, community_change, covering_change and
+    error.
+    """
+    if input_file is not None:
+        targets = list(targets) + list(read_lines(input_file))
+    if not targets:
+        raise click.UsageError("Provide at least one ADDRESS_OR_PREFIX or use --input FILE.")
+    watcher = _PrefixWatcher(targets, interval, click.echo, workers=threads, resolve_every=resolve_every)
+    try:
+        watcher.run(duration)
+    except KeyboardInterrupt:
+        log.debug("Watch interrupted")
+
+@bgp.group()
+def index():
+    """
+    Manage the local route index used by --offline lookups.
+    """
+    pass
+
+@index.command()
+@click.argument('dumps', nargs=-1, required=True, metavar="FILE...")
+def build(dumps):
+    """
+    Builds the local route index from routing table dumps.\n
+    Accepts `prefix origin_as` text dumps (RIS/RouteViews style, optionally
+    gzipped) and `bgpdump -m` output of MRT RIB files. Use - for stdin.
+    """
+    summary = build_index(dumps)
+    click.secho("---Route Index Built---", fg="green")
+    for family in ('v4', 'v6'):
+        click.echo(f"IP{family}: {summary[family]['prefixes']} prefixes in {summary[family]['ranges']} ranges")
+    if summary['skipped']:
+        click.secho(f"Skipped {summary['skipped']} unparseable lines.", fg="red")
+
+@index.command()
+def info():
+    """
+    Shows what the local route index contains.
+    """
+    summary = get_route_index().info()
+    click.secho("---Route Index---", fg="green")
+    click.echo(f"Built: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(summary['built']))}")
+    for family in ('v4', 'v6'):
+        click.echo(f"IP{family}: {summary[family]['prefixes']} prefixes in {summary[family]['ranges']} ranges")
+
+def _path_targets(targets, input_file):
+    # Yields each target from the arguments and input file once, in order
+    seen = set()
+    for target in itertools.chain(targets, read_lines(input_file) if input_file else ()):
+        if target not in seen:
+            seen.add(target)
+            yield target
+
+def _render_paths(record):
+    click.secho(f"---{record['query']} AS Paths---", fg='green')
+    click.echo(f"Routes: {record['routes']}\nOrigin ASes: {', '.join(map(str, record['origins'])) or 'None'}")
+    upstreams = ', '.join(f"{upstream['asn']} ({upstream['paths']} paths)" for upstream in record['upstreams'])
+    click.echo(f"Upstreams: {upstreams or 'None'}")
+    lengths = ', '.join(f"{length} ASes: {count}" for length, count in record['path_lengths'].items())
+    click.echo(f"Path Lengths: {lengths or 'None'}\nMean Path Length: {record['mean_path_length']}")
+    prepending = ', '.join(f"{seen['asn']} x{seen['times']} ({seen['paths']} paths)" for seen in record['prepending'])
+    click.echo(f"Prepending: {prepending or 'None'}")
+    click.echo(f"Transit ASes: {', '.join(map(str, record['transit'])) or 'None'}")
+
+def _render_paths_summary(summary):
+    click.secho(f"---All {summary['prefixes']} Prefixes---", fg='green')
+    click.echo(f"Routes: {summary['routes']}\nASes: {summary['ases']}\nAdjacencies: {summary['adjacencies']}")
+    for origin, upstreams in summary['upstreams'].items():
+        click.echo(f"Upstreams of {origin}: {', '.join(str(upstream['asn']) for upstream in upstreams) or 'None'}")
+    click.echo(f"Transit ASes: {', '.join(map(str, summary['transit'])) or 'None'}")
+
+@bgp.command()
+@click.option('--input', '-i', 'input_file', type=click.File('r'), default=None, help="Reads prefixes and addresses line by line from FILE ('-' for stdin).", metavar="FILE")
+@click.option('--format', '-f', 'output_format', type=click.Choice(['text', 'ndjson']), default=None, help="Output format. Defaults to text for one prefix and NDJSON otherwise.")
+@click.option('--threads', '-t', '--concurrency', '-c', 'threads', default=8, show_default=True, help="Number of looking-glass lookups running at once.", metavar="NUMBER")
+@click.argument('targets', nargs=-1, metavar="[ADDRESS_OR_PREFIX]...")
+def paths(targets, input_file, output_format, threads):
+    """
+    Analyses the AS paths every RIS peer has for prefixes.\n
+    Reports the origins, their upstreams, path lengths with prepends
+    removed, prepending and the transit ASes of each prefix as soon as its
+    looking-glass data arrives. With several prefixes a summary over all of
+    their paths follows.
+    """
+    if not targets and input_file is None:
+        if sys.stdin.isatty():
+            raise click.UsageError("Provide at least one ADDRESS_OR_PREFIX or use --input FILE.")
+        input_file = click.get_text_stream('stdin')
+    if output_format is None:
+        output_format = 'text' if len(targets) == 1 and input_file is None else 'ndjson'
+    graph = _ASGraph()
+    for query, routes, error in Client().lg_many(_path_targets(targets, input_file), workers=threads):
+        if error is not None:
+            record = {'query': query, 'error': str(error)}
+        else:
+            record = graph.add(query, routes)
+        if output_format == 'ndjson':
+            click.echo(json.dumps(record))
+        elif error is not None:
+            click.secho(f"Failed to get the looking-glass data for {query}: {error}", fg='red')
+        else:
+            _render_paths(record)
+    if graph.prefixes > 1:
+        summary = graph.summary()
+        if output_format == 'ndjson':
+            click.echo(json.dumps({'summary': summary}))
+        else:
+            _render_paths_summary(summary)
+
+def _render_lg_peer(routes, index, location):
+    route = routes.peer(index)
+    click.echo(f"Location: {location}\nPrefix: {route['prefix']}\nOrigin: {route['origin']}\nOrigin AS: {route['origin_as']}")
+    click.echo(f"Peer: {route['peer']}\nNext Hop: {route['next_hop']}\nAS Path: {route['as_path']}\nBGP Communities: {route['community']}")
+    click.echo(f"Last Updated: {route['last_updated']}\nLast Poll (This Router): {route['latest_time']}")
 
 @bgp.command()
 @click.argument('address', nargs=1, metavar="ADDRESS_OR_PREFIX")
-@click.option('--all', '-a', is_flag=True)
+@click.option('--all', '-a', is_flag=True, help="Shows every RIS collector.")
+@click.option('--peers', '-p', is_flag=True, help="Shows the route of every peer instead of the first one.")
 @click.option('--raw', '-r', is_flag=True)
 @click.option(
     '--location',
-    type=click.Choice(['US-NY', 'US-FL', 'US-CA', 'UK', 'NL', 'SG', 'DE', 'ZA', 'JP'], case_sensitive=False),
-    help="Looking Glass Location",
+    help=f"Looking Glass Location: {', '.join(lg_parser.LOCATION_CODES)}, an RRC id such as RRC00, or part of a collector location.",
     default='US-NY',
     show_default='US-NY'
 )
-def lg(address, location, all, raw):
+def lg(address, location, all, peers, raw):
     """
     BGP looking glass information based upon provided address or prefix
     """
-    url = f"https://stat.ripe.net/data/looking-glass/data.json?resource={address}"
-    response = json_request._JSONRequest().get_json(url=url)
-    parse_json = lg_parser._LGParse(response)
-    parse_json.parse()
-    results = parse_json.vars
+    routes = Client().lg(address)
+    results = routes.vars
     if raw:
-        click.echo(results)
+        click.echo(routes.to_dict())
     click.secho(f"---{address} Looking Glass Results---", fg="yellow")
     click.echo(f"Status: {results['query_info']['status']}\nCached: {results['cached']}\nResults Returned: {results['query_info']['time']}")
-    if all:
-        for entries in results['data']:
-            click.secho(f"--{entries} Results--", fg="yellow")
-            click.echo(f"Location: {results['data'][entries]['location']}\nPrefix: {results['data'][entries]['prefix']}\nOrigin: {results['data'][entries]['origin']}\nOrigin AS: {results['data'][entries]['origin_as']}")
-            click.echo(f"Peer: {results['data'][entries]['peer']}\nNext Hop: {results['data'][entries]['next_hop']}\nAS Path: {results['data'][entries]['as_path']}\nBGP Communities: {results['data'][entries]['communities']}")
-            click.echo(f"Last Updated: {results['data'][entries]['last_updated']}\nLast Poll (This Router): {results['data'][entries]['latest_poll']}")
-    else:
-        for entries in results['data']:
-            if location == entries:
-                click.secho(f"--{location} Results--", fg="yellow")
-                click.echo(f"Location: {results['data'][location]['location']}\nPrefix: {results['data'][location]['prefix']}\nOrigin: {results['data'][location]['origin']}\nOrigin AS: {results['data'][location]['origin_as']}")
-                click.echo(f"Peer: {results['data'][location]['peer']}\nNext Hop: {results['data'][location]['next_hop']}\nAS Path: {results['data'][location]['as_path']}\nBGP Communities: {results['data'][location]['communities']}")
-                click.echo(f"Last Updated: {results['data'][location]['last_updated']}\nLast Poll (This Router): {results['data'][location]['latest_poll']}")
+    collectors = routes.view(None if all else location)
+    if not collectors:
+        click.secho(f"No RIS collector matches {location}.", fg="red")
+    for rrc, name, indexes in collectors:
+        click.secho(f"--{rrc} ({name}) Results--", fg="yellow")
+        if not indexes:
+            click.secho("This collector has no route for the query.", fg="red")
+            continue
+        origins = sorted(set(routes.origin_as[i] for i in indexes))
+        click.echo(f"Seen By: {len(indexes)} peers\nOrigin ASes: {', '.join(map(str, origins))}")
+        for index in (indexes if peers else indexes[:1]):
+            click.echo("---")
+            _render_lg_peer(routes, index, name)
@@ -0,0 +1,47 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import logging
+import click
+# Import Throne Modules
+from src.parsers.response_cache import get_cache
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+@click.group()
+def cache():
+    """
+    Manage the local response cache.
+    """
+    pass
+
+@cache.command()
+def stats():
+    """
+    Shows what is stored in the response cache.
+    """
+    result = get_cache().stats()
+    click.secho("---Response Cache---", fg="green")
+    click.echo(f"Location: {result['path']}\nSize: {result['size'] / 1024 / 1024:.2f} MB\nEntries: {result['entries']}\nExpired: {result['expired']}\nAddress Ranges: {result['ranges']} | Expired: {result['expired_ranges']}")
+    if result['endpoints']:
+        click.secho("---Entries By Endpoint---", fg="green")
+    for endpoint, entries, expired, size in result['endpoints']:
+        click.echo(f"{endpoint}\n Entries: {entries} | Expired: {expired} | Stored: {size / 1024:.1f} KB")
+
+@cache.command()
+def clear():
+    """
+    Removes every entry from the response cache.
+    """
+    count = get_cache().clear()
+    click.secho(f"Removed {count} cached responses.", fg="green")
+
+@cache.command()
+def prune():
+    """
+    Removes expired entries from the response cache.
+    """
+    count = get_cache().prune()
+    click.secho(f"Removed {count} expired responses.", fg="green")
@@ -0,0 +1,348 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+"""
+Library interface to the lookups behind the throne commands.
+
+    from src.client import Client
+    client = Client()
+    info = client.lookup_ip('1.1.1.1')
+    print(info.prefix, [origin.asn for origin in info.asns])
+
+Every method returns plain result objects (named tuples, see to_dict) and
+never prints. All clients in a process share one set of pooled connections,
+the rate limiter and the response cache, so a long-lived client pays for
+connection setup once.
+"""
+
+# Import Third Party Modules
+import asyncio
+import json
+import logging
+import time
+from collections import namedtuple
+# Import Throne Modules
+from src.config import load_config
+from src.exceptions import ThroneConfigError, ThroneFormattingError
+from src.parsers import json_request
+from src.parsers.batch import bounded_map
+from src.parsers.lg_parser import _LGParse
+from src.parsers.pdb_mirror import _PDBMirror
+from src.parsers.prefix_set import _PrefixSet
+from src.parsers.response_cache import get_cache
+from src.parsers.route_index import FAMILIES, parse_address, parse_prefix
+from src.parsers.transport import get_transport
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# URLs
+THRONE_API = 'https://api.throne.dev/'
+RIPESTAT_API = 'https://stat.ripe.net/data/'
+PEERINGDB_API = 'https://www.peeringdb.com/api/'
+
+# Result types
+Block = namedtuple('Block', ['resource', 'name', 'desc'])
+Origin = namedtuple('Origin', ['asn', 'holder'])
+Entity = namedtuple('Entity', ['name', 'roles', 'address', 'phone', 'email'])
+PrefixInfo = namedtuple('PrefixInfo', ['query', 'prefix', 'announced', 'asns', 'block'])
+IPInfo = namedtuple('IPInfo', [
+    'query', 'rir', 'name', 'version', 'start_address', 'end_address',
+    'prefix', 'announced', 'asns', 'block', 'entities',
+])
+# `error` holds the exception of a failed registry (whois) lookup; the
+# RIPEstat fields are still filled in then
+ASNInfo = namedtuple('ASNInfo', ['asn', 'holder', 'announced', 'block', 'rir', 'handle', 'entities', 'error'])
+DomainWhois = namedtuple('DomainWhois', [
+    'domain', 'status', 'nameservers', 'dnssec', 'registrar', 'contacts', 'registration',
+])
+
+def to_dict(result):
+    """
+    Converts a result, or a list of them, to plain dicts and lists, e.g. for
+    json.dumps. Exceptions become their message, and parsed looking-glass
+    routes (see lg) their own to_dict().
+    """
+    if isinstance(result, tuple) and hasattr(result, '_asdict'):
+        return {k: to_dict(v) for k, v in result._asdict().items()}
+    if hasattr(result, 'to_dict'):
+        return result.to_dict()
+    if isinstance(result, (list, tuple)):
+        return [to_dict(v) for v in result]
+    if isinstance(result, dict):
+        return {k: to_dict(v) for k, v in result.items()}
+    if isinstance(result, Exception):
+        return str(result)
+    return result
+
+def _block(block):
+    block = block or {}
+    return Block(block.get('resource'), block.get('name'), block.get('desc'))
+
+def _entities(entities):
+    return [
+        Entity(entity.get('name'), entity.get('roles'), entity.get('address'), entity.get('phone'), entity.get('email'))
+        for entity in entities or []
+    ]
+
+def _span(query):
+    # (family, first, last) addresses of an address or prefix, or None for
+    # anything else (e.g. a hostname), which then skips the range cache
+    try:
+        family, network, length = parse_prefix(query)
+    except ThroneFormattingError:
+        return None
+    return family, network, network | ((1 << (FAMILIES[family][1] - length)) - 1)
+
+def _whois_range(whois):
+    # The registry allocation a whois/ip response answers for
+    try:
+        family, first = parse_address(whois.get('startAddress') or '')
+        _, last = parse_address(whois.get('endAddress') or '')
+    except ThroneFormattingError:
+        return None
+    return family, first, last
+
+def _overview_range(overview):
+    # The announced prefix a prefix-overview response answers for
+    data = overview.get('data') or {}
+    return _span(data.get('resource') or '') if data.get('announced') else None
+
+def _prefix_info(query, overview):
+    data = overview['data']
+    return PrefixInfo(
+        query=query,
+        prefix=data['resource'],
+        announced=data.get('announced'),
+        asns=[Origin(asn['asn'], asn.get('holder')) for asn in data.get('asns') or []],
+        block=_block(data.get('block')),
+    )
+
+class Client():
+    # This class is the library entry point. throne_key defaults to the key
+    # in ~/.throne/config.yml; pdb_live skips the local PeeringDB mirror.
+    def __init__(self, throne_key=None, pdb_live=False, workers=8):
+        self.throne_key = throne_key or load_config().get('throne_key')
+        self.pdb_live = pdb_live
+        self.workers = workers
+        self.json = json_request._JSONRequest()
+        self._pdb_mirror = None
+
+    def _throne_headers(self):
+        if not self.throne_key:
+            raise ThroneConfigError("throne API key required! Run `throne api set` to configure your API key.")
+        return {'Authorization': f'{self.throne_key}'}
+
+    def _gather(self, urls, return_exceptions=False):
+        # A fresh AsyncJSONRequest per call, its semaphore belongs to one event loop
+        return asyncio.run(json_request.AsyncJSONRequest().gather_json(urls, return_exceptions=return_exceptions))
+
+    def _many(self, method, items, workers):
+        # Yields (item, result, error) as lookups complete, see bounded_map
+        workers = workers or self.workers
+        get_transport().reserve(workers)
+        return bounded_map(method, items, workers=workers)
+
+    def _cached_range(self, url, query):
+        # A stored response for a range covering query, see set_range
+        span = _span(query)
+        data = get_cache().get_range(url, *span) if span else None
+        return json.loads(data) if data is not None else None
+
+    def _fetch(self, query, requests):
+        """
+        Returns the responses to requests, a list of (url, headers,
+        range_of) for one address or prefix, fetching the ones not answered
+        by a cached response for a range covering query concurrently.
+        range_of returns the (family, first, last) addresses a response
+        answers for; requests without one never use the range cache.
+        """
+        responses = [self._cached_range(url, query) if range_of else None for url, _, range_of in requests]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if missing:
+            fetched = self._gather([(requests[i][0], requests[i][1]) for i in missing])
+            for i, response in zip(missing, fetched):
+                url, _, range_of = requests[i]
+                responses[i] = response
+                covered = range_of(response) if range_of else None
+                if covered:
+                    get_cache().set_range(url, *covered, json.dumps(response).encode('utf-8'))
+        return responses
+
+    def _overview_request(self, query):
+        url = f'{RIPESTAT_API}prefix-overview/data.json?resource={query}'
+        # RIPEstat describes a queried prefix itself, not the most specific
+        # route covering it, so only address queries use the range cache
+        return url, None, None if '/' in query else _overview_range
+
+    def lookup_prefix(self, prefix):
+        """
+        Returns the RIPEstat prefix overview of an address or prefix.
+        Addresses inside an announced prefix looked up before are answered
+        from the response cache.
+        """
+        overview, = self._fetch(prefix, [self._overview_request(prefix)])
+        return _prefix_info(prefix, overview)
+
+    def whois_ip(self, address):
+        """
+        Returns the throne API whois record of an address or prefix as
+        returned upstream. Addresses inside an allocation looked up before
+        are answered from the response cache.
+        """
+        url = f'{THRONE_API}whois/ip?query={address}'
+        whois, = self._fetch(address, [(url, self._throne_headers(), _whois_range)])
+        return whois
+
+    def lookup_ip(self, address):
+        """
+        Returns the registry record of an address or prefix together with
+        the route covering it. The two lookups run concurrently, each unless
+        a cached allocation or announced prefix already covers the address.
+        """
+        whois_request = (f'{THRONE_API}whois/ip?query={address}', self._throne_headers(), _whois_range)
+        whois, overview = self._fetch(address, [whois_request, self._overview_request(address)])
+        prefix = _prefix_info(address, overview)
+        return IPInfo(
+            query=address,
+            rir=whois['rir'],
+            name=whois['name'],
+            version=whois['ipVersion'],
+            start_address=whois['startAddress'],
+            end_address=whois['endAddress'],
+            prefix=prefix.prefix,
+            announced=prefix.announced,
+            asns=prefix.asns,
+            block=prefix.block,
+            entities=_entities(whois['entities']),
+        )
+
+    def lookup_asn_many(self, as_numbers):
+        """
+        Returns an ASNInfo per AS number, in order, with every RIPEstat and
+        registry lookup running concurrently. A failed RIPEstat lookup is
+        raised, a failed registry lookup is kept in the result's `error`.
+        """
+        headers = self._throne_headers()
+        urls = []
+        for as_number in as_numbers:
+            urls.append(f'{RIPESTAT_API}as-overview/data.json?resource={as_number}')
+            urls.append((f'{THRONE_API}whois/asn?query={as_number}', headers))
+        results = self._gather(urls, return_exceptions=True)
+        infos = []
+        for overview, whois in zip(results[0::2], results[1::2]):
+            if isinstance(overview, Exception):
+                raise overview
+            error = whois if isinstance(whois, Exception) else None
+            whois = {} if error is not None else whois
+            data = overview['data']
+            infos.append(ASNInfo(
+                asn=data['resource'],
+                holder=data['holder'],
+                announced=data['announced'],
+                block=_block(data['block']),
+                rir=whois.get('rir'),
+                handle=whois.get('handle'),
+                entities=_entities(whois.get('entities')),
+                error=error,
+            ))
+        return infos
+
+    def lookup_asn(self, as_number):
+        return self.lookup_asn_many([as_number])[0]
+
+    def announced_prefixes(self, as_number):
+        """
+        Returns the prefixes RIPEstat saw an AS number announce as a
+        _PrefixSet. The response is streamed and only the prefixes kept, so
+        the largest transit networks fit in a few hundred kilobytes.
+        """
+        url = f'{RIPESTAT_API}announced-prefixes/data.json?resource={as_number}'
+        return _PrefixSet(item['prefix'] for item in self.json.iter_json(url=url, path=('data', 'prefixes')))
+
+    def lg(self, address):
+        """
+        Returns the RIS looking-glass routes for an address or prefix as a
+        parsed _LGParse; use its view() and peer() to select routes.
+        """
+        response = self.json.get_json(url=f'{RIPESTAT_API}looking-glass/data.json?resource={address}')
+        return _LGParse(response).parse()
+
+    def pdb_mirror(self):
+        """
+        Returns the local PeeringDB mirror, or None when it is missing or
+        the client was created with pdb_live.
+        """
+        if self.pdb_live:
+            return None
+        if self._pdb_mirror is None:
+            mirror = _PDBMirror()
+            if not mirror.exists():
+                return None
+            log.debug(f"Answering from the PeeringDB mirror last synced {time.ctime(mirror.last_sync('net'))}")
+            self._pdb_mirror = mirror
+        return self._pdb_mirror
+
+    def pdb_org(self, as_number):
+        """
+        Returns the PeeringDB organisation records of an AS number.
+        """
+        mirror = self.pdb_mirror()
+        if mirror is not None:
+            return mirror.org_by_asn(as_number)
+        return self.json.get_json(url=f'{PEERINGDB_API}org?asn={as_number}')['data']
+
+    def _pdb_search(self, obj, name, count):
+        mirror = self.pdb_mirror()
+        if mirror is not None:
+            return mirror.search(obj, name, count)
+        return self.json.get_json(url=f'{PEERINGDB_API}{obj}?name_search={name}&limit={count}')['data']
+
+    def pdb_ix(self, name, count=3):
+        """
+        Returns up to count PeeringDB exchange records matching name.
+        """
+        return self._pdb_search('ix', name, count)
+
+    def pdb_fac(self, name, count=3):
+        """
+        Returns up to count PeeringDB facility records matching name.
+        """
+        return self._pdb_search('fac', name, count)
+
+    def whois_domain(self, domain):
+        """
+        Returns the WHOIS record of a domain. Contacts are grouped by role
+        (registrant, admin, tech, ...) as returned by the throne API.
+        """
+        result = self.json.get_json(url=f'{THRONE_API}whois/domain?query={domain}', headers=self._throne_headers())
+        whois = result.get('whois') or {}
+        return DomainWhois(
+            domain=result['domain'],
+            status=result.get('status') or [],
+            nameservers=whois.get('nameservers') or [],
+            dnssec=whois.get('dnssec') or [],
+            registrar=result.get('registrar') or {},
+            contacts=whois.get('contact_info') or {},
+            registration=whois.get('registration_info') or {},
+        )
+
+    def lookup_ip_many(self, addresses, workers=None):
+        """
+        Looks up addresses on worker threads and yields (address, IPInfo,
+        error) as they complete. addresses may be any iterable, it is
+        consumed lazily.
+        """
+        return self._many(self.lookup_ip, addresses, workers)
+
+    def lookup_prefix_many(self, prefixes, workers=None):
+        return self._many(self.lookup_prefix, prefixes, workers)
+
+    def announced_prefixes_many(self, as_numbers, workers=None):
+        return self._many(self.announced_prefixes, as_numbers, workers)
+
+    def lg_many(self, addresses, workers=None):
+        return self._many(self.lg, addresses, workers)
+
+    def whois_domain_many(self, domains, workers=None):
+        return self._many(self.whois_domain, domains, workers)
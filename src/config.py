@@ -0,0 +1,46 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import logging
+import os
+# Import Throne Modules
+from src.exceptions import ThroneConfigError
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Get home directory
+home = os.path.expanduser("~")
+config_file = f'{home}/.throne/config.yml'
+
+_config = None
+
+def load_config():
+    """
+    Returns the parsed ~/.throne/config.yml. The file is read once per
+    process; a missing or empty file is an empty config.
+    """
+    global _config
+    if _config is None:
+        # yaml is only imported by commands that actually need the config
+        import yaml
+        try:
+            with open(config_file) as f:
+                _config = yaml.safe_load(f) or {}
+        except FileNotFoundError:
+            _config = {}
+        except yaml.YAMLError as e:
+            raise ThroneConfigError(f"Unable to parse {config_file}: {e}")
+        if not isinstance(_config, dict):
+            raise ThroneConfigError(f"{config_file} must contain a mapping of settings.")
+        log.debug(f"Loaded config from {config_file}")
+    return _config
+
+def reload_config():
+    """
+    Forgets the cached config, e.g. after a command wrote a new API key.
+    """
+    global _config
+    _config = None
+    return load_config()
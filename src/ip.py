@@ -2,32 +2,31 @@
 # SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
 
 # Import Third Party Modules
+import csv
+import io
+import itertools
 import logging
+import sys
+import time
 import click
-import os
-import yaml
-from requests import request
+import json
 # Import Throne Modules
-from src.bgp import asn as get_asn
+from src.bgp import _render_asn
+from src.client import Client, to_dict
+from src.parsers import json_request
+from src.exceptions import ThroneConfigError, ThroneFormattingError
+from src.parsers.batch import bounded_map, read_lines
+from src.parsers.transport import get_transport
+from src.parsers.route_index import get_route_index
+from src.parsers.sweep import _Sweep
+from src.parsers.geo_index import build_geo_index, get_geo_index
 
 # Set log variable for verbose output
 log = logging.getLogger(__name__)
 
-# Get home directory
-home = os.environ['HOME']
-config_file = f'{home}/.throne/config.yml'
-
-try:
-    config = yaml.safe_load(open(config_file))
-    throne_apikey = config['throne_key']
-except:
-    throne_apikey = None
-
 # ARIN BOOTSTRAP URL
 BOOTSTRAP_URL = 'https://rdap-bootstrap.arin.net/bootstrap'
 RIPENETINFO_URL = 'https://stat.ripe.net/data/network-info/data.json?resource='
-RIPEPREFIXOVER_URL = 'https://stat.ripe.net/data/prefix-overview/data.json?resource='
-THRONE_API = 'https://api.throne.dev/'
 
 @click.group()
 def ip():
@@ -43,95 +42,282 @@ def raw(address):
     This command prints raw JSON information for IP addresses. \n
     This raw output does NOT contain BGP related information.
     """
-    throne_url = '{0}whois/ip?query={1}'.format(THRONE_API, address)
-    throne_headers = {'Authorization': f'{throne_apikey}'}
-    throne_response = request("GET", throne_url, headers=throne_headers)
-    throne_result = throne_response.json()
+    throne_result = Client().whois_ip(address)
     print(throne_result)
 
+# ip-api batch endpoint; at most GEO_BATCH_SIZE addresses per request
+GEO_BATCH_URL = 'http://ip-api.com/batch?fields=status,message,query,countryCode,region,city,lat,lon,timezone,isp,org,as'
+GEO_BATCH_SIZE = 100
+GEO_FIELDS = ('query', 'status', 'message', 'countryCode', 'region', 'city', 'lat', 'lon', 'timezone', 'isp', 'org', 'as')
+
+def _geo_addresses(addresses, input_file):
+    # Yields each address from the arguments and input file once, in order
+    seen = set()
+    for address in itertools.chain(addresses, read_lines(input_file) if input_file else ()):
+        if address not in seen:
+            seen.add(address)
+            yield address
+
+def _geo_chunks(addresses):
+    # Groups addresses into batch-sized lists, passing prefixes through alone
+    chunk = []
+    for address in addresses:
+        if "/" in address:
+            yield [address]
+            continue
+        chunk.append(address)
+        if len(chunk) == GEO_BATCH_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _geo_batch(chunk):
+    if "/" in chunk[0]:
+        return [{'query': chunk[0], 'status': 'fail', 'message': 'prefix, not an address'}]
+    return json_request._JSONRequest().post_json(GEO_BATCH_URL, chunk)
+
+def _geo_writer(output_format):
+    # Returns a function that writes one geolocation record as CSV or NDJSON
+    if output_format == 'ndjson':
+        return lambda record: click.echo(json.dumps(record))
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=GEO_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+
+    def write(record):
+        writer.writerow(record)
+        click.echo(buffer.getvalue(), nl=False)
+        buffer.seek(0)
+        buffer.truncate()
+    return write
+
+def _geo_bulk(addresses, output_format, threads):
+    # Runs the batches concurrently and streams one row per address
+    get_transport().reserve(threads)
+    write = _geo_writer(output_format)
+    for chunk, records, error in bounded_map(_geo_batch, _geo_chunks(addresses), workers=threads):
+        if error is not None:
+            records = [{'query': address, 'status': 'fail', 'message': str(error)} for address in chunk]
+        for record in records:
+            write(record)
+
+def _geo_offline_record(address):
+    try:
+        return get_geo_index().lookup(address)
+    except ThroneFormattingError as e:
+        return {'query': address, 'status': 'fail', 'message': str(e)}
+
+def _geo_offline(addresses, output_format):
+    # Local lookups take microseconds, so there is no point in batching
+    if output_format != 'text':
+        write = _geo_writer(output_format)
+        for address in addresses:
+            write(_geo_offline_record(address))
+        return
+    click.secho("---IP Geo (Offline)---", fg='green')
+    for address in addresses:
+        record = _geo_offline_record(address)
+        if record['status'] != 'success':
+            click.secho(f"{address}: {record['message']}", fg='red')
+            continue
+        click.echo(f"IP Address: {address} \nLocation: {record['city']}, {record['region']}, {record['countryCode']} \nLat/Long: {record['lat']}/{record['lon']} \nTimezone: {record['timezone']}")
+
 @ip.command()
-@click.argument('address', nargs=1, metavar="IP_ADDRESS")
-def geo(address):
+@click.option("--input", "-i", "input_file", type=click.File('r'), default=None, help="Reads addresses line by line from FILE ('-' for stdin).", metavar="FILE")
+@click.option("--format", "-f", "output_format", type=click.Choice(['text', 'csv', 'ndjson']), default=None, help="Output format. Defaults to text for one address and NDJSON otherwise.")
+@click.option("--threads", "-t", default=4, show_default=True, help="Number of batches requested concurrently.", metavar="NUMBER")
+@click.option("--offline", "-o", is_flag=True, help="Answers from the local geolocation database built by `throne ip geo-index build`.")
+@click.argument('addresses', nargs=-1, metavar="IP_ADDRESS...")
+def geo(addresses, input_file, output_format, threads, offline):
     """
-    Retrieves geolocation information for a specified IP address.
+    Retrieves geolocation information for IP addresses. \n
+    Many addresses are looked up 100 at a time through the ip-api batch endpoint.
     """
-    if "/" in address:
-        click.secho("That looks like a prefix...try an address.", fg='red')
-    else:
+    if not addresses and input_file is None:
+        if sys.stdin.isatty():
+            raise click.UsageError("Provide an IP_ADDRESS or use --input FILE.")
+        input_file = click.get_text_stream('stdin')
+    if output_format is None:
+        output_format = 'text' if len(addresses) == 1 and input_file is None else 'ndjson'
+    if offline:
+        _geo_offline(_geo_addresses(addresses, input_file), output_format)
+        return
+    if output_format != 'text':
+        _geo_bulk(_geo_addresses(addresses, input_file), output_format, threads)
+        return
+    for address in _geo_addresses(addresses, input_file):
+        if "/" in address:
+            click.secho("That looks like a prefix...try an address.", fg='red')
+            continue
         # URLs
         url = f"http://ip-api.com/json/{address}"
         # Get/Parse Response
-        response = request("GET", url)
-        if response.status_code == 200:
-            json = response.json()
-            countryCode = json['countryCode']
-            region = json['region']
-            city = json['city']
-            lat = json['lat']
-            lon = json['lon']
-            timezone = json['timezone']
-            isp = json['isp']
-            org = json['org']
-            asnum = json['as']
-            query = json['query']
-            # Output to user
-            click.echo(f"IP Address: {query} \nAS Number: {asnum} \nISP: {isp} \nOrganization: {org}")
-            click.echo("---")
-            click.echo(f"Location: {city}, {region}, {countryCode} \nLat/Long: {lat}/{lon} \nTimezone: {timezone}")
+        json = json_request._JSONRequest().get_json(url=url)
+        countryCode = json['countryCode']
+        region = json['region']
+        city = json['city']
+        lat = json['lat']
+        lon = json['lon']
+        timezone = json['timezone']
+        isp = json['isp']
+        org = json['org']
+        asnum = json['as']
+        query = json['query']
+        # Output to user
+        click.echo(f"IP Address: {query} \nAS Number: {asnum} \nISP: {isp} \nOrganization: {org}")
+        click.echo("---")
+        click.echo(f"Location: {city}, {region}, {countryCode} \nLat/Long: {lat}/{lon} \nTimezone: {timezone}")
+
+@ip.group(name='geo-index')
+def geo_index():
+    """
+    Manage the local geolocation database used by geo --offline.
+    """
+    pass
+
+@geo_index.command(name='build')
+@click.argument('files', nargs=-1, required=True, metavar="FILE...")
+def geo_index_build(files):
+    """
+    Builds the local geolocation database from CSV files.\n
+    Rows are either `start,end,country_code,region,city,latitude,longitude,timezone`
+    (addresses or integers, no header) or have a header naming a network or
+    start/end column and any of the location columns. Use - for stdin.
+    """
+    summary = build_geo_index(files)
+    click.secho("---Geolocation Database Built---", fg="green")
+    click.echo(f"Locations: {summary['locations']}")
+    for family in ('v4', 'v6'):
+        click.echo(f"IP{family}: {summary[family]['ranges']} ranges")
+    if summary['skipped']:
+        click.secho(f"Skipped {summary['skipped']} unparseable or overlapping rows.", fg="red")
+
+@geo_index.command(name='info')
+def geo_index_info():
+    """
+    Shows what the local geolocation database contains.
+    """
+    summary = get_geo_index().info()
+    click.secho("---Geolocation Database---", fg="green")
+    click.echo(f"Built: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(summary['built']))}")
+    click.echo(f"Locations: {summary['locations']}")
+    for family in ('v4', 'v6'):
+        click.echo(f"IP{family}: {summary[family]['ranges']} ranges")
+
+@ip.command()
+@click.option("--threads", "-t", "--concurrency", "-c", "threads", default=8, show_default=True, help="Number of sub-ranges walked at once.", metavar="NUMBER")
+@click.option("--state", "state_file", type=click.Path(dir_okay=False), default=None, help="Keeps the progress in FILE and resumes from it when it exists.", metavar="FILE")
+@click.argument('prefix', nargs=1, metavar="PREFIX")
+def sweep(prefix, threads, state_file):
+    """
+    Maps a prefix to its allocations, holders and origin ASNs. \n
+    Writes one NDJSON record per stretch of addresses sharing an allocation and announced route. Each lookup
+    jumps to the end of the allocation or route it found, so the number of lookups grows with the number of
+    allocations, not addresses. Addresses whose lookup fails are skipped a /24 (IPv6: /48) at a time.
+    """
+    client = Client()
+    if not client.throne_key:
+        click.secho("throne API key required! Run `throne api set` to configure your API key.", fg="red")
+        click.secho("If you do not have an account, please register for one by visting https://api.throne.dev/auth/login and click 'Sign Up' at the bottom of the prompt", fg="red")
+        return
+    try:
+        walk = _Sweep(client, prefix, workers=threads, state_path=state_file)
+    except (ThroneFormattingError, ThroneConfigError) as e:
+        raise click.UsageError(str(e))
+    segments = addresses = 0
+    for record in walk.run():
+        segments += 1
+        addresses += record['addresses']
+        click.echo(json.dumps(record))
+    click.secho(f"Swept {addresses} addresses with {segments} lookups.", fg="green", err=True)
+
+def _offline_record(address):
+    # Answers the origin AS question from the local route index
+    match = get_route_index().lookup(address)
+    if match is None:
+        return {'query': address, 'prefix': None, 'origin_as': None}
+    return {'query': address, 'prefix': match[0], 'origin_as': match[1]}
+
+def _offline_batch(input_file):
+    # Local lookups take microseconds, so there is no point in a thread pool
+    for address in read_lines(input_file):
+        try:
+            record = _offline_record(address)
+        except ThroneFormattingError as e:
+            record = {'query': address, 'error': str(e)}
+        click.echo(json.dumps(record))
+
+def _info_batch(client, input_file, threads):
+    # Streams addresses from input_file and writes one record per address
+    for address, info, error in client.lookup_ip_many(read_lines(input_file), workers=threads):
+        if error is not None:
+            record = {'query': address, 'error': str(error)}
+        else:
+            record = to_dict(info)
+        click.echo(json.dumps(record))
 
 @ip.command()
 @click.option("--all", "-a", is_flag=True, help="Gets IP + BGP info", default=False)
-@click.argument('ipaddress', nargs=1, metavar="IP_OR_PREFIX")
-@click.pass_context
-def info(ctx, ipaddress, all):
+@click.option("--input", "-i", "input_file", type=click.File('r'), default=None, help="Reads addresses line by line from FILE ('-' for stdin) and writes one NDJSON record per address.", metavar="FILE")
+@click.option("--threads", "-t", "--concurrency", "-c", "threads", default=8, show_default=True, help="Number of worker threads used with --input.", metavar="NUMBER")
+@click.option("--offline", "-o", is_flag=True, help="Only answers the origin AS from the local route index built by `throne bgp index build`.")
+@click.argument('ipaddress', nargs=1, metavar="IP_OR_PREFIX", required=False)
+def info(ipaddress, all, input_file, threads, offline):
     """
     Retrieves IP and registered contact information.
     """
-    if throne_apikey:
-        # Throne API Query
-        throne_url = '{0}whois/ip?query={1}'.format(THRONE_API, ipaddress)
-        throne_headers = {'Authorization': f'{throne_apikey}'}
-        throne_response = request("GET", throne_url, headers=throne_headers)
-        throne_result = throne_response.json()
-        # RIPE API Query
-        ripe_url = '{0}{1}'.format(RIPEPREFIXOVER_URL, ipaddress)
-        ripe_response = request("GET", ripe_url)
-        ripe_result = ripe_response.json()
+    client = Client()
+    if ipaddress is None and input_file is None:
+        raise click.UsageError("Provide an IP_OR_PREFIX or use --input FILE.")
+    if ipaddress is not None and input_file is not None:
+        raise click.UsageError("Provide either an IP_OR_PREFIX or --input FILE, not both.")
+    if all and input_file is not None:
+        raise click.UsageError("--all only works with a single IP_OR_PREFIX, not with --input.")
+    if offline and input_file is not None:
+        _offline_batch(input_file)
+    elif offline:
+        record = _offline_record(ipaddress)
+        click.secho("---IP Info (Offline)---", fg='green')
+        click.echo(f"Prefix: {record['prefix']}\n Announced By: {record['origin_as']}")
+    elif client.throne_key and input_file is not None:
+        _info_batch(client, input_file, threads)
+    elif client.throne_key:
+        info = client.lookup_ip(ipaddress)
         # Parsing responses
-        if ripe_result['data']['asns'] is None:
+        holderstr = "None"
+        if not info.asns:
             asnstr = "None"
         else:
-            for asn in ripe_result['data']['asns']:
-                asnstr = asn['asn']
-                holderstr = asn['holder']
+            for origin in info.asns:
+                asnstr = origin.asn
+                holderstr = origin.holder
         # Output to user
         click.secho("---IP Info---", fg='green')
-        click.echo(f"RIR: {throne_result['rir']}\nIssued By: {ripe_result['data']['block']['desc']}\nName: {throne_result['name']}\n Announced: {ripe_result['data']['announced']}\n Announced By: {asnstr} / {holderstr}\n Version: {throne_result['ipVersion']}\n Beginning: {throne_result['startAddress']}\n Ending: {throne_result['endAddress']}")
-        click.secho(f'---{throne_result["rir"]}/{holderstr} Contact Information---', fg='green')
-        for ent in throne_result['entities']:
-            name = ent['name']
-            type = ent['roles']
+        click.echo(f"RIR: {info.rir}\nIssued By: {info.block.desc}\nName: {info.name}\n Announced: {info.announced}\n Announced By: {asnstr} / {holderstr}\n Version: {info.version}\n Beginning: {info.start_address}\n Ending: {info.end_address}")
+        click.secho(f'---{info.rir}/{holderstr} Contact Information---', fg='green')
+        for ent in info.entities:
+            type = ent.roles
             delimeter = "/"
-            if ent['roles'] is None:
+            if ent.roles is None:
                 pass
             else:
                 type = delimeter.join(type).title()
-            click.secho(f'{name} ({type}):')
-            if "RIPE" in throne_result['rir']:
-                click.echo(" Entity Address: " + ent['address'] + "\n Entity Phone: " + str(ent['phone']) + "\n Entity Email: " + ent['email'])
+            click.secho(f'{ent.name} ({type}):')
+            if "RIPE" in info.rir:
+                click.echo(" Entity Address: " + ent.address + "\n Entity Phone: " + str(ent.phone) + "\n Entity Email: " + ent.email)
                 click.secho("\nSome of these details may be filtered by RIPE. To verify this information please visit https://apps.db.ripe.net/db-web-ui/query.", fg='red')
             else:
-                click.echo(" Entity Address: " + ent['address'] + "\n Entity Phone: " + str(ent['phone']) + "\n Entity Email: " + str(ent['email']))
+                click.echo(" Entity Address: " + ent.address + "\n Entity Phone: " + str(ent.phone) + "\n Entity Email: " + str(ent.email))
         if all:
-            if ripe_result['data']['asns'] is None:
+            if not info.asns:
                 click.secho("\nThis prefix appears to not be advertised. There are no related ASNs to get BGP info for.", fg='red')
-            # Otherwise send ASNs to asn command in bgp.py
+            # Otherwise look up every ASN concurrently and render them like bgp asn
             else:
-                for asn in ripe_result['data']['asns']:
-                    asnstr = asn['asn']
-                    ctx.invoke(get_asn, as_number=asnstr)
+                for asn_info in client.lookup_asn_many([origin.asn for origin in info.asns]):
+                    _render_asn(asn_info)
         else:
             pass
-    if throne_apikey is None:
+    if client.throne_key is None and not offline:
         click.secho("throne API key required! Run `throne api set` to configure your API key.", fg="red")
         click.secho("If you do not have an account, please register for one by visting https://api.throne.dev/auth/login and click 'Sign Up' at the bottom of the prompt", fg="red")
\ No newline at end of file
@@ -0,0 +1,125 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import logging
+from array import array
+# Import Throne Modules
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+def _ranked(counts):
+    # [{'asn', 'paths'}] by paths seen, most first
+    return [{'asn': asn, 'paths': paths} for asn, paths in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+
+class _ASGraph():
+    # This class builds a graph of AS adjacencies from the AS paths of
+    # parsed looking-glass responses (see lg_parser._LGParse). AS numbers
+    # are mapped to node indexes in first-seen order and each adjacency is
+    # kept once, keyed by its two node indexes packed into one integer, with
+    # the number of paths it was seen on. An edge a -> b means a heard the
+    # route from b, i.e. b is one hop closer to the origin.
+    def __init__(self):
+        self.asns = array('I')
+        self.nodes = {}
+        self.edges = {}
+        self.origins = set()
+        self.prefixes = 0
+        self.routes = 0
+
+    def _node(self, asn):
+        node = self.nodes.get(asn)
+        if node is None:
+            node = self.nodes[asn] = len(self.asns)
+            self.asns.append(asn)
+        return node
+
+    def add(self, query, routes):
+        """
+        Adds the paths of one parsed looking-glass response to the graph and
+        returns what they show about the queried prefix: its origins, the
+        upstreams heard announcing them, path lengths after removing
+        prepends, who prepends and the transit ASes between the RIS peers
+        and the origin.
+        """
+        origins = {}
+        upstreams = {}
+        lengths = {}
+        prepends = {}
+        transit = set()
+        paths, starts, path_lengths = routes.paths, routes.path_starts, routes.path_lengths
+        for index in range(len(routes)):
+            start = starts[index]
+            hops = []
+            runs = {}
+            previous, run = None, 0
+            for asn in paths[start:start + path_lengths[index]]:
+                # 0 stands for a path token that is not an AS number
+                if not asn:
+                    continue
+                if asn == previous:
+                    run += 1
+                    runs[asn] = max(runs.get(asn, 1), run)
+                    continue
+                previous, run = asn, 1
+                hops.append(asn)
+            if not hops:
+                continue
+            origin = routes.origin_as[index] or hops[-1]
+            origins[origin] = origins.get(origin, 0) + 1
+            self.origins.add(origin)
+            lengths[len(hops)] = lengths.get(len(hops), 0) + 1
+            for asn, times in runs.items():
+                seen = prepends.setdefault(asn, [0, 0])
+                seen[0] = max(seen[0], times)
+                seen[1] += 1
+            if len(hops) > 1:
+                upstreams[hops[-2]] = upstreams.get(hops[-2], 0) + 1
+            transit.update(hops[1:-1])
+            nodes = [self._node(asn) for asn in hops]
+            for near, far in zip(nodes, nodes[1:]):
+                key = (near << 32) | far
+                self.edges[key] = self.edges.get(key, 0) + 1
+        self.prefixes += 1
+        self.routes += len(routes)
+        hop_count = sum(length * count for length, count in lengths.items())
+        paths_seen = sum(lengths.values())
+        return {
+            'query': query,
+            'routes': len(routes),
+            'origins': sorted(origins),
+            'upstreams': _ranked(upstreams),
+            'path_lengths': {str(length): lengths[length] for length in sorted(lengths)},
+            'mean_path_length': round(hop_count / paths_seen, 2) if paths_seen else None,
+            'prepending': [
+                {'asn': asn, 'times': times, 'paths': count}
+                for asn, (times, count) in sorted(prepends.items(), key=lambda item: (-item[1][1], item[0]))
+            ],
+            'transit': sorted(transit),
+        }
+
+    def summary(self):
+        """
+        Returns the graph over every prefix added: the upstreams of each
+        origin and the ASes seen carrying other ASes' routes.
+        """
+        # An origin given by RIS but missing from every path has no node
+        origins = {self.nodes[asn]: asn for asn in self.origins if asn in self.nodes}
+        upstreams = {asn: {} for asn in self.origins}
+        heard = bytearray(len(self.asns))
+        told = bytearray(len(self.asns))
+        for key, paths in self.edges.items():
+            near, far = key >> 32, key & 0xFFFFFFFF
+            heard[near] = told[far] = 1
+            if far in origins:
+                upstreams[origins[far]][self.asns[near]] = paths
+        return {
+            'prefixes': self.prefixes,
+            'routes': self.routes,
+            'ases': len(self.asns),
+            'adjacencies': len(self.edges),
+            'upstreams': {str(asn): _ranked(upstreams[asn]) for asn in sorted(upstreams)},
+            # An AS that heard a route from one neighbour and passed it on to another
+            'transit': sorted(self.asns[node] for node in range(len(self.asns)) if heard[node] and told[node]),
+        }
@@ -0,0 +1,52 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+# Import Throne Modules
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+def read_lines(input_file):
+    """
+    Lazily yields the stripped, non-empty and non-comment lines of a file.
+    """
+    for line in input_file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+def bounded_map(func, items, workers=8):
+    """
+    Runs func over items on a pool of worker threads and yields
+    (item, result, error) tuples as they complete.
+
+    At most workers * 2 items are in flight at any time, so memory use does
+    not depend on how many items are consumed from the iterable.
+    """
+    workers = max(1, workers)
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='throne-batch') as pool:
+        pending = {}
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < workers * 2:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(func, item)] = item
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                if error is not None:
+                    log.debug(f"Worker failed for {item}: {error}")
+                    yield item, None, error
+                else:
+                    yield item, future.result(), None
@@ -0,0 +1,409 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import importlib
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+# Import Throne Modules
+from src.client import Client, to_dict
+from src.config import config_file, load_config, reload_config
+from src.exceptions import ThroneBaseException, ThroneConfigError
+from src.parsers.daemon_client import local_command
+from src.parsers.response_cache import get_cache
+from src.parsers.singleflight import get_singleflight
+from src.parsers.transport import get_transport
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Lookups served as GET /v1/<name>?query=..., by Client method
+API_METHODS = {
+    'ip': 'lookup_ip',
+    'prefix': 'lookup_prefix',
+    'asn': 'lookup_asn',
+    'prefixes': 'announced_prefixes',
+    'lg': 'lg',
+    'domain': 'whois_domain',
+    'pdb/org': 'pdb_org',
+    'pdb/ix': 'pdb_ix',
+    'pdb/fac': 'pdb_fac',
+}
+
+class _Disconnected(Exception):
+    # The client went away while its command was running. Deliberately not
+    # an OSError, which click would answer by replacing sys.stdout.
+    pass
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+class _ThreadLocalStream(io.TextIOBase):
+    # This class replaces sys.stdin, sys.stdout and sys.stderr in the
+    # daemon. Each request thread points it at its own stream so concurrent
+    # commands never see each other's input or output; any other thread
+    # uses the daemon's original stream.
+    errors = 'strict'
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    @property
+    def encoding(self):
+        return 'utf-8'
+
+    @property
+    def target(self):
+        return getattr(self.local, 'stream', None) or self.default
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return self.target.isatty()
+
+    def fileno(self):
+        return self.target.fileno()
+
+    def read(self, size=-1):
+        return self.target.read(size)
+
+    def readline(self, size=-1):
+        return self.target.readline(size)
+
+    def write(self, s):
+        return self.target.write(s)
+
+    def flush(self):
+        self.target.flush()
+
+class _Input(io.StringIO):
+    # The stdin of a forwarded command. Piped input never reaches the
+    # daemon, so it only reports whether the client's stdin is a terminal.
+    def __init__(self, tty):
+        super().__init__('')
+        self.tty = tty
+
+    def isatty(self):
+        return self.tty
+
+class _Output(io.TextIOBase):
+    # The stdout or stderr of a forwarded command. Writes are collected and
+    # sent to the client as one NDJSON frame per flush, which click.echo
+    # does after every message.
+    errors = 'strict'
+
+    def __init__(self, connection, name, tty):
+        self.connection = connection
+        self.name = name
+        self.tty = tty
+        self.pending = []
+
+    @property
+    def encoding(self):
+        return 'utf-8'
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return self.tty
+
+    def write(self, s):
+        if not isinstance(s, str):
+            raise TypeError(f"write() argument must be str, not {type(s).__name__}")
+        self.pending.append(s)
+        return len(s)
+
+    def flush(self):
+        if self.pending:
+            data = ''.join(self.pending)
+            self.pending = []
+            self.connection.send({'stream': self.name, 'data': data})
+
+class _Connection():
+    # This class writes frames to the client of a forwarded command.
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.lock = threading.Lock()
+
+    def send(self, frame):
+        data = json.dumps(frame).encode('utf-8') + b'\n'
+        with self.lock:
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError as e:
+                raise _Disconnected(str(e))
+
+class _WorkingDirectory():
+    # This class shares the process working directory between commands.
+    # Commands from the same directory run concurrently; a command from
+    # another directory waits until they have finished.
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.cwd = os.getcwd()
+        self.active = 0
+
+    @contextmanager
+    def enter(self, cwd):
+        with self.condition:
+            self.condition.wait_for(lambda: self.active == 0 or self.cwd == cwd)
+            if self.cwd != cwd:
+                os.chdir(cwd)
+                self.cwd = cwd
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+class _Handler(BaseHTTPRequestHandler):
+    # This class answers POST /run (Unix socket only) with the output of a
+    # command line, see daemon_client.forward, and GET /v1/... with JSON.
+    protocol_version = 'HTTP/1.0'
+    server_version = 'throne'
+
+    def log_message(self, format, *args):
+        # Unix socket clients have no address for the default format
+        log.debug(format % args)
+
+    def _json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        name = unquote(parts.path).strip('/')
+        if name == 'v1/status':
+            return self._json(200, self.server.daemon.status())
+        method = API_METHODS.get(name[len('v1/'):]) if name.startswith('v1/') else None
+        query = parse_qs(parts.query).get('query')
+        if method is None:
+            return self._json(404, {'error': f"Unknown lookup {parts.path}, use one of {', '.join(f'/v1/{name}' for name in API_METHODS)}."})
+        if not query:
+            return self._json(400, {'error': "The query parameter is required."})
+        try:
+            result = self.server.daemon.lookup(method, query[0])
+        except ThroneBaseException as e:
+            return self._json(502, {'error': str(e)})
+        except Exception as e:
+            # e.g. a response in a shape the parsers do not expect
+            log.debug(f"Lookup {name}?query={query[0]} failed\n{traceback.format_exc()}")
+            return self._json(500, {'error': f"{type(e).__name__}: {e}"})
+        self._json(200, result)
+
+    def do_POST(self):
+        if self.path != '/run' or not isinstance(self.server, _UnixServer):
+            return self._json(404, {'error': f"Unknown endpoint {self.path}."})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            args = [str(arg) for arg in request['args']]
+        except (ValueError, KeyError, TypeError):
+            return self._json(400, {'error': "Expected a JSON body with args."})
+        if local_command(args):
+            return self._json(400, {'error': f"`throne {' '.join(args)}` has to run in-process."})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        self.server.daemon.run(args, request, _Connection(self.wfile))
+
+class _Pooled(socketserver.ThreadingMixIn):
+    # Handles requests on the daemon's worker pool rather than a new thread
+    # per request, so per-thread state such as the response cache's SQLite
+    # connection stays open between commands.
+    def process_request(self, request, client_address):
+        self.daemon.pool.submit(self.process_request_thread, request, client_address)
+
+class _UnixServer(_Pooled, socketserver.UnixStreamServer):
+    pass
+
+class _TCPServer(_Pooled, HTTPServer):
+    pass
+
+class _Daemon():
+    # This class is the process behind `throne serve`. It keeps the
+    # commands imported and the transport's connection pools, DNS cache,
+    # response cache connections and memory-mapped indexes warm between
+    # the commands it runs for the CLI.
+    def __init__(self, workers=16):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='throne-serve')
+        self.workers = workers
+        self.directory = _WorkingDirectory()
+        self.config_mtime = _mtime(config_file)
+        self.config_lock = threading.Lock()
+        self.started = time.time()
+        self.commands = 0
+        self.lookups = 0
+        self.servers = []
+        self.socket = None
+
+    def warm(self):
+        """
+        Imports every command module and opens the shared state up front,
+        so the first forwarded command is as fast as the rest.
+        """
+        from bin.throne import LAZY_COMMANDS
+        for module, _ in LAZY_COMMANDS.values():
+            importlib.import_module(module)
+        load_config()
+        get_cache()
+        get_transport()
+
+    def _streams(self, stdin=None, stdout=None, stderr=None):
+        sys.stdin.local.stream = stdin
+        sys.stdout.local.stream = stdout
+        sys.stderr.local.stream = stderr
+
+    def _check_config(self):
+        # `throne api set` runs in-process and writes a new key to the config
+        mtime = _mtime(config_file)
+        with self.config_lock:
+            if mtime != self.config_mtime:
+                log.debug(f"{config_file} changed, reloading it")
+                self.config_mtime = mtime
+                reload_config()
+
+    def _invoke(self, args, width):
+        from bin.throne import cli
+        # The help width click derives from the client's terminal in-process
+        width = max(min(width or 80, 80) - 2, 50)
+        try:
+            cli.main(args=args, prog_name='throne', terminal_width=width)
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+            sys.stderr.write(f"{e.code}\n")
+            return 1
+        except _Disconnected:
+            raise
+        except Exception:
+            # In-process this would be an uncaught exception as well
+            sys.stderr.write(traceback.format_exc())
+            return 1
+        return 0
+
+    def run(self, args, request, connection):
+        """
+        Runs a command line with its output sent to the client, ending with
+        a frame holding the exit code.
+        """
+        self.commands += 1
+        tty = request.get('tty') or {}
+        stdout = _Output(connection, 'out', tty.get('stdout', False))
+        stderr = _Output(connection, 'err', tty.get('stderr', False))
+        self._check_config()
+        self._streams(_Input(tty.get('stdin', False)), stdout, stderr)
+        try:
+            with self.directory.enter(request.get('cwd') or self.directory.cwd):
+                exit_code = self._invoke(args, request.get('width'))
+            stdout.flush()
+            stderr.flush()
+            connection.send({'exit': exit_code})
+        except _Disconnected as e:
+            log.debug(f"Client of `throne {' '.join(args)}` disconnected: {e}")
+        except OSError as e:
+            # e.g. the client's working directory does not exist here
+            try:
+                connection.send({'stream': 'err', 'data': f"Error: {e}\n"})
+                connection.send({'exit': 1})
+            except _Disconnected:
+                pass
+        finally:
+            self._streams()
+
+    def lookup(self, method, query):
+        """
+        Returns the result of a Client lookup as plain JSON data.
+        """
+        self.lookups += 1
+        self._check_config()
+        # Clients are cheap; one per lookup picks up a changed API key
+        return to_dict(getattr(Client(), method)(query))
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'uptime': round(time.time() - self.started, 3),
+            'socket': self.socket,
+            'workers': self.workers,
+            'commands': self.commands,
+            'lookups': self.lookups,
+            'coalesced': get_singleflight().stats(),
+            'rate_limits': get_transport().limiter.stats(),
+        }
+
+    def listen(self, path, port=None):
+        """
+        Binds the Unix socket at path (readable by this user only) and, with
+        port, a JSON lookup endpoint on 127.0.0.1:port.
+        """
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                log.debug(f"Removing stale socket {path}")
+                os.unlink(path)
+            else:
+                raise ThroneConfigError(f"A throne daemon is already listening on {path}.")
+            finally:
+                probe.close()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        umask = os.umask(0o177)
+        try:
+            server = _UnixServer(path, _Handler)
+        finally:
+            os.umask(umask)
+        server.daemon = self
+        self.servers.append(server)
+        self.socket = path
+        if port is not None:
+            server = _TCPServer(('127.0.0.1', port), _Handler)
+            server.daemon = self
+            self.servers.append(server)
+
+    def serve_forever(self):
+        """
+        Serves until interrupted, then removes the socket.
+        """
+        sys.stdin = _ThreadLocalStream(sys.stdin)
+        sys.stdout = _ThreadLocalStream(sys.stdout)
+        sys.stderr = _ThreadLocalStream(sys.stderr)
+        threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in self.servers[1:]]
+        for thread in threads:
+            thread.start()
+        try:
+            self.servers[0].serve_forever()
+        finally:
+            for server in self.servers:
+                server.server_close()
+            if self.socket and os.path.exists(self.socket):
+                os.unlink(self.socket)
+            # Commands still running finish before the process exits
+            self.pool.shutdown(wait=False, cancel_futures=True)
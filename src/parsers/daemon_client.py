@@ -0,0 +1,116 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+# Only the standard library modules the interpreter has loaded anyway, this
+# runs before click or any throne module is imported
+import json
+import os
+import socket
+import stat
+import sys
+
+# Default socket of `throne serve`, THRONE_SOCKET overrides it
+SOCKET_PATH = os.path.join(os.path.expanduser("~"), '.throne', 'throne.sock')
+# Commands that prompt for input, run until interrupted or manage the daemon
+# itself always run in-process
+LOCAL_COMMANDS = ('api', 'serve', 'bgp watch')
+# THRONE_TIMINGS values that turn the --timings report on, by report format,
+# and those that leave it off
+TIMINGS_FORMATS = {'1': 'table', 'true': 'table', 'table': 'table', 'json': 'json'}
+TIMINGS_OFF = ('', '0', 'false', 'no')
+
+def timings_setting():
+    return os.environ.get('THRONE_TIMINGS', '').strip().lower()
+
+def socket_path():
+    return os.environ.get('THRONE_SOCKET') or SOCKET_PATH
+
+def local_command(args):
+    """
+    Returns whether a command line has to run in-process. Global options
+    change process-wide state (cache, recorder, timings), so they do too.
+    """
+    if not args or args[0].startswith('-'):
+        return True
+    return args[0] in LOCAL_COMMANDS or ' '.join(args[:2]) in LOCAL_COMMANDS
+
+def forwardable(args):
+    """
+    Returns whether a command line can run in the daemon. Piped input is
+    read by the command as it runs, so it keeps a command in-process.
+    """
+    # Timings are reported by the process that ran the command, and an
+    # invalid THRONE_TIMINGS is reported in-process too
+    if os.environ.get('THRONE_NO_DAEMON') or timings_setting() not in TIMINGS_OFF:
+        return False
+    if local_command(args):
+        return False
+    try:
+        mode = os.fstat(sys.stdin.fileno()).st_mode
+    except (AttributeError, OSError, ValueError):
+        return True
+    return not (stat.S_ISFIFO(mode) or stat.S_ISREG(mode) or stat.S_ISSOCK(mode))
+
+def _isatty(stream):
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+def _terminal_width():
+    # What click would use in-process, see shutil.get_terminal_size
+    try:
+        return int(os.environ['COLUMNS'])
+    except (KeyError, ValueError):
+        pass
+    try:
+        return os.get_terminal_size(sys.__stdout__.fileno()).columns
+    except (AttributeError, OSError, ValueError):
+        return 80
+
+def forward(args):
+    """
+    Runs a command line in the `throne serve` daemon and copies its output
+    to this process as it is written. Returns the command's exit code, or
+    None when no daemon is listening and the command has to run in-process.
+    """
+    path = socket_path()
+    if not forwardable(args) or not os.path.exists(path):
+        return None
+    body = json.dumps({
+        'args': args,
+        'cwd': os.getcwd(),
+        'tty': {'stdin': _isatty(sys.stdin), 'stdout': _isatty(sys.stdout), 'stderr': _isatty(sys.stderr)},
+        'width': _terminal_width(),
+    }).encode('utf-8')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        # A socket left behind by a daemon that is gone
+        sock.close()
+        return None
+    with sock:
+        sock.sendall(b'POST /run HTTP/1.0\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+        response = sock.makefile('rb')
+        status = response.readline().split()
+        if len(status) < 2 or status[1] != b'200':
+            return None
+        # Headers
+        while response.readline().strip():
+            pass
+        try:
+            # One JSON frame per flush of the command's stdout or stderr
+            for line in response:
+                frame = json.loads(line)
+                if 'exit' in frame:
+                    return frame['exit']
+                stream = sys.stdout if frame['stream'] == 'out' else sys.stderr
+                stream.write(frame['data'])
+                stream.flush()
+        except KeyboardInterrupt:
+            sys.stderr.write("\nAborted!\n")
+            return 1
+    sys.stderr.write("Error: The throne daemon closed the connection before the command finished.\n")
+    return 1
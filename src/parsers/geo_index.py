@@ -0,0 +1,239 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import csv
+import json
+import logging
+import os
+import time
+from array import array
+# Import Throne Modules
+from src.exceptions import ThroneFormattingError, ThroneConfigError
+from src.parsers.range_table import write_range_table, _RangeTable
+from src.parsers.route_index import FAMILIES, default_index_dir, parse_address, parse_prefix, _open_dump
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Location fields kept per range, named like the ip-api fields so online and
+# offline results share one output format.
+GEO_FIELDS = ('countryCode', 'region', 'city', 'lat', 'lon', 'timezone')
+
+# CSV header names understood for each column. Files without a header must
+# use the throne layout: start,end,country_code,region,city,latitude,longitude,timezone
+GEO_COLUMNS = {
+    'network': ('network', 'cidr', 'prefix'),
+    'start': ('start', 'ip_start', 'ip_from', 'start_ip', 'first'),
+    'end': ('end', 'ip_end', 'ip_to', 'end_ip', 'last'),
+    'countryCode': ('country_code', 'countrycode', 'country_iso_code', 'country'),
+    'region': ('region', 'region_name', 'stateprov', 'subdivision'),
+    'city': ('city', 'city_name'),
+    'lat': ('latitude', 'lat'),
+    'lon': ('longitude', 'lon'),
+    'timezone': ('timezone', 'time_zone'),
+}
+GEO_DEFAULT_HEADER = ('start', 'end', 'country_code', 'region', 'city', 'latitude', 'longitude', 'timezone')
+
+# Separates the fields of a location in the string table
+FIELD_SEPARATOR = '\x1f'
+
+# IPv6 databases store IPv4 ranges as IPv4-mapped addresses
+_MAPPED_V4 = 0xFFFF << 32
+
+# Valid coordinates, anything else (e.g. "N/A") skips the row
+COORDINATE_LIMITS = {'lat': 90.0, 'lon': 180.0}
+
+def _parse_bound(value):
+    # Range bounds are either addresses or integers (IP2Location style)
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        if number <= 0xFFFFFFFF:
+            return 4, number
+        if _MAPPED_V4 <= number <= _MAPPED_V4 | 0xFFFFFFFF:
+            return 4, number - _MAPPED_V4
+        return 6, number
+    family, number = parse_address(value)
+    if family == 6 and _MAPPED_V4 <= number <= _MAPPED_V4 | 0xFFFFFFFF:
+        return 4, number - _MAPPED_V4
+    return family, number
+
+def _field(row, positions, field):
+    value = row[positions[field]].strip() if field in positions else ''
+    if value and field in COORDINATE_LIMITS:
+        # Raises ValueError for text, NaN and out of range coordinates
+        if not abs(float(value)) <= COORDINATE_LIMITS[field]:
+            raise ValueError(f"Invalid {field} {value!r}")
+    return value
+
+def _columns(header):
+    # Maps each location field to its position in a CSV header
+    header = [name.strip().lower() for name in header]
+    positions = {}
+    for field, aliases in GEO_COLUMNS.items():
+        for alias in aliases:
+            if alias in header:
+                positions[field] = header.index(alias)
+                break
+    if 'network' not in positions and not ('start' in positions and 'end' in positions):
+        raise ThroneFormattingError("Geolocation CSV needs a network column or start and end columns.")
+    return positions
+
+def _is_header(row):
+    try:
+        _parse_bound(row[0])
+    except (ThroneFormattingError, IndexError):
+        return True
+    return False
+
+def _read_rows(path):
+    # Yields (row, column positions) for every row of a CSV file
+    with _open_dump(path) as f:
+        reader = csv.reader(f)
+        first = next(reader, None)
+        if first is None:
+            return
+        if _is_header(first):
+            positions = _columns(first)
+        else:
+            positions = _columns(GEO_DEFAULT_HEADER)
+            yield first, positions
+        for row in reader:
+            yield row, positions
+
+def build_geo_index(paths, index_dir=None):
+    """
+    Builds the IPv4 and IPv6 geolocation tables from CSV files. Rows with an
+    invalid range or coordinates and overlapping ranges, other than the one
+    that starts first, are skipped. Returns a dict with the number of ranges
+    per family, of distinct locations and of skipped rows.
+    """
+    ranges = {4: [], 6: []}
+    locations = {}
+    skipped = 0
+    for path in paths:
+        for row, positions in _read_rows(path):
+            try:
+                if 'network' in positions:
+                    family, start, length = parse_prefix(row[positions['network']])
+                    end = start | ((1 << (FAMILIES[family][1] - length)) - 1)
+                    if family == 6 and length >= 96 and _MAPPED_V4 <= start <= _MAPPED_V4 | 0xFFFFFFFF:
+                        family, start, end = 4, start - _MAPPED_V4, end - _MAPPED_V4
+                else:
+                    family, start = _parse_bound(row[positions['start']])
+                    end_family, end = _parse_bound(row[positions['end']])
+                    if family != end_family or end < start:
+                        raise ThroneFormattingError(f"Invalid range {row}")
+                location = FIELD_SEPARATOR.join(_field(row, positions, field) for field in GEO_FIELDS)
+            except (ThroneFormattingError, IndexError, ValueError):
+                skipped += 1
+                continue
+            ranges[family].append((start, end, locations.setdefault(location, len(locations))))
+    index_dir = index_dir or default_index_dir()
+    os.makedirs(index_dir, exist_ok=True)
+    payload = _string_table(locations)
+    summary = {'skipped': skipped, 'built': time.time(), 'locations': len(locations)}
+    for family, table in ranges.items():
+        table.sort()
+        disjoint = []
+        for start, end, value in table:
+            if disjoint and start <= disjoint[-1][1]:
+                skipped += 1
+                continue
+            disjoint.append((start, end, value))
+        write_range_table(
+            os.path.join(index_dir, f'geo-v{family}.thr'),
+            width=FAMILIES[family][1] // 8,
+            starts=[r[0] for r in disjoint],
+            ends=[r[1] for r in disjoint],
+            values=[r[2] for r in disjoint],
+            tags=bytes(len(disjoint)),
+            payload=payload,
+        )
+        summary[f'v{family}'] = {'ranges': len(disjoint)}
+        log.debug(f"Wrote {len(disjoint)} IPv{family} geolocation ranges")
+    summary['skipped'] = skipped
+    with open(os.path.join(index_dir, 'geo.json'), 'w') as f:
+        json.dump(summary, f)
+    return summary
+
+def _string_table(locations):
+    # Payload layout: uint32 count, count + 1 uint32 offsets, UTF-8 strings
+    encoded = [location.encode('utf-8') for location in sorted(locations, key=locations.get)]
+    offsets = array('I', [0])
+    for string in encoded:
+        offsets.append(offsets[-1] + len(string))
+    return array('I', [len(encoded)]).tobytes() + offsets.tobytes() + b''.join(encoded)
+
+class _GeoTable(_RangeTable):
+    # This class adds the location strings stored in the payload of a
+    # geolocation table, see _string_table.
+    def __init__(self, path):
+        super().__init__(path)
+        count = self.payload[:4].cast('I')[0]
+        self.offsets = self.payload[4:8 + count * 4].cast('I')
+        self.strings = self.payload[8 + count * 4:]
+
+    def location(self, value):
+        """
+        Returns the fields of location number value, in GEO_FIELDS order.
+        """
+        return bytes(self.strings[self.offsets[value]:self.offsets[value + 1]]).decode('utf-8').split(FIELD_SEPARATOR)
+
+class _GeoIndex():
+    # This class answers geolocation lookups from the local geolocation tables.
+    def __init__(self, index_dir=None):
+        self.index_dir = index_dir or default_index_dir()
+        self.tables = {}
+        self.locations = {}
+
+    def _table(self, family):
+        table = self.tables.get(family)
+        if table is None:
+            path = os.path.join(self.index_dir, f'geo-v{family}.thr')
+            if not os.path.exists(path):
+                raise ThroneConfigError("No local geolocation database found. Run `throne ip geo-index build FILE` first.")
+            table = self.tables[family] = _GeoTable(path)
+        return table
+
+    def _location(self, family, value):
+        # Decoded locations are kept, since many ranges share a location
+        location = self.locations.get((family, value))
+        if location is None:
+            location = dict(zip(GEO_FIELDS, self.tables[family].location(value)))
+            for field in ('lat', 'lon'):
+                location[field] = float(location[field]) if location[field] else None
+            self.locations[(family, value)] = location
+        return location
+
+    def lookup(self, address):
+        """
+        Returns an ip-api style record for an address.
+        """
+        family, number = parse_address(address)
+        if family == 6 and _MAPPED_V4 <= number <= _MAPPED_V4 | 0xFFFFFFFF:
+            family, number = 4, number - _MAPPED_V4
+        table = self._table(family)
+        index = table.find(number)
+        if index < 0:
+            return {'query': address, 'status': 'fail', 'message': 'not in the local geolocation database'}
+        return dict(self._location(family, table.values[index]), query=address, status='success')
+
+    def info(self):
+        try:
+            with open(os.path.join(self.index_dir, 'geo.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ThroneConfigError("No local geolocation database found. Run `throne ip geo-index build FILE` first.")
+
+_geo_index = None
+
+def get_geo_index():
+    """
+    Returns the process-wide geolocation index, opening it on first use.
+    """
+    global _geo_index
+    if _geo_index is None or _geo_index.index_dir != default_index_dir():
+        _geo_index = _GeoIndex()
+    return _geo_index
@@ -3,33 +3,159 @@
 
 
 # Import Third Party Modules
+import asyncio
 import json
-import urllib3
-import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 # Import Throne Modules
 from src.exceptions import ThroneHTTPError
+from src.parsers.transport import get_transport
+from src.parsers.response_cache import get_cache
+from src.parsers.singleflight import get_singleflight
+from src.parsers import json_stream
+from src.parsers.timings import get_timings
 
 # Set log variable for verbose output
 log = logging.getLogger(__name__)
 
-# Set python check interval to 1, hopefully to improve performance
-sys.setswitchinterval(1)
+# Worker threads shared by every AsyncJSONRequest, so concurrent event loops
+# (e.g. one per batch worker) do not each spin up their own executor.
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='throne-io')
+
+# Size of the reads used when streaming a response
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Decode timings for `throne --timings`
+timings = get_timings()
+
+def _decode(data):
+    # json.loads decodes UTF-8 bytes itself, which saves a full copy of the
+    # body. Invalid UTF-8 falls back to dropping the bad bytes.
+    try:
+        return json.loads(data)
+    except UnicodeDecodeError:
+        return json.loads(data.decode('utf-8', 'ignore'))
+
+def _loads(data, url, cached=False):
+    if not timings.enabled:
+        return _decode(data)
+    with timings.span('decode', host=urlsplit(url).hostname, bytes=len(data), cached=cached):
+        return _decode(data)
 
 class _JSONRequest():
     # This class is used to get JSON data from a specified URL.
     def __init__(self):
-        self.http = urllib3.PoolManager()
+        self.http = get_transport()
+        self.cache = get_cache()
+        self.flights = get_singleflight()
     # This function is what actually gets the URL data.
-    def get_json(self, url=None):
-        conn = self.http.request('GET', url)
+    def get_json(self, url=None, headers=None, use_cache=True):
+        # Identical requests already in flight on another thread are
+        # answered by that request. Each caller decodes its own copy of
+        # the body, so nobody shares mutable results.
+        parts = urlsplit(url)
+        key = (url, tuple(sorted((headers or {}).items())), use_cache)
+        data, cached = self.flights.do(
+            key, lambda: self._get(url, headers, use_cache),
+            endpoint=f'{parts.hostname}{parts.path}', host=parts.hostname, path=parts.path,
+        )
+        return _loads(data, url, cached=cached)
+
+    def _get(self, url, headers, use_cache):
+        # Returns (body, cached) of a 200 OK response
+        # Serve the response from the on-disk cache if we have a fresh copy
+        data = self.cache.get(url) if use_cache else None
+        if data is not None:
+            return data, True
+        conn = self.http.request('GET', url, headers=headers)
         data = conn.data
         # Only return JSON data if we get a HTTP Status Code: 200 OK
         if conn.status == 200:
             log.debug(f"Received HTTP/200 from {url}, loading JSON data...")
-            d = json.loads(data.decode('utf-8', 'ignore'))
-            return d
+            if use_cache:
+                self.cache.set(url, data)
+            return data, False
         else:
             # Raise an HTTP error if response isn't 200 OK
             log.debug(f"Received HTTP/{conn.status} from {url}...raising exception")
-            raise ThroneHTTPError(f"{conn.status}\n{url}")
\ No newline at end of file
+            raise ThroneHTTPError(f"{conn.status}\n{url}")
+
+    def iter_json(self, url=None, path=(), headers=None, use_cache=True):
+        """
+        Yields the items of the array at path (a sequence of object keys) in
+        the response while it downloads, so large responses never have to
+        fit in memory. Streamed responses are not stored in the cache.
+        """
+        data = self.cache.get(url) if use_cache else None
+        if data is not None:
+            yield from json_stream.find_array(_loads(data, url, cached=True), path)
+            return
+        conn = self.http.request('GET', url, headers=headers, preload_content=False)
+        if conn.status != 200:
+            conn.drain_conn()
+            conn.release_conn()
+            log.debug(f"Received HTTP/{conn.status} from {url}...raising exception")
+            raise ThroneHTTPError(f"{conn.status}\n{url}")
+        log.debug(f"Received HTTP/200 from {url}, streaming JSON data...")
+        finished = False
+        try:
+            yield from json_stream.iter_array(conn.stream(STREAM_CHUNK_SIZE), path)
+            finished = True
+        finally:
+            # Only the closing bytes are left after the array; anything more
+            # (the caller stopped early) is cheaper to drop with the connection
+            if finished:
+                conn.drain_conn()
+            else:
+                conn.close()
+            conn.release_conn()
+
+    # POSTs a JSON document and returns the decoded response. Never cached.
+    def post_json(self, url, payload, headers=None):
+        headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        conn = self.http.request('POST', url, headers=headers, body=json.dumps(payload).encode('utf-8'))
+        if conn.status == 200:
+            log.debug(f"Received HTTP/200 from {url}, loading JSON data...")
+            return _loads(conn.data, url)
+        log.debug(f"Received HTTP/{conn.status} from {url}...raising exception")
+        raise ThroneHTTPError(f"{conn.status}\n{url}")
+
+class AsyncJSONRequest():
+    # asyncio counterpart of _JSONRequest. Requests run on the shared pooled
+    # transport in worker threads, at most `limit` of them at once.
+    def __init__(self, limit=8):
+        self.limit = limit
+        self.json_request = _JSONRequest()
+        self.semaphore = None
+
+    async def get_json(self, url=None, headers=None):
+        # The semaphore has to be created inside the running event loop
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.limit)
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_executor, self.json_request.get_json, url, headers)
+
+    async def gather_json(self, urls, return_exceptions=False):
+        """
+        Fetches every URL concurrently and returns the results in order.
+        Each entry is either a URL or a (url, headers) tuple.
+        """
+        # Duplicates are fetched once, before they could take a slot of
+        # the semaphore just to wait for each other
+        requests = []
+        indexes = {}
+        order = []
+        for url in urls:
+            url, headers = url if isinstance(url, tuple) else (url, None)
+            key = (url, tuple(sorted((headers or {}).items())))
+            if key in indexes:
+                parts = urlsplit(url)
+                get_singleflight().shared(f'{parts.hostname}{parts.path}', host=parts.hostname, path=parts.path)
+            else:
+                indexes[key] = len(requests)
+                requests.append(self.get_json(url=url, headers=headers))
+            order.append(indexes[key])
+        results = await asyncio.gather(*requests, return_exceptions=return_exceptions)
+        return [results[index] for index in order]
@@ -0,0 +1,152 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import codecs
+import json
+import logging
+import re
+# Import Throne Modules
+from src.exceptions import ThroneParsingError
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER_CHARS = '0123456789.eE+-'
+
+# Consumed text is dropped from the buffer once this much has piled up
+TRIM_SIZE = 1 << 20
+
+class _Incomplete(Exception):
+    # Raised internally when the buffer ends before the next token does.
+    pass
+
+class _ArrayStream():
+    # This class finds an array inside a JSON document that arrives in
+    # chunks and yields its items one at a time. Only the item being decoded
+    # and whatever precedes the array are held in memory.
+    def __init__(self, chunks, path):
+        self.chunks = iter(chunks)
+        self.path = tuple(path)
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self.buffer = ''
+        self.pos = 0
+        self.done = False
+        # Size the buffer has to reach before a failed decode is retried
+        self.retry_at = 0
+
+    def _read(self):
+        # Appends at least one more chunk, or returns False at the end
+        if self.done:
+            return False
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.done = True
+            self.buffer += self.text_decoder.decode(b'', final=True)
+            return False
+        if self.pos > TRIM_SIZE:
+            self.buffer = self.buffer[self.pos:]
+            self.retry_at -= self.pos
+            self.pos = 0
+        self.buffer += self.text_decoder.decode(chunk)
+        return True
+
+    def _more(self):
+        # Reads until the buffer has doubled, so retrying a large value
+        # after every small chunk does not turn quadratic.
+        target = max(self.retry_at, len(self.buffer) + 1)
+        read = False
+        while len(self.buffer) < target and self._read():
+            read = True
+        self.retry_at = len(self.buffer) * 2 - self.pos
+        return read
+
+    def _peek(self):
+        # Returns the next non-whitespace character without consuming it
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                raise ThroneParsingError("Unexpected end of JSON response.")
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ThroneParsingError(f"Unexpected {char!r} in JSON response, expected one of {chars!r}.")
+        self.pos += 1
+        return char
+
+    def _value(self):
+        # Decodes the next complete value, reading more data as needed
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                if not self.done and self._truncated(value, end):
+                    raise _Incomplete()
+                self.pos = end
+                self.retry_at = 0
+                return value
+            except (json.JSONDecodeError, _Incomplete) as e:
+                if not self._more():
+                    if isinstance(e, _Incomplete):
+                        continue
+                    raise ThroneParsingError(f"Unable to parse JSON response: {e}")
+
+    def _truncated(self, value, end):
+        # A number at the end of the buffer may still be growing, e.g. `-2.`
+        # decodes as -2 until the next chunk brings the rest
+        if end == len(self.buffer):
+            return True
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        while end < len(self.buffer) and self.buffer[end] in NUMBER_CHARS:
+            end += 1
+        return end == len(self.buffer)
+
+    def _descend(self, key):
+        # Moves past the members of the current object up to `key`
+        self._expect('{')
+        if self._peek() == '}':
+            raise ThroneParsingError(f"JSON response has no {key!r} member.")
+        while True:
+            name = self._value()
+            self._expect(':')
+            if name == key:
+                return
+            self._value()
+            if self._expect(',}') == '}':
+                raise ThroneParsingError(f"JSON response has no {key!r} member.")
+
+    def __iter__(self):
+        for key in self.path:
+            self._descend(key)
+        self._expect('[')
+        if self._peek() == ']':
+            return
+        while True:
+            yield self._value()
+            if self._expect(',]') == ']':
+                return
+
+def iter_array(chunks, path):
+    """
+    Yields the items of the array found by following the object keys in
+    path through a JSON document given as an iterable of byte chunks.
+    """
+    return iter(_ArrayStream(chunks, path))
+
+def find_array(document, path):
+    """
+    Returns the array at path in an already decoded document.
+    """
+    for key in path:
+        try:
+            document = document[key]
+        except (KeyError, TypeError):
+            raise ThroneParsingError(f"JSON response has no {key!r} member.")
+    return document
@@ -3,154 +3,134 @@
 
 # Import Third Party Modules
 import logging
+import re
+from array import array
+from operator import itemgetter
 # Import Throne Modules
-
+from src.parsers.timings import timed
 
 # Set log variable for verbose output
 log = logging.getLogger(__name__)
 
+# Short location codes accepted by `bgp lg --location` and the text each one
+# matches in the RIS collector location. Any RRC id (e.g. RRC00) or other
+# text from the location works as well.
+LOCATION_CODES = {
+    'US-NY': 'New York',
+    'US-FL': 'Florida',
+    'US-CA': 'California',
+    'UK': 'United Kingdom',
+    'NL': 'Netherlands',
+    'SG': 'Singapore',
+    'DE': 'Germany',
+    'ZA': 'South Africa',
+    'JP': 'Japan',
+}
+
+RRC_ID = re.compile(r'^RRC\d+$', re.IGNORECASE)
+
+# Per peer string fields, kept as parallel lists next to the numeric columns.
+# `as_path` is the path as RIS sent it, for display; the numeric paths are
+# what the analysis uses.
+PEER_FIELDS = ('peer', 'prefix', 'origin', 'next_hop', 'as_path', 'community', 'last_updated', 'latest_time')
+
+def _as_number(token):
+    # AS sets like {64496,64497} count as their first member in the numeric
+    # paths
+    token = token.strip('{}').split(',')[0]
+    return int(token) if token.isdigit() else 0
+
+def _as_path(as_path):
+    try:
+        return array('I', map(int, as_path.split()))
+    except ValueError:
+        return array('I', map(_as_number, as_path.split()))
+
 class _LGParse():
+    # This class keeps every peer of every RIS collector from a looking-glass
+    # response in columns. Peers are stored grouped by collector, so each
+    # collector is a slice of the columns.
     def __init__(self, json_result):
         self.json = json_result
         self.vars = {
             'cached': None,
-            'data': {},
             'query_info': {}
         }
-    
+        self.rrcs = []
+        self.rrc_starts = array('I')
+        self.origin_as = array('I')
+        self.path_lengths = array('H')
+        self.path_starts = array('I')
+        self.paths = array('I')
+        self.columns = {field: [] for field in PEER_FIELDS}
+        self._views = {}
+
+    @timed('parse')
     def parse(self):
-        self.vars['cached'] = self.json['cached']
-        self.vars['query_info'].update({
-            'status': None,
-            'time': None,
-            'query_time': None,
-            'data_last_update': None
-        })
-        self.vars['query_info']['status'] = self.json['status']
-        self.vars['query_info']['time'] = self.json['time']
-        self.vars['query_info']['query_time'] = self.json['data']['query_time']
-        self.vars['query_info']['latest_poll'] = self.json['data']['latest_time']
+        self.vars['cached'] = self.json.get('cached')
+        self.vars['query_info'] = {
+            'status': self.json['status'],
+            'time': self.json['time'],
+            'query_time': self.json['data']['query_time'],
+            'latest_poll': self.json['data']['latest_time'],
+        }
+        columns = [self.columns[field] for field in PEER_FIELDS]
+        fields = itemgetter(*PEER_FIELDS)
+        for rrc in self.json['data']['rrcs']:
+            self.rrcs.append((rrc['rrc'], rrc['location']))
+            self.rrc_starts.append(len(self.origin_as))
+            for peer in rrc['peers']:
+                path = _as_path(peer['as_path'])
+                self.origin_as.append(_as_number(str(peer['asn_origin'])))
+                self.path_starts.append(len(self.paths))
+                self.path_lengths.append(len(path))
+                self.paths.extend(path)
+                for column, value in zip(columns, fields(peer)):
+                    column.append(value)
+        self.rrc_starts.append(len(self.origin_as))
+        log.debug(f"Parsed {len(self.origin_as)} peers from {len(self.rrcs)} collectors")
+        return self
+
+    def __len__(self):
+        return len(self.origin_as)
+
+    def as_path(self, index):
+        start = self.path_starts[index]
+        return self.paths[start:start + self.path_lengths[index]]
+
+    def peer(self, index):
+        """
+        Returns one peer's route as a dict.
+        """
+        route = {field: self.columns[field][index] for field in PEER_FIELDS}
+        route['origin_as'] = self.origin_as[index]
+        return route
 
-        self.vars['data'].update({
-            'US-NY': {},
-            'US-FL': {},
-            'US-CA': {},
-            'UK': {},
-            'NL': {},
-            'SG': {},
-            'DE': {},
-            'ZA': {},
-            'JP': {}
-        })
-        
-        for entries in self.json['data']['rrcs']:
-            location = entries['location']
-            origin_as = entries['peers'][0]['asn_origin']
-            as_path = entries['peers'][0]['as_path']
-            communities = entries['peers'][0]['community']
-            last_updated = entries['peers'][0]['last_updated']
-            prefix = entries['peers'][0]['prefix']
-            peer = entries['peers'][0]['peer']
-            origin = entries['peers'][0]['origin']
-            next_hop = entries['peers'][0]['next_hop']
-            latest_poll = entries['peers'][0]['latest_time']
-            if "New York" in entries['location']:
-                self.vars['data']['US-NY']['location'] = location
-                self.vars['data']['US-NY']['origin_as'] = origin_as
-                self.vars['data']['US-NY']['as_path'] = as_path
-                self.vars['data']['US-NY']['communities'] = communities
-                self.vars['data']['US-NY']['last_updated'] = last_updated
-                self.vars['data']['US-NY']['prefix'] = prefix
-                self.vars['data']['US-NY']['peer'] = peer
-                self.vars['data']['US-NY']['origin'] = origin
-                self.vars['data']['US-NY']['next_hop'] = next_hop
-                self.vars['data']['US-NY']['latest_poll'] = latest_poll
-            if "Florida" in entries['location']:
-                self.vars['data']['US-FL']['location'] = location
-                self.vars['data']['US-FL']['origin_as'] = origin_as
-                self.vars['data']['US-FL']['as_path'] = as_path
-                self.vars['data']['US-FL']['communities'] = communities
-                self.vars['data']['US-FL']['last_updated'] = last_updated
-                self.vars['data']['US-FL']['prefix'] = prefix
-                self.vars['data']['US-FL']['peer'] = peer
-                self.vars['data']['US-FL']['origin'] = origin
-                self.vars['data']['US-FL']['next_hop'] = next_hop
-                self.vars['data']['US-FL']['latest_poll'] = latest_poll
-            if "California" in entries['location']:
-                self.vars['data']['US-CA']['location'] = location
-                self.vars['data']['US-CA']['origin_as'] = origin_as
-                self.vars['data']['US-CA']['as_path'] = as_path
-                self.vars['data']['US-CA']['communities'] = communities
-                self.vars['data']['US-CA']['last_updated'] = last_updated
-                self.vars['data']['US-CA']['prefix'] = prefix
-                self.vars['data']['US-CA']['peer'] = peer
-                self.vars['data']['US-CA']['origin'] = origin
-                self.vars['data']['US-CA']['next_hop'] = next_hop
-                self.vars['data']['US-CA']['latest_poll'] = latest_poll
-            if "United Kingdom" in entries['location']:
-                self.vars['data']['UK']['location'] = location
-                self.vars['data']['UK']['origin_as'] = origin_as
-                self.vars['data']['UK']['as_path'] = as_path
-                self.vars['data']['UK']['communities'] = communities
-                self.vars['data']['UK']['last_updated'] = last_updated
-                self.vars['data']['UK']['prefix'] = prefix
-                self.vars['data']['UK']['peer'] = peer
-                self.vars['data']['UK']['origin'] = origin
-                self.vars['data']['UK']['next_hop'] = next_hop
-                self.vars['data']['UK']['latest_poll'] = latest_poll
-            if "Netherlands" in entries['location']:
-                self.vars['data']['NL']['location'] = location
-                self.vars['data']['NL']['origin_as'] = origin_as
-                self.vars['data']['NL']['as_path'] = as_path
-                self.vars['data']['NL']['communities'] = communities
-                self.vars['data']['NL']['last_updated'] = last_updated
-                self.vars['data']['NL']['prefix'] = prefix
-                self.vars['data']['NL']['peer'] = peer
-                self.vars['data']['NL']['origin'] = origin
-                self.vars['data']['NL']['next_hop'] = next_hop
-                self.vars['data']['NL']['latest_poll'] = latest_poll
-            if "Singapore" in entries['location']:
-                self.vars['data']['SG']['location'] = location
-                self.vars['data']['SG']['origin_as'] = origin_as
-                self.vars['data']['SG']['as_path'] = as_path
-                self.vars['data']['SG']['communities'] = communities
-                self.vars['data']['SG']['last_updated'] = last_updated
-                self.vars['data']['SG']['prefix'] = prefix
-                self.vars['data']['SG']['peer'] = peer
-                self.vars['data']['SG']['origin'] = origin
-                self.vars['data']['SG']['next_hop'] = next_hop
-                self.vars['data']['SG']['latest_poll'] = latest_poll
-            if "Germany" in entries['location']:
-                self.vars['data']['DE']['location'] = location
-                self.vars['data']['DE']['origin_as'] = origin_as
-                self.vars['data']['DE']['as_path'] = as_path
-                self.vars['data']['DE']['communities'] = communities
-                self.vars['data']['DE']['last_updated'] = last_updated
-                self.vars['data']['DE']['prefix'] = prefix
-                self.vars['data']['DE']['peer'] = peer
-                self.vars['data']['DE']['origin'] = origin
-                self.vars['data']['DE']['next_hop'] = next_hop
-                self.vars['data']['DE']['latest_poll'] = latest_poll
-            if "South Africa" in entries['location']:
-                self.vars['data']['ZA']['location'] = location
-                self.vars['data']['ZA']['origin_as'] = origin_as
-                self.vars['data']['ZA']['as_path'] = as_path
-                self.vars['data']['ZA']['communities'] = communities
-                self.vars['data']['ZA']['last_updated'] = last_updated
-                self.vars['data']['ZA']['prefix'] = prefix
-                self.vars['data']['ZA']['peer'] = peer
-                self.vars['data']['ZA']['origin'] = origin
-                self.vars['data']['ZA']['next_hop'] = next_hop
-                self.vars['data']['ZA']['latest_poll'] = latest_poll
-            if "Japan" in entries['location']:
-                self.vars['data']['JP']['location'] = location
-                self.vars['data']['JP']['origin_as'] = origin_as
-                self.vars['data']['JP']['as_path'] = as_path
-                self.vars['data']['JP']['communities'] = communities
-                self.vars['data']['JP']['last_updated'] = last_updated
-                self.vars['data']['JP']['prefix'] = prefix
-                self.vars['data']['JP']['peer'] = peer
-                self.vars['data']['JP']['origin'] = origin
-                self.vars['data']['JP']['next_hop'] = next_hop
-                self.vars['data']['JP']['latest_poll'] = latest_poll
-        
\ No newline at end of file
+    def _matches(self, location):
+        # Returns the indexes of the collectors a --location value selects
+        if location.upper() in LOCATION_CODES:
+            text = LOCATION_CODES[location.upper()]
+            return [i for i, (rrc, name) in enumerate(self.rrcs) if text in name]
+        if RRC_ID.match(location):
+            return [i for i, (rrc, name) in enumerate(self.rrcs) if rrc.upper() == location.upper()]
+        return [i for i, (rrc, name) in enumerate(self.rrcs) if location.lower() in name.lower()]
+
+    def view(self, location=None):
+        """
+        Returns [(rrc, location, peer indexes)] for the collectors matching a
+        location code, RRC id or location text, or for every collector.
+        Views are built on first use.
+        """
+        if location not in self._views:
+            selected = range(len(self.rrcs)) if location is None else self._matches(location)
+            self._views[location] = [
+                (*self.rrcs[i], range(self.rrc_starts[i], self.rrc_starts[i + 1])) for i in selected
+            ]
+        return self._views[location]
+
+    def to_dict(self):
+        data = {
+            rrc: {'location': name, 'peers': [self.peer(i) for i in peers]}
+            for rrc, name, peers in self.view()
+        }
+        return dict(self.vars, data=data)
@@ -0,0 +1,197 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import json
+import logging
+import os
+import sqlite3
+import time
+# Import Throne Modules
+from src.parsers import json_request
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Get home directory
+home = os.path.expanduser("~")
+MIRROR_DB = f'{home}/.throne/peeringdb.sqlite3'
+
+PDB_API = "https://www.peeringdb.com/api/"
+
+# PeeringDB objects that are mirrored and the fields that get their own
+# indexed column. Everything else is kept in the JSON `data` column.
+PDB_OBJECTS = {
+    'org': ('name',),
+    'net': ('asn', 'org_id', 'name'),
+    'ix': ('org_id', 'name'),
+    'ixlan': ('ix_id',),
+    'ixpfx': ('ixlan_id',),
+    'netixlan': ('net_id', 'ix_id', 'asn'),
+    'fac': ('org_id', 'name'),
+    'netfac': ('net_id', 'fac_id'),
+}
+
+# Fields covered by the full-text index used for name searches
+PDB_SEARCH_FIELDS = {
+    'org': ('name', 'aka'),
+    'ix': ('name', 'name_long', 'aka'),
+    'fac': ('name', 'aka'),
+}
+
+# First SQLite release with the FTS5 trigram tokenizer
+TRIGRAM_SQLITE = (3, 34, 0)
+
+# Fetch changes slightly older than the last sync to cover clock skew
+SYNC_OVERLAP = 300
+
+# Rows written per executemany while streaming a sync
+SYNC_BATCH_SIZE = 1000
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class _PDBMirror():
+    # This class keeps a local SQLite copy of the PeeringDB objects throne uses.
+    def __init__(self, path=MIRROR_DB):
+        self.path = path
+        self._db = None
+        # Whether the name indexes are FTS5 trigram tables, see _create_tables
+        self.trigram = False
+
+    def exists(self):
+        return os.path.exists(self.path) and self.last_sync('net') is not None
+
+    @property
+    def db(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._create_tables()
+        return self._db
+
+    def _create_tables(self):
+        self.db.execute('CREATE TABLE IF NOT EXISTS sync (obj TEXT PRIMARY KEY, last_sync INTEGER NOT NULL, rows INTEGER NOT NULL)')
+        for obj, columns in PDB_OBJECTS.items():
+            column_sql = ''.join(f', {column}' for column in columns)
+            self.db.execute(f'CREATE TABLE IF NOT EXISTS {obj} (id INTEGER PRIMARY KEY, status TEXT, updated TEXT{column_sql}, data TEXT NOT NULL)')
+            for column in columns:
+                self.db.execute(f'CREATE INDEX IF NOT EXISTS {obj}_{column} ON {obj} ({column})')
+        for obj, fields in PDB_SEARCH_FIELDS.items():
+            self._create_search_table(obj, fields)
+        self.db.commit()
+
+    def _create_search_table(self, obj, fields):
+        # SQLite before 3.34 (or built without FTS5) has no trigram
+        # tokenizer, the names then go in a plain table searched with LIKE
+        row = self.db.execute("SELECT sql FROM sqlite_master WHERE name = ?", (f'{obj}_fts',)).fetchone()
+        if row is not None:
+            self.trigram = 'trigram' in row[0]
+            return
+        self.trigram = sqlite3.sqlite_version_info >= TRIGRAM_SQLITE
+        if self.trigram:
+            try:
+                self.db.execute(f"CREATE VIRTUAL TABLE {obj}_fts USING fts5({', '.join(fields)}, tokenize='trigram')")
+                return
+            except sqlite3.OperationalError as e:
+                log.debug(f"No trigram index for PeeringDB {obj} names: {e}")
+                self.trigram = False
+        self.db.execute(f"CREATE TABLE {obj}_fts (rowid INTEGER PRIMARY KEY, {', '.join(fields)})")
+
+    def last_sync(self, obj):
+        try:
+            row = self.db.execute('SELECT last_sync FROM sync WHERE obj = ?', (obj,)).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def _store(self, obj, rows):
+        columns = PDB_OBJECTS[obj]
+        placeholders = ', '.join('?' * (len(columns) + 4))
+        insert = f"INSERT OR REPLACE INTO {obj} (id, status, updated, {', '.join(columns)}, data) VALUES ({placeholders})"
+        self.db.executemany(insert, (
+            (row['id'], row.get('status'), row.get('updated'), *(row.get(c) for c in columns), json.dumps(row))
+            for row in rows
+        ))
+        fields = PDB_SEARCH_FIELDS.get(obj)
+        if fields:
+            self.db.executemany(f'DELETE FROM {obj}_fts WHERE rowid = ?', ((row['id'],) for row in rows))
+            self.db.executemany(
+                f"INSERT INTO {obj}_fts (rowid, {', '.join(fields)}) VALUES ({', '.join('?' * (len(fields) + 1))})",
+                ((row['id'], *(row.get(f) or '' for f in fields)) for row in rows if row.get('status') == 'ok')
+            )
+
+    def sync(self, full=False):
+        """
+        Downloads every mirrored object type, or only what changed since the
+        previous sync. Returns {obj: number of rows received}.
+        """
+        counts = {}
+        for obj in PDB_OBJECTS:
+            started = int(time.time())
+            since = None if full else self.last_sync(obj)
+            if since is None:
+                url = f'{PDB_API}{obj}?depth=0'
+            else:
+                url = f'{PDB_API}{obj}?depth=0&since={since - SYNC_OVERLAP}'
+            log.debug(f"Syncing PeeringDB {obj} from {url}")
+            # Full lists like netixlan are large, so rows are stored in
+            # batches while the response is still downloading
+            rows = json_request._JSONRequest().iter_json(url=url, path=('data',), use_cache=False)
+            received = 0
+            with self.db:
+                if since is None:
+                    self.db.execute(f'DELETE FROM {obj}')
+                    if obj in PDB_SEARCH_FIELDS:
+                        self.db.execute(f'DELETE FROM {obj}_fts')
+                for batch in _batches(rows, SYNC_BATCH_SIZE):
+                    self._store(obj, batch)
+                    received += len(batch)
+                total = self.db.execute(f"SELECT COUNT(*) FROM {obj} WHERE status = 'ok'").fetchone()[0]
+                self.db.execute('INSERT OR REPLACE INTO sync (obj, last_sync, rows) VALUES (?, ?, ?)', (obj, started, total))
+            counts[obj] = received
+        return counts
+
+    def stats(self):
+        return self.db.execute('SELECT obj, last_sync, rows FROM sync ORDER BY obj').fetchall()
+
+    def org_by_asn(self, asn):
+        """
+        Returns the organization that operates the network with this ASN.
+        """
+        row = self.db.execute(
+            "SELECT org.data FROM net JOIN org ON org.id = net.org_id "
+            "WHERE net.asn = ? AND net.status = 'ok' AND org.status = 'ok'", (int(asn),)
+        ).fetchone()
+        return [json.loads(row[0])] if row else []
+
+    def search(self, obj, query, limit):
+        """
+        Substring search over an object's names, like PeeringDB's name_search.
+        """
+        # Opening the mirror tells whether it has a trigram index
+        db = self.db
+        if self.trigram and len(query) >= 3:
+            # The trigram index answers substring matches of three or more characters
+            rows = db.execute(
+                f"SELECT {obj}.data FROM {obj}_fts JOIN {obj} ON {obj}.id = {obj}_fts.rowid "
+                f"WHERE {obj}_fts MATCH ? AND {obj}.status = 'ok' ORDER BY {obj}.id LIMIT ?",
+                ('"' + query.replace('"', '""') + '"', limit)
+            ).fetchall()
+        else:
+            like = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions = ' OR '.join(f"{obj}_fts.{field} LIKE ? ESCAPE '\\'" for field in PDB_SEARCH_FIELDS[obj])
+            rows = db.execute(
+                f"SELECT {obj}.data FROM {obj}_fts JOIN {obj} ON {obj}.id = {obj}_fts.rowid "
+                f"WHERE ({conditions}) AND {obj}.status = 'ok' ORDER BY {obj}.id LIMIT ?",
+                (*([like] * len(PDB_SEARCH_FIELDS[obj])), limit)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
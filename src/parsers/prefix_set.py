@@ -0,0 +1,170 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import heapq
+import logging
+from array import array
+# Import Throne Modules
+from src.parsers.route_index import FAMILIES, format_prefix, parse_prefix
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# IPv6 networks are stored as two 64-bit halves, see range_table
+LOW_MASK = 0xFFFFFFFFFFFFFFFF
+
+def _pack(family, networks):
+    if family == 4:
+        return array('I', networks)
+    packed = array('Q')
+    for network in networks:
+        packed.append(network >> 64)
+        packed.append(network & LOW_MASK)
+    return packed
+
+def _unpack(family, packed):
+    if family == 4:
+        return iter(packed)
+    return ((packed[i] << 64) | packed[i + 1] for i in range(0, len(packed), 2))
+
+def _merge(ranges):
+    # Coalesces (start, end) ranges sorted by start into disjoint ones,
+    # joining ranges that overlap or touch
+    merged = None
+    for start, end in ranges:
+        if merged is None:
+            merged = [start, end]
+        elif start <= merged[1] + 1:
+            merged[1] = max(merged[1], end)
+        else:
+            yield tuple(merged)
+            merged = [start, end]
+    if merged is not None:
+        yield tuple(merged)
+
+def _intersect(a, b):
+    # Both sorted and disjoint, so every overlap is found in one pass
+    a, b = iter(a), iter(b)
+    x, y = next(a, None), next(b, None)
+    while x is not None and y is not None:
+        start, end = max(x[0], y[0]), min(x[1], y[1])
+        if start <= end:
+            yield start, end
+        if x[1] < y[1]:
+            x = next(a, None)
+        else:
+            y = next(b, None)
+
+def _subtract(a, b):
+    b = iter(b)
+    y = next(b, None)
+    for start, end in a:
+        while y is not None and y[1] < start:
+            y = next(b, None)
+        while y is not None and y[0] <= end:
+            if y[0] > start:
+                yield start, y[0] - 1
+            start = max(start, y[1] + 1)
+            if y[1] > end:
+                break
+            y = next(b, None)
+        if start <= end:
+            yield start, end
+
+def _cidrs(family, start, end):
+    # The fewest prefixes covering exactly start to end
+    bits = FAMILIES[family][1]
+    while start <= end:
+        # Widest block aligned at start that does not run past end
+        size = (start & -start) or (1 << bits)
+        while size > end - start + 1:
+            size >>= 1
+        yield start, bits - size.bit_length() + 1
+        start += size
+
+class _PrefixSet():
+    # This class holds a set of IPv4 and IPv6 prefixes as sorted arrays of
+    # packed networks and lengths, a few bytes per prefix instead of a dict
+    # or string each. Being sorted, the address space it covers is a single
+    # pass away, so aggregation and set operations between two sets take
+    # time linear in their sizes.
+    def __init__(self, prefixes=()):
+        parsed = {4: set(), 6: set()}
+        for prefix in prefixes:
+            family, network, length = parse_prefix(prefix)
+            parsed[family].add((network, length))
+        self.networks = {}
+        self.lengths = {}
+        for family, entries in parsed.items():
+            self._store(family, sorted(entries))
+
+    def _store(self, family, entries):
+        # entries are (network, length), sorted and unique
+        self.networks[family] = _pack(family, (network for network, _ in entries))
+        self.lengths[family] = array('B', (length for _, length in entries))
+
+    @classmethod
+    def _from_ranges(cls, ranges):
+        """
+        Returns the smallest set of prefixes covering exactly the disjoint
+        sorted (start, end) ranges in ranges, by family.
+        """
+        prefix_set = cls()
+        for family, family_ranges in ranges.items():
+            prefix_set._store(family, [cidr for start, end in family_ranges for cidr in _cidrs(family, start, end)])
+        return prefix_set
+
+    def __len__(self):
+        return sum(len(lengths) for lengths in self.lengths.values())
+
+    def __iter__(self):
+        """
+        Yields (family, network, length), IPv4 first, in address order.
+        """
+        for family in FAMILIES:
+            for network, length in zip(_unpack(family, self.networks[family]), self.lengths[family]):
+                yield family, network, length
+
+    def prefixes(self):
+        return [format_prefix(family, network, length) for family, network, length in self]
+
+    def to_dict(self):
+        return {'prefixes': self.prefixes(), 'addresses': {f'v{family}': count for family, count in self.addresses().items()}}
+
+    def ranges(self, family):
+        """
+        Yields the disjoint (start, end) address ranges the prefixes of a
+        family cover, in order.
+        """
+        bits = FAMILIES[family][1]
+        return _merge(
+            (network, network | ((1 << (bits - length)) - 1))
+            for network, length in zip(_unpack(family, self.networks[family]), self.lengths[family])
+        )
+
+    def addresses(self):
+        """
+        Returns the number of addresses covered per family, counting
+        overlapping prefixes once.
+        """
+        return {family: sum(end - start + 1 for start, end in self.ranges(family)) for family in FAMILIES}
+
+    def aggregate(self):
+        """
+        Returns the smallest set of prefixes covering the same addresses:
+        covered prefixes are dropped and adjacent ones joined.
+        """
+        return self._from_ranges({family: self.ranges(family) for family in FAMILIES})
+
+    def union(self, other):
+        return self._from_ranges({
+            family: _merge(heapq.merge(self.ranges(family), other.ranges(family)))
+            for family in FAMILIES
+        })
+
+    def intersection(self, other):
+        return self._from_ranges({family: _intersect(self.ranges(family), other.ranges(family)) for family in FAMILIES})
+
+    def difference(self, other):
+        return self._from_ranges({family: _subtract(self.ranges(family), other.ranges(family)) for family in FAMILIES})
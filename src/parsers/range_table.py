@@ -0,0 +1,114 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+# Import Throne Modules
+from src.exceptions import ThroneConfigError
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# File layout (native byte order, every section 8-byte aligned):
+#   header   magic, version, byte order, address width (4 or 16), count, payload length
+#   starts   count x uint32 for IPv4, count x (uint64 high, uint64 low) for IPv6
+#   ends     same as starts, inclusive
+#   values   count x uint32
+#   tags     count x uint8
+#   payload  free-form bytes owned by the caller (e.g. a string table)
+MAGIC = b'THRT'
+VERSION = 1
+HEADER = struct.Struct('=4sHBBQQ')
+BYTE_ORDERS = {'little': 1, 'big': 2}
+
+def _pad(length):
+    return (8 - length % 8) % 8
+
+class _U128Sequence():
+    # Presents two uint64 columns as one sequence of 128-bit integers so
+    # bisect can search IPv6 ranges without materializing Python ints.
+    def __init__(self, high, low):
+        self.high = high
+        self.low = low
+
+    def __len__(self):
+        return len(self.high)
+
+    def __getitem__(self, index):
+        return (self.high[index] << 64) | self.low[index]
+
+def write_range_table(path, width, starts, ends, values, tags, payload=b''):
+    """
+    Writes sorted, non-overlapping inclusive ranges to path. The file is
+    written next to path and renamed, so readers never see a partial file.
+    """
+    count = len(starts)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDERS[sys.byteorder], width, count, len(payload)))
+        f.write(b'\0' * _pad(HEADER.size))
+        for column in (starts, ends):
+            if width == 4:
+                array('I', column).tofile(f)
+                f.write(b'\0' * _pad(count * 4))
+            else:
+                array('Q', (n >> 64 for n in column)).tofile(f)
+                array('Q', (n & 0xFFFFFFFFFFFFFFFF for n in column)).tofile(f)
+        array('I', values).tofile(f)
+        f.write(b'\0' * _pad(count * 4))
+        array('B', tags).tofile(f)
+        f.write(b'\0' * _pad(count))
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+class _RangeTable():
+    # This class memory maps a range table file and answers lookups with a
+    # binary search over the mapped pages, without copying them into RAM.
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mm)
+        magic, version, byte_order, width, count, payload_length = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ThroneConfigError(f"{path} is not a throne range table. Please rebuild it.")
+        if byte_order != BYTE_ORDERS[sys.byteorder]:
+            raise ThroneConfigError(f"{path} was built on a machine with a different byte order. Please rebuild it.")
+        self.width = width
+        self.count = count
+        offset = HEADER.size + _pad(HEADER.size)
+        columns = []
+        for _ in range(2):
+            if width == 4:
+                columns.append(view[offset:offset + count * 4].cast('I'))
+                offset += count * 4 + _pad(count * 4)
+            else:
+                high = view[offset:offset + count * 8].cast('Q')
+                offset += count * 8
+                low = view[offset:offset + count * 8].cast('Q')
+                offset += count * 8
+                columns.append(_U128Sequence(high, low))
+        self.starts, self.ends = columns
+        self.values = view[offset:offset + count * 4].cast('I')
+        offset += count * 4 + _pad(count * 4)
+        self.tags = view[offset:offset + count]
+        offset += count + _pad(count)
+        self.payload = view[offset:offset + payload_length]
+
+    def __len__(self):
+        return self.count
+
+    def find(self, address):
+        """
+        Returns the index of the range containing the integer address, or -1.
+        """
+        index = bisect_right(self.starts, address) - 1
+        if index >= 0 and address <= self.ends[index]:
+            return index
+        return -1
@@ -0,0 +1,198 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import atexit
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+# Import Throne Modules
+from src.config import load_config
+from src.exceptions import ThroneConfigError
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Sustained requests per second and burst size per upstream host. A key can
+# also be a host and path prefix for endpoints with their own limit. Hosts
+# that are not listed are not limited.
+RATE_LIMITS = {
+    'ip-api.com': {'rate': 45 / 60, 'burst': 45},
+    'ip-api.com/batch': {'rate': 15 / 60, 'burst': 15},
+    'api.shodan.io': {'rate': 1, 'burst': 1},
+    'www.peeringdb.com': {'rate': 20 / 60, 'burst': 20},
+    'stat.ripe.net': {'rate': 10, 'burst': 20},
+}
+
+# Retry settings for throttled (429) and temporarily unavailable responses
+RETRY_DEFAULTS = {
+    'attempts': 4,
+    'backoff': 1.0,
+    'max_backoff': 60.0,
+}
+RETRY_STATUSES = (429, 502, 503, 504)
+
+class _TokenBucket():
+    # A thread-safe token bucket. Callers reserve a token and are told how
+    # long to sleep for it, so waiting threads are served in order.
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def pause(self, seconds):
+        # Drains the bucket so nobody sends before the upstream allows it
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+def retry_after(value):
+    """
+    Returns the delay in seconds requested by a Retry-After header (either
+    delta-seconds or an HTTP date), or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class _RateLimiter():
+    # This class enforces the per-host limits and keeps throttling metrics.
+    def __init__(self, limits=None, retry=None):
+        self.limits = limits if limits is not None else RATE_LIMITS
+        self.retry = dict(RETRY_DEFAULTS, **(retry or {}))
+        self.buckets = {}
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def key(self, host, path=''):
+        """
+        Returns the limit a request counts against: the longest configured
+        host and path prefix it matches, otherwise the host itself.
+        """
+        target = f'{host}{path}'
+        matches = [key for key in self.limits if '/' in key and target.startswith(key)]
+        return max(matches, key=len) if matches else host
+
+    def _bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                limit = self.limits.get(host)
+                self.buckets[host] = _TokenBucket(limit['rate'], limit['burst']) if limit else None
+                self.metrics[host] = {'requests': 0, 'throttled': 0.0, 'retries': 0, 'backoff': 0.0}
+            return self.buckets[host]
+
+    def _count(self, host, key, value):
+        with self.lock:
+            self.metrics[host][key] += value
+
+    def wait(self, host):
+        """
+        Blocks until a request to host is allowed.
+        """
+        bucket = self._bucket(host)
+        self._count(host, 'requests', 1)
+        if bucket is None:
+            return
+        delay = bucket.reserve()
+        if delay > 0:
+            log.debug(f"Rate limiting {host} for {delay:.2f}s")
+            self._count(host, 'throttled', delay)
+            time.sleep(delay)
+
+    def backoff(self, host, attempt, header=None):
+        """
+        Returns how long to wait before retry number `attempt` (starting at 0),
+        honoring Retry-After and otherwise using jittered exponential backoff.
+        Other requests to the same host are held back for the same time.
+        """
+        delay = retry_after(header)
+        if delay is None:
+            ceiling = min(self.retry['max_backoff'], self.retry['backoff'] * (2 ** attempt))
+            delay = random.uniform(ceiling / 2, ceiling)
+        delay = min(delay, self.retry['max_backoff'])
+        bucket = self._bucket(host)
+        if bucket is not None:
+            bucket.pause(delay)
+        self._count(host, 'retries', 1)
+        self._count(host, 'backoff', delay)
+        return delay
+
+    def stats(self):
+        with self.lock:
+            return {host: dict(metrics) for host, metrics in self.metrics.items()}
+
+    def log_stats(self):
+        for host, metrics in self.stats().items():
+            if metrics['throttled'] or metrics['retries']:
+                log.debug(f"{host}: {format_stats(metrics)}")
+
+def format_stats(metrics):
+    return (
+        f"{metrics['requests']} requests, {metrics['throttled']:.2f}s throttled, "
+        f"{metrics['retries']} retries, {metrics['backoff']:.2f}s backing off"
+    )
+
+def _retry_settings(retry):
+    # Checks the `retry` section, `attempts` is a whole number of retries
+    # and the backoffs are seconds
+    settings = {}
+    for key, value in retry.items():
+        if key not in RETRY_DEFAULTS:
+            raise ThroneConfigError(f"Unknown setting retry.{key} in config.yml, use one of {', '.join(RETRY_DEFAULTS)}.")
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ThroneConfigError(f"retry.{key} in config.yml must be a number.")
+        if not number >= 0 or (key == 'attempts' and not number.is_integer()):
+            raise ThroneConfigError(f"retry.{key} in config.yml must be {'a whole number' if key == 'attempts' else 'a number'} of at least 0.")
+        settings[key] = int(number) if key == 'attempts' else number
+    return settings
+
+def load_rate_limiter():
+    """
+    Builds the rate limiter from the defaults and the `rate_limits` and
+    `retry` sections of config.yml.
+    """
+    config = load_config()
+    limits = dict(RATE_LIMITS)
+    overrides = config.get('rate_limits') or {}
+    retry = config.get('retry') or {}
+    if not isinstance(overrides, dict) or not isinstance(retry, dict):
+        raise ThroneConfigError("The `rate_limits` and `retry` sections in config.yml must be mappings.")
+    for host, limit in overrides.items():
+        # A null entry removes the limit for that host
+        if limit is None:
+            limits[host] = None
+            continue
+        if not isinstance(limit, dict) or 'rate' not in limit:
+            raise ThroneConfigError(f"rate_limits.{host} in config.yml must be null or a mapping with a `rate`.")
+        try:
+            rate, burst = float(limit['rate']), float(limit.get('burst', 1))
+        except (TypeError, ValueError):
+            raise ThroneConfigError(f"rate_limits.{host}.rate and burst in config.yml must be numbers.")
+        if rate <= 0 or burst < 1:
+            raise ThroneConfigError(f"rate_limits.{host} in config.yml needs a rate above 0 and a burst of at least 1.")
+        limits[host] = {'rate': rate, 'burst': burst}
+    limiter = _RateLimiter(limits=limits, retry=_retry_settings(retry))
+    atexit.register(limiter.log_stats)
+    return limiter
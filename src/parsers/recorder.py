@@ -0,0 +1,125 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from urllib3.response import HTTPResponse
+# Import Throne Modules
+from src.exceptions import ThroneLookupFailed
+from src.parsers.response_cache import normalize_url
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Response headers kept with a recording; everything else is dropped
+RECORDED_HEADERS = ('content-type', 'retry-after')
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def request_key(method, url, body=None):
+    """
+    Returns the key an exchange is stored under: the method, the URL without
+    API keys (see normalize_url) and a hash of the request body.
+    """
+    request = f"{method.upper()} {normalize_url(url)} {_sha256(body or b'')}"
+    return _sha256(request.encode('utf-8'))
+
+def _write_atomic(path, data):
+    # Other processes recording into the same directory never see half a file
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(temp, path)
+
+class _Recorder():
+    # This class writes every upstream exchange to a content-addressed store
+    # or serves them back from one. Response bodies are stored once per
+    # content hash under bodies/, and requests/<key>.json lists the
+    # exchanges seen for a request in the order they happened. On replay the
+    # n-th identical request gets the n-th recorded response, the last one
+    # repeating once they run out, so repeated polls replay as recorded.
+    def __init__(self, directory, mode):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.served = {}
+        os.makedirs(os.path.join(self.directory, 'bodies'), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, 'requests'), exist_ok=True)
+
+    def _index_path(self, key):
+        return os.path.join(self.directory, 'requests', f'{key}.json')
+
+    def _body_path(self, digest):
+        return os.path.join(self.directory, 'bodies', digest[:2], digest)
+
+    def _exchanges(self, key):
+        try:
+            with open(self._index_path(key)) as f:
+                return json.load(f)['exchanges']
+        except FileNotFoundError:
+            return []
+
+    def record(self, method, url, body, response, elapsed):
+        """
+        Stores a response whose body has been read and returns the stored
+        exchange.
+        """
+        data = response.data
+        digest = _sha256(data)
+        path = self._body_path(digest)
+        exchange = {
+            'status': response.status,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in RECORDED_HEADERS},
+            'body': digest,
+            'elapsed_ms': round(elapsed * 1000, 3),
+            'time': time.time(),
+        }
+        key = request_key(method, url, body)
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                _write_atomic(path, data)
+            exchanges = self._exchanges(key) + [exchange]
+            index = {'method': method.upper(), 'url': normalize_url(url), 'exchanges': exchanges}
+            _write_atomic(self._index_path(key), json.dumps(index, indent=1).encode('utf-8'))
+        log.debug(f"Recorded {method} {normalize_url(url)} as {key[:12]} ({len(exchanges)} exchanges)")
+        return exchange
+
+    def replay(self, method, url, body=None):
+        """
+        Returns (exchange, body) of the next recorded response for a
+        request. Raises ThroneLookupFailed when nothing was recorded for it.
+        """
+        key = request_key(method, url, body)
+        with self.lock:
+            exchanges = self._exchanges(key)
+            if not exchanges:
+                raise ThroneLookupFailed(f"No recorded response for {method.upper()} {normalize_url(url)} in {self.directory}.")
+            served = self.served.get(key, 0)
+            self.served[key] = served + 1
+        exchange = exchanges[min(served, len(exchanges) - 1)]
+        with open(self._body_path(exchange['body']), 'rb') as f:
+            data = f.read()
+        log.debug(f"Replaying {method} {normalize_url(url)} from {key[:12]}")
+        return exchange, data
+
+def response(exchange, data, preload_content=True):
+    """
+    Builds a urllib3 response from a stored exchange, so recorded and
+    replayed responses behave like ones read from the network.
+    """
+    return HTTPResponse(
+        body=io.BytesIO(data),
+        headers=exchange['headers'],
+        status=exchange['status'],
+        preload_content=preload_content,
+        decode_content=False,
+    )
@@ -0,0 +1,253 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+# Import Throne Modules
+from src.exceptions import ThroneConfigError
+from src.config import load_config
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Get home directory
+home = os.path.expanduser("~")
+CACHE_DIR = f'{home}/.throne/cache'
+CACHE_DB = f'{CACHE_DIR}/responses.sqlite3'
+
+def default_cache_path():
+    """
+    Returns the path of the cache database, in THRONE_CACHE_DIR when it is
+    set.
+    """
+    cache_dir = os.environ.get('THRONE_CACHE_DIR')
+    return os.path.join(cache_dir, 'responses.sqlite3') if cache_dir else CACHE_DB
+
+# Default time to live (in seconds) per endpoint. The first entry whose
+# pattern is contained in the normalized URL wins, 0 disables caching.
+CACHE_TTLS = (
+    ('stat.ripe.net/data/as-overview/', 86400),
+    ('stat.ripe.net/data/looking-glass/', 300),
+    ('stat.ripe.net/data/prefix-overview/', 3600),
+    ('stat.ripe.net/data/', 3600),
+    ('www.peeringdb.com/api/', 21600),
+    ('api.throne.dev/whois/', 86400),
+    ('ip-api.com/json/', 86400),
+    ('api.shodan.io/shodan/host/', 3600),
+    ('api.shodan.io/dns/', 3600),
+)
+
+# Query parameters that carry credentials and must never end up in a key.
+SECRET_PARAMS = ('key', 'api_key', 'apikey', 'token')
+
+def normalize_url(url):
+    """
+    Returns the cache key for a URL: lowercased scheme and host, sorted
+    query parameters and no API keys.
+    """
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in SECRET_PARAMS)
+    netloc = parts.netloc.lower()
+    if netloc.endswith(':443') and parts.scheme == 'https':
+        netloc = netloc[:-4]
+    elif netloc.endswith(':80') and parts.scheme == 'http':
+        netloc = netloc[:-3]
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path, urlencode(query), ''))
+
+def _pack(address):
+    # Fixed-width big-endian bytes compare like the integers in SQLite, for
+    # IPv6 as well
+    return address.to_bytes(16, 'big')
+
+def _endpoint(key):
+    # Strips scheme and query so stats can be grouped by endpoint
+    return key.split('://', 1)[-1].split('?', 1)[0]
+
+class _ResponseCache():
+    # This class stores raw upstream response bodies in a SQLite database.
+    def __init__(self, path=None, ttls=None):
+        self.path = path or default_cache_path()
+        self.ttls = tuple(ttls or ()) + CACHE_TTLS
+        self.enabled = True
+        self.refresh = False
+        self.local = threading.local()
+
+    def _db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, '
+                'stored REAL NOT NULL, expires REAL NOT NULL, body BLOB NOT NULL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS ranges ('
+                'endpoint TEXT NOT NULL, family INTEGER NOT NULL, start BLOB NOT NULL, end BLOB NOT NULL, '
+                'stored REAL NOT NULL, expires REAL NOT NULL, body BLOB NOT NULL, '
+                'PRIMARY KEY (endpoint, family, start, end))'
+            )
+            db.commit()
+            self.local.db = db
+        return db
+
+    def ttl(self, key):
+        for pattern, ttl in self.ttls:
+            if pattern in key:
+                return ttl
+        return 0
+
+    def get(self, url):
+        if not self.enabled or self.refresh:
+            return None
+        key = normalize_url(url)
+        if not self.ttl(key):
+            return None
+        try:
+            row = self._db().execute('SELECT body, expires FROM responses WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            log.debug(f"Cache read failed for {key}: {e}")
+            return None
+        if row is None or row[1] < time.time():
+            log.debug(f"Cache miss for {key}")
+            return None
+        log.debug(f"Cache hit for {key}")
+        return row[0]
+
+    def set(self, url, body):
+        if not self.enabled:
+            return
+        key = normalize_url(url)
+        ttl = self.ttl(key)
+        if not ttl:
+            return
+        now = time.time()
+        try:
+            db = self._db()
+            db.execute(
+                'INSERT OR REPLACE INTO responses (key, endpoint, stored, expires, body) VALUES (?, ?, ?, ?, ?)',
+                (key, _endpoint(key), now, now + ttl, body)
+            )
+            db.commit()
+        except sqlite3.Error as e:
+            log.debug(f"Cache write failed for {key}: {e}")
+
+    def get_range(self, url, family, first, last):
+        """
+        Returns the body of the most specific fresh response stored with
+        set_range for url's endpoint whose range covers the addresses first
+        to last (integers), or None.
+        """
+        if not self.enabled or self.refresh:
+            return None
+        endpoint = _endpoint(normalize_url(url))
+        try:
+            # Walks the primary key down from first; the first covering
+            # range found is the one starting closest to first
+            row = self._db().execute(
+                'SELECT body FROM ranges WHERE endpoint = ? AND family = ? AND start <= ? AND end >= ? AND expires >= ? '
+                'ORDER BY start DESC, end ASC LIMIT 1',
+                (endpoint, family, _pack(first), _pack(last), time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            log.debug(f"Range cache read failed for {endpoint}: {e}")
+            return None
+        if row is None:
+            return None
+        log.debug(f"Range cache hit for {url}")
+        return row[0]
+
+    def set_range(self, url, family, start, end, body):
+        """
+        Stores a response that answers every address from start to end
+        (integers) of a family, e.g. a registry allocation. It expires
+        like a cached response for url.
+        """
+        if not self.enabled:
+            return
+        key = normalize_url(url)
+        ttl = self.ttl(key)
+        if not ttl:
+            return
+        now = time.time()
+        try:
+            db = self._db()
+            db.execute(
+                'INSERT OR REPLACE INTO ranges (endpoint, family, start, end, stored, expires, body) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (_endpoint(key), family, _pack(start), _pack(end), now, now + ttl, body)
+            )
+            db.commit()
+        except sqlite3.Error as e:
+            log.debug(f"Range cache write failed for {key}: {e}")
+
+    def stats(self):
+        db = self._db()
+        now = time.time()
+        endpoints = db.execute(
+            'SELECT endpoint, COUNT(*), SUM(expires < ?), SUM(LENGTH(body)) FROM responses '
+            'GROUP BY endpoint ORDER BY COUNT(*) DESC', (now,)
+        ).fetchall()
+        ranges = db.execute('SELECT COUNT(*), SUM(expires < ?) FROM ranges', (now,)).fetchone()
+        return {
+            'path': self.path,
+            'size': sum(os.path.getsize(p) for p in (self.path, f'{self.path}-wal') if os.path.exists(p)),
+            'entries': sum(e[1] for e in endpoints),
+            'expired': sum(e[2] for e in endpoints),
+            'endpoints': endpoints,
+            'ranges': ranges[0],
+            'expired_ranges': ranges[1] or 0,
+        }
+
+    def clear(self):
+        db = self._db()
+        count = db.execute('DELETE FROM responses').rowcount
+        count += db.execute('DELETE FROM ranges').rowcount
+        db.commit()
+        db.execute('VACUUM')
+        return count
+
+    def prune(self):
+        db = self._db()
+        count = db.execute('DELETE FROM responses WHERE expires < ?', (time.time(),)).rowcount
+        count += db.execute('DELETE FROM ranges WHERE expires < ?', (time.time(),)).rowcount
+        db.commit()
+        db.execute('VACUUM')
+        return count
+
+def _load_ttls():
+    ttls = (load_config().get('cache') or {}).get('ttls') or {}
+    if not isinstance(ttls, dict):
+        raise ThroneConfigError("The `cache.ttls` section in config.yml must be a mapping of URL pattern to seconds.")
+    validated = []
+    for pattern, ttl in ttls.items():
+        try:
+            ttl = float(ttl)
+        except (TypeError, ValueError):
+            raise ThroneConfigError(f"cache.ttls.{pattern} in config.yml must be a number of seconds.")
+        if not ttl >= 0:
+            raise ThroneConfigError(f"cache.ttls.{pattern} in config.yml must be 0 (never cache) or more seconds.")
+        validated.append((str(pattern), ttl))
+    return tuple(validated)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """
+    Returns the process-wide response cache, creating it on first use.
+    """
+    global _cache
+    if _cache is None or _cache.path != default_cache_path():
+        with _cache_lock:
+            if _cache is None or _cache.path != default_cache_path():
+                _cache = _ResponseCache(ttls=_load_ttls())
+    return _cache
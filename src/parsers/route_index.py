@@ -0,0 +1,282 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import gzip
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from array import array
+# Import Throne Modules
+from src.exceptions import ThroneFormattingError, ThroneConfigError
+from src.parsers.range_table import write_range_table, _pad, _RangeTable
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Get home directory
+home = os.path.expanduser("~")
+INDEX_DIR = f'{home}/.throne/index'
+
+def default_index_dir():
+    """
+    Returns the directory of the local indexes, THRONE_INDEX_DIR overrides
+    the default.
+    """
+    return os.environ.get('THRONE_INDEX_DIR') or INDEX_DIR
+
+FAMILIES = {4: (socket.AF_INET, 32), 6: (socket.AF_INET6, 128)}
+
+def parse_address(address):
+    """
+    Returns (family, integer) for an IPv4 or IPv6 address string.
+    """
+    family = 6 if ':' in address else 4
+    try:
+        packed = socket.inet_pton(FAMILIES[family][0], address)
+    except OSError:
+        raise ThroneFormattingError(f"{address} is not a valid IP address.")
+    return family, int.from_bytes(packed, 'big')
+
+def parse_prefix(prefix):
+    """
+    Returns (family, network, length) for a prefix, or a host route for a
+    bare address. Host bits are cleared.
+    """
+    address, _, length = prefix.partition('/')
+    family, network = parse_address(address)
+    bits = FAMILIES[family][1]
+    try:
+        length = int(length) if length else bits
+    except ValueError:
+        raise ThroneFormattingError(f"{prefix} is not a valid prefix.")
+    if not 0 <= length <= bits:
+        raise ThroneFormattingError(f"{prefix} is not a valid prefix.")
+    host_mask = (1 << (bits - length)) - 1
+    return family, network & ~host_mask, length
+
+def format_address(family, address):
+    size = FAMILIES[family][1] // 8
+    return socket.inet_ntop(FAMILIES[family][0], address.to_bytes(size, 'big'))
+
+def format_prefix(family, network, length):
+    return f"{format_address(family, network)}/{length}"
+
+def _parse_origin(token):
+    # Origins can be plain numbers, ASxxxx, or an AS set like {64496,64497}
+    token = token.strip().upper().lstrip('AS').strip('{}').split(',')[0]
+    return int(token)
+
+def parse_dump_line(line):
+    """
+    Returns (prefix, origin_as) for one line of a routing table dump, or None.
+
+    Understands `prefix origin` / `origin prefix` text dumps (RIS whois dumps,
+    RouteViews style tables) and `bgpdump -m` output of MRT RIB files, where
+    the origin is the last AS of the path.
+    """
+    line = line.strip()
+    if not line or line.startswith(('#', '%')):
+        return None
+    if '|' in line:
+        fields = line.split('|')
+        if len(fields) < 7 or not fields[6].strip():
+            return None
+        return fields[5], _parse_origin(fields[6].split()[-1])
+    tokens = line.split()
+    prefix = next((token for token in tokens if '/' in token), None)
+    origin = next((token for token in tokens if token != prefix), None)
+    if prefix is None or origin is None:
+        return None
+    return prefix, _parse_origin(origin)
+
+def _open_dump(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', errors='ignore')
+    return open(path, 'r', errors='ignore')
+
+# Parent of a route no other route covers
+NO_PARENT = 0xFFFFFFFF
+
+def _flatten(routes):
+    """
+    Turns nested prefixes into disjoint ranges where the most specific
+    prefix wins, so a longest-prefix match becomes a single binary search.
+    routes is a list of (start, end, origin, length) sorted by start and
+    then widest first. Returns the ranges as (start, end, route index) and
+    the index of the route directly covering each route, or NO_PARENT.
+    """
+    ranges = []
+    parents = []
+    stack = []
+    cursor = 0
+
+    def emit(start, end, index):
+        if start <= end:
+            ranges.append((start, end, index))
+
+    for index, route in enumerate(routes):
+        start = route[0]
+        while stack and routes[stack[-1]][1] < start:
+            top = stack.pop()
+            emit(cursor, routes[top][1], top)
+            cursor = routes[top][1] + 1
+        if stack:
+            emit(cursor, start - 1, stack[-1])
+        parents.append(stack[-1] if stack else NO_PARENT)
+        stack.append(index)
+        cursor = start
+    while stack:
+        top = stack.pop()
+        emit(cursor, routes[top][1], top)
+        cursor = routes[top][1] + 1
+    return ranges, parents
+
+def _aligned(data):
+    return data + b'\0' * _pad(len(data))
+
+def _route_payload(routes, ranges, parents):
+    # Payload layout (8-byte aligned sections): uint64 route count, the
+    # route of each range, then the origin, parent and length of each route
+    return b''.join((
+        array('Q', [len(routes)]).tobytes(),
+        _aligned(array('I', (r[2] for r in ranges)).tobytes()),
+        _aligned(array('I', (route[2] for route in routes)).tobytes()),
+        _aligned(array('I', parents).tobytes()),
+        array('B', (route[3] for route in routes)).tobytes(),
+    ))
+
+def build_index(paths, index_dir=None):
+    """
+    Builds the IPv4 and IPv6 origin indexes from routing table dumps.
+    Returns a dict with the number of prefixes and ranges per family.
+    """
+    prefixes = {4: {}, 6: {}}
+    skipped = 0
+    for path in paths:
+        with _open_dump(path) as dump:
+            for line in dump:
+                try:
+                    parsed = parse_dump_line(line)
+                    if parsed is None:
+                        continue
+                    family, network, length = parse_prefix(parsed[0])
+                except (ThroneFormattingError, ValueError, IndexError):
+                    skipped += 1
+                    continue
+                # The first origin seen for a prefix wins
+                prefixes[family].setdefault((network, length), parsed[1])
+    index_dir = index_dir or default_index_dir()
+    os.makedirs(index_dir, exist_ok=True)
+    summary = {'skipped': skipped, 'built': time.time()}
+    for family, table in prefixes.items():
+        bits = FAMILIES[family][1]
+        routes = sorted(
+            ((network, network | ((1 << (bits - length)) - 1), origin, length)
+             for (network, length), origin in table.items()),
+            key=lambda route: (route[0], -route[1])
+        )
+        ranges, parents = _flatten(routes)
+        write_range_table(
+            os.path.join(index_dir, f'routes-v{family}.thr'),
+            width=bits // 8,
+            starts=[r[0] for r in ranges],
+            ends=[r[1] for r in ranges],
+            values=[routes[r[2]][2] for r in ranges],
+            tags=[routes[r[2]][3] for r in ranges],
+            payload=_route_payload(routes, ranges, parents),
+        )
+        summary[f'v{family}'] = {'prefixes': len(table), 'ranges': len(ranges)}
+        log.debug(f"Wrote {len(ranges)} IPv{family} ranges from {len(table)} prefixes")
+    with open(os.path.join(index_dir, 'routes.json'), 'w') as f:
+        json.dump(summary, f)
+    return summary
+
+class _RouteTable(_RangeTable):
+    # This class adds the routes behind the ranges of a route index table,
+    # so a prefix query can walk from the most specific route covering its
+    # first address up to the routes covering the whole prefix.
+    def __init__(self, path):
+        super().__init__(path)
+        if not self.payload:
+            raise ThroneConfigError(f"{path} was built by an older throne. Run `throne bgp index build FILE` again.")
+        count = self.payload[:8].cast('Q')[0]
+        offset = 8
+        self.range_routes = self.payload[offset:offset + self.count * 4].cast('I')
+        offset += self.count * 4 + _pad(self.count * 4)
+        self.origins = self.payload[offset:offset + count * 4].cast('I')
+        offset += count * 4 + _pad(count * 4)
+        self.parents = self.payload[offset:offset + count * 4].cast('I')
+        offset += count * 4 + _pad(count * 4)
+        self.lengths = self.payload[offset:offset + count]
+
+    def covering(self, index, length):
+        """
+        Returns the (origin, length) of the most specific route no longer
+        than length covering range index, or None.
+        """
+        route = self.range_routes[index]
+        while route != NO_PARENT and self.lengths[route] > length:
+            route = self.parents[route]
+        if route == NO_PARENT:
+            return None
+        return self.origins[route], self.lengths[route]
+
+class _RouteIndex():
+    # This class answers origin AS questions from the local route index.
+    def __init__(self, index_dir=None):
+        self.index_dir = index_dir or default_index_dir()
+        self.tables = {}
+
+    def _table(self, family):
+        table = self.tables.get(family)
+        if table is None:
+            path = os.path.join(self.index_dir, f'routes-v{family}.thr')
+            if not os.path.exists(path):
+                raise ThroneConfigError("No local route index found. Run `throne bgp index build FILE` first.")
+            table = self.tables[family] = _RouteTable(path)
+        return table
+
+    def lookup(self, query):
+        """
+        Returns (prefix, origin_as) for the longest matching prefix covering
+        an address or prefix, or None when it is not covered.
+        """
+        family, network, length = parse_prefix(query)
+        table = self._table(family)
+        index = table.find(network)
+        if index < 0:
+            return None
+        origin, matched_length = table.values[index], table.tags[index]
+        # A prefix query is only covered by routes at least as wide as itself
+        if matched_length > length:
+            covering = table.covering(index, length)
+            if covering is None:
+                return None
+            origin, matched_length = covering
+        bits = FAMILIES[family][1]
+        matched_network = network & ~((1 << (bits - matched_length)) - 1)
+        return format_prefix(family, matched_network, matched_length), origin
+
+    def info(self):
+        try:
+            with open(os.path.join(self.index_dir, 'routes.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ThroneConfigError("No local route index found. Run `throne bgp index build FILE` first.")
+
+_route_index = None
+
+def get_route_index():
+    """
+    Returns the process-wide route index, opening it on first use.
+    """
+    global _route_index
+    if _route_index is None or _route_index.index_dir != default_index_dir():
+        _route_index = _RouteIndex()
+    return _route_index
@@ -4,6 +4,7 @@
 # Import Third Party Modules
 import logging
 # Import Throne Modules
+from src.parsers.timings import timed
 
 # Set log variable for verbose output
 log = logging.getLogger(__name__)
@@ -24,6 +25,7 @@ class _APIInfo():
             'used_scan_credits': None,
             'used_query_credits': None,
         }
+    @timed('parse')
     def parse(self):
         self.vars['scan_credits'] = self.json['scan_credits']
         self.vars['scan_limit'] = self.json['usage_limits']['scan_credits']
@@ -52,13 +54,7 @@ class _DNS():
             'ip': None,
             'hostname': None,
         }
-        self.record_vars = {
-                'value': None,
-                'subdomain': None,
-                'type': None,
-                'ports': None,
-                'last_seen': None
-            }
+    @timed('parse')
     def parse(self):
         if "reverse" in self.type:
             self.vars.update({
@@ -88,86 +84,49 @@ class _DNS():
                 self.resolve_vars['hostname'] = k
                 self.resolve_vars['ip'] = v
                 self.vars['result'].append(self.resolve_vars)
-        if "domain" in self.type:
-            self.vars.update({
-            'domain': None,
+
+# Record types in the order they are shown; other types follow after these
+DNS_RECORD_TYPES = ('A', 'AAAA', 'CNAME', 'MX', 'NS', 'PTR', 'CERT', 'SRV', 'TXT', 'SOA', 'DNSKEY')
+
+class _DNSDomain():
+    # This class groups the records of a Shodan domain lookup by subdomain in
+    # one pass over the pages. Nothing guarantees the records of a subdomain
+    # arrive together, so groups are only complete once every page is read.
+    def __init__(self, domain):
+        self.domain = domain
+        self.vars = {
+            'domain': domain,
             'tags': [],
             'subdomains': [],
-            'records': [],
-            })
-            self.domain_vars = {}
-            self.vars['domain'] = self.json['domain']
-            if self.json['domain'] not in self.domain_vars.keys():
-                domain = self.json['domain']
-                self.domain_vars.update({domain: []})
-            else:
-                pass
-            for tag in self.json['tags']:
-                try:
-                    self.vars['tags'].append(tag)
-                except:
-                    pass
-            for subdomain in self.json['subdomains']:
-                try:
-                    subdomain = subdomain + f".{self.json['domain']}"
-                    self.vars['subdomains'].append(subdomain)
-                    if subdomain not in self.domain_vars.keys():
-                        self.domain_vars.update({subdomain: []})
-                    else:
-                        pass
-                except:
-                    pass
-            for record in self.json['data']:
-                self.record_vars = {
-                    'tags': [],
-                    'value': None,
-                    'domain': None,
-                    'type': None,
-                    'ports': [],
-                    'last_seen': None,
-                }
-                for subdomain in self.domain_vars:
-                    try:
-                        try:
-                            for tag in record['tags']:
-                                if tag not in self.record_vars['tags']:
-                                    self.record_vars['tags'].append(tag)
-                        except:
-                            pass
-                        try:
-                            self.record_vars['value'] = record['value']
-                        except:
-                            pass
-                        try:
-                            if record['subdomain'] == '':
-                                self.record_vars['domain'] = self.json['domain']
-                            else:
-                                domain = record['subdomain'] + f".{self.json['domain']}"
-                                self.record_vars['domain'] = domain
-                        except:
-                            pass
-                        try:
-                            self.record_vars['type'] = record['type']
-                        except:
-                            pass
-                        try:
-                            for port in record['ports']:
-                                if port not in self.record_vars['ports']:
-                                    self.record_vars['ports'].append(port)
-                        except:
-                            pass
-                        try:
-                            self.record_vars['last_seen'] = record['last_seen']
-                        except:
-                            pass
-                        if subdomain == self.record_vars['domain']:
-                            self.domain_vars[subdomain].append(self.record_vars)
-                    except:
-                        pass
-                if self.domain_vars not in self.vars['records']:
-                    self.vars['records'].append(self.domain_vars)
-                else:
-                    pass
+        }
+
+    def header(self, page):
+        self.vars['tags'] = list(page.get('tags') or [])
+        self.vars['subdomains'] = [f"{subdomain}.{self.domain}" for subdomain in page.get('subdomains') or []]
+        return self.vars
+
+    def _record(self, record):
+        return {
+            'value': record.get('value'),
+            'type': record.get('type'),
+            'tags': list(dict.fromkeys(record.get('tags') or [])),
+            'ports': list(dict.fromkeys(record.get('ports') or [])),
+            'last_seen': record.get('last_seen'),
+        }
+
+    def parse(self, pages):
+        """
+        Yields (name, {record type: [records]}) for each subdomain in the
+        pages, in the order each subdomain first appears.
+        """
+        groups = {}
+        for page in pages:
+            for record in page.get('data') or []:
+                subdomain = record.get('subdomain') or ''
+                name = f"{subdomain}.{self.domain}" if subdomain else self.domain
+                groups.setdefault(name, {}).setdefault(record.get('type'), []).append(self._record(record))
+        yield from groups.items()
+
 
 class _IPSearch():
     def __init__(self, json_result, query):
@@ -176,6 +135,7 @@ class _IPSearch():
         self.vars = {
             'query': self.query,
         }
+    @timed('parse')
     def parse(self):
         comma = ", "
         self.vars.update({
@@ -0,0 +1,96 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import logging
+import threading
+# Import Throne Modules
+from src.parsers.timings import get_timings
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Time spent waiting on another thread's call, for `throne --timings`
+timings = get_timings()
+
+class _Call():
+    # One call in flight and the outcome its waiters receive.
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class _SingleFlight():
+    # This class collapses concurrent identical calls into one: the first
+    # caller for a key runs it, and callers arriving while it runs wait for
+    # it and receive the same result or exception. Nothing is kept once the
+    # call has finished, later calls run again (the response cache is what
+    # serves those). Counters are kept per endpoint for the whole process.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.counters = {}
+
+    def do(self, key, func, endpoint=None, **fields):
+        """
+        Returns func(), running it only if no call with the same key is in
+        flight. endpoint labels the counters, fields the --timings span.
+        """
+        with self.lock:
+            counters = self.counters.setdefault(endpoint, {'calls': 0, 'coalesced': 0})
+            counters['calls'] += 1
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                counters['coalesced'] += 1
+        if not leader:
+            log.debug(f"Waiting on an identical request in flight to {endpoint}")
+            with timings.span('coalesced', **fields):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def shared(self, endpoint, **fields):
+        """
+        Counts a call that was answered by an identical one without going
+        through do(), e.g. a duplicate URL in one gather.
+        """
+        with self.lock:
+            counters = self.counters.setdefault(endpoint, {'calls': 0, 'coalesced': 0})
+            counters['calls'] += 1
+            counters['coalesced'] += 1
+        with timings.span('coalesced', **fields):
+            pass
+
+    def stats(self):
+        """
+        Returns the calls made and coalesced, in total and per endpoint.
+        """
+        with self.lock:
+            endpoints = {endpoint: dict(counters) for endpoint, counters in self.counters.items()}
+        return {
+            'calls': sum(counters['calls'] for counters in endpoints.values()),
+            'coalesced': sum(counters['coalesced'] for counters in endpoints.values()),
+            'endpoints': endpoints,
+        }
+
+_singleflight = _SingleFlight()
+
+def get_singleflight():
+    """
+    Returns the process-wide request coalescer.
+    """
+    return _singleflight
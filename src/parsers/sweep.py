@@ -0,0 +1,186 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+# Import Throne Modules
+from src.exceptions import ThroneConfigError, ThroneFormattingError
+from src.parsers.recorder import _write_atomic
+from src.parsers.route_index import FAMILIES, format_address, parse_address, parse_prefix
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Where a lookup fails there is no allocation to jump over, so the sweep
+# moves on to the next block of this size. Sub-ranges are never split below
+# it either, a single allocation rarely is.
+STEP_LENGTHS = {4: 24, 6: 48}
+
+def _block_last(family, address, length):
+    # Last address of the length-sized block containing address
+    return address | ((1 << (FAMILIES[family][1] - length)) - 1)
+
+def split_range(family, network, length, parts):
+    """
+    Splits a prefix into at most parts (rounded up to a power of two)
+    equally sized sub-prefixes, no longer than STEP_LENGTHS.
+    """
+    bits = 0
+    while (1 << bits) < parts and length + bits < max(length, STEP_LENGTHS[family]):
+        bits += 1
+    size = FAMILIES[family][1] - length - bits
+    return [(family, network + (i << size), length + bits) for i in range(1 << bits)]
+
+def _holder(info):
+    for entity in info.entities:
+        if 'registrant' in (entity.roles or []):
+            return entity.name
+    return info.name
+
+class _Sweep():
+    # This class maps a prefix to the allocations and announced routes in
+    # it with as few lookups as possible. Each lookup of an address answers
+    # for the rest of its registry allocation and announced prefix, so the
+    # walk jumps straight past whichever of the two ends first. Sub-ranges
+    # are walked concurrently, and the address ranges left to walk are kept
+    # in a state file so an interrupted sweep resumes where it stopped, with
+    # any number of workers. Each sub-range is keyed by its (first, last)
+    # addresses and maps to [next address, last].
+    def __init__(self, client, prefix, workers=8, state_path=None):
+        self.client = client
+        self.prefix = prefix
+        self.family, network, length = parse_prefix(prefix)
+        self.state_path = state_path
+        self.chunks = {}
+        for family, chunk, chunk_length in split_range(self.family, network, length, workers):
+            last = _block_last(family, chunk, chunk_length)
+            self.chunks[(chunk, last)] = [chunk, last]
+        self.workers = workers
+        self.stop = threading.Event()
+        if state_path and os.path.exists(state_path):
+            self._resume()
+
+    def _resume(self):
+        with open(self.state_path) as f:
+            state = json.load(f)
+        if state.get('prefix') != self.prefix:
+            raise ThroneConfigError(f"{self.state_path} belongs to a sweep of {state.get('prefix')}, not {self.prefix}.")
+        if 'remaining' not in state:
+            raise ThroneConfigError(f"{self.state_path} was written by an older throne. Remove it to start the sweep again.")
+        remaining = [(parse_address(first)[1], parse_address(last)[1]) for first, last in state['remaining']]
+        # The saved ranges are cut along this run's sub-ranges, so a
+        # different thread count still resumes every unfinished address
+        chunks = {}
+        for chunk_first, chunk_last in self.chunks:
+            for first, last in remaining:
+                first, last = max(first, chunk_first), min(last, chunk_last)
+                if first <= last:
+                    chunks[(first, last)] = [first, last]
+        self.chunks = chunks
+        log.debug(f"Resuming the sweep of {self.prefix} from {self.state_path}")
+
+    def _save(self):
+        state = {
+            'prefix': self.prefix,
+            'remaining': [
+                [format_address(self.family, first), format_address(self.family, last)]
+                for first, last in sorted(self.chunks.values()) if first <= last
+            ],
+        }
+        _write_atomic(self.state_path, json.dumps(state, indent=1).encode('utf-8'))
+
+    def segment(self, address, last):
+        """
+        Looks up one address and returns (record, next_address) for the
+        stretch from it to whichever comes first: the end of its
+        allocation, the end of its announced prefix or last.
+        """
+        query = format_address(self.family, address)
+        try:
+            info = self.client.lookup_ip(query)
+            end = self._end(info, address, last)
+        except ThroneConfigError:
+            # e.g. no API key, every other lookup would fail the same way
+            raise
+        except Exception as e:
+            # Upstream errors, connection failures and replies missing fields
+            # alike, the sweep moves on past the block
+            log.debug(f"Lookup of {query} failed", exc_info=True)
+            end = min(last, _block_last(self.family, address, STEP_LENGTHS[self.family]))
+            return {'start': query, 'end': format_address(self.family, end), 'addresses': end - address + 1, 'error': str(e) or type(e).__name__}, end + 1
+        record = {
+            'start': query,
+            'end': format_address(self.family, end),
+            'addresses': end - address + 1,
+            'allocation': f"{info.start_address} - {info.end_address}",
+            'rir': info.rir,
+            'name': info.name,
+            'holder': _holder(info),
+            'announced': bool(info.announced),
+            'prefix': info.prefix if info.announced else None,
+            'asns': [origin.asn for origin in info.asns] if info.announced else [],
+        }
+        return record, end + 1
+
+    def _end(self, info, address, last):
+        # Whichever comes first: the allocation, the announced prefix or last
+        ends = [last]
+        try:
+            family, allocation_end = parse_address(info.end_address)
+        except ThroneFormattingError:
+            family = None
+        if family == self.family and allocation_end >= address:
+            ends.append(allocation_end)
+        if info.announced:
+            family, network, length = parse_prefix(info.prefix)
+            if family == self.family and _block_last(family, network, length) >= address:
+                ends.append(_block_last(family, network, length))
+        return min(ends)
+
+    def _walk(self, chunk, results):
+        first, last = self.chunks[chunk]
+        while first <= last and not self.stop.is_set():
+            record, first = self.segment(first, last)
+            results.put((chunk, record, first))
+
+    def run(self):
+        """
+        Yields a record per segment as sub-ranges are walked, saving the
+        state after each one. Stops the walk when the caller stops early.
+        """
+        pending = [chunk for chunk, (first, last) in self.chunks.items() if first <= last]
+        if not pending:
+            return
+        results = queue.Queue()
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='throne-sweep')
+        def walk(chunk):
+            # A finished sub-range is reported as (chunk, None, error)
+            try:
+                self._walk(chunk, results)
+            except Exception as e:
+                results.put((chunk, None, e))
+            else:
+                results.put((chunk, None, None))
+        try:
+            for chunk in pending:
+                pool.submit(walk, chunk)
+            running = len(pending)
+            while running:
+                chunk, record, first = results.get()
+                if record is None:
+                    if first is not None:
+                        raise first
+                    running -= 1
+                    continue
+                yield record
+                self.chunks[chunk][0] = first
+                if self.state_path:
+                    self._save()
+        finally:
+            self.stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
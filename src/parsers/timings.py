@@ -0,0 +1,213 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+# Import Throne Modules
+from src.parsers.ratelimit import format_stats
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Request phases in the order they happen. `wait` is time spent in the rate
+# limiter and in backoff before retries.
+REQUEST_PHASES = ('wait', 'dns', 'connect', 'tls', 'ttfb', 'body')
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+def _union(intervals):
+    # Total length covered by (start, end) intervals, overlaps counted once
+    total = 0.0
+    end = None
+    for start, stop in sorted(intervals):
+        if end is None or start > end:
+            total += stop - start
+            end = stop
+        elif stop > end:
+            total += stop - end
+            end = stop
+    return total
+
+class _Timings():
+    # This class collects the spans reported by `throne --timings`: one
+    # record per upstream request with its phases, and one per JSON decode
+    # and parse. Everything is a no-op until `enabled` is set, so the hooks
+    # can stay in the hot paths.
+    def __init__(self):
+        self.enabled = False
+        self.started = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def start(self):
+        self.enabled = True
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, span, start, end, **fields):
+        record = {
+            'span': span,
+            'start_ms': _ms(start - self.started),
+            'ms': _ms(end - start),
+            'thread': threading.current_thread().name,
+        }
+        record.update(fields)
+        with self.lock:
+            self.spans.append(record)
+
+    @contextmanager
+    def span(self, span, **fields):
+        """
+        Records the time spent in the block as one span.
+        """
+        if not self.enabled:
+            yield fields
+            return
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.add(span, start, time.perf_counter(), **fields)
+
+    @contextmanager
+    def request(self, method, url):
+        """
+        Records one upstream request. Phases reported with phase() on the
+        same thread while the block runs are added to it.
+        """
+        parts = urlsplit(url)
+        phases = dict.fromkeys(REQUEST_PHASES, 0.0)
+        self.local.phases = phases
+        with self.span('request', method=method, host=parts.hostname, path=parts.path) as fields:
+            try:
+                yield fields
+            finally:
+                self.local.phases = None
+                fields['phases'] = {name: _ms(seconds) for name, seconds in phases.items()}
+
+    def phase(self, name, seconds):
+        if not self.enabled:
+            return
+        phases = getattr(self.local, 'phases', None)
+        if phases is not None:
+            phases[name] += seconds
+
+    def opened(self):
+        """
+        Returns the time the current request spent opening connections.
+        """
+        phases = getattr(self.local, 'phases', None)
+        if not phases:
+            return 0.0
+        return phases['dns'] + phases['connect'] + phases['tls']
+
+    def first_byte(self, sent, opened):
+        """
+        Reports the wait for the response headers of a request sent at
+        `sent`, without the time a new connection took to open. `opened` is
+        what opened() returned when it was sent.
+        """
+        if not self.enabled:
+            return
+        self.phase('ttfb', max(0.0, time.perf_counter() - sent - (self.opened() - opened)))
+
+    def summary(self, command, end):
+        """
+        Returns the command's totals. `render` is the wall time not covered
+        by any request, decode or parse span, i.e. output and everything else.
+        """
+        intervals = {}
+        for record in self.spans:
+            start = self.started + record['start_ms'] / 1000
+            intervals.setdefault(record['span'], []).append((start, start + record['ms'] / 1000))
+        covered = _union([interval for spans in intervals.values() for interval in spans])
+        total = end - self.started
+        return {
+            'span': 'command',
+            'command': command,
+            'ms': _ms(total),
+            'requests': len(intervals.get('request', [])),
+            'coalesced': len(intervals.get('coalesced', [])),
+            'network_ms': _ms(_union(intervals.get('request', []))),
+            'decode_ms': _ms(sum(stop - start for start, stop in intervals.get('decode', []))),
+            'parse_ms': _ms(sum(stop - start for start, stop in intervals.get('parse', []))),
+            'render_ms': _ms(max(0.0, total - covered)),
+        }
+
+    def records(self, command, rate_limits=None):
+        """
+        Returns every span, then the rate limiter's counts for each host
+        requested (see transport.rate_limit_stats) and the command summary.
+        """
+        with self.lock:
+            spans = sorted(self.spans, key=lambda record: record['start_ms'])
+        limits = [
+            {'span': 'rate_limit', 'host': host, **metrics}
+            for host, metrics in sorted((rate_limits or {}).items()) if metrics['requests']
+        ]
+        return spans + limits + [self.summary(command, time.perf_counter())]
+
+    def json_lines(self, command, rate_limits=None):
+        """
+        Returns the records as NDJSON, the report of THRONE_TIMINGS=json.
+        """
+        return '\n'.join(json.dumps(record) for record in self.records(command, rate_limits))
+
+    def table(self, command, rate_limits=None):
+        """
+        Returns the human readable report printed by `throne --timings`.
+        """
+        records = self.records(command, rate_limits)
+        summary = records.pop()
+        limits = [record for record in records if record['span'] == 'rate_limit']
+        records = records[:len(records) - len(limits)]
+        lines = [f"{'start':>9} {'total':>9} " + ' '.join(f"{name:>8}" for name in REQUEST_PHASES) + "  span"]
+        for record in records:
+            if record['span'] == 'request':
+                phases = record.get('phases', {})
+                columns = ' '.join(f"{phases.get(name, 0.0):>8.1f}" for name in REQUEST_PHASES)
+                label = f"{record['method']} {record['host']}{record['path']} {record.get('status', 'failed')}"
+            else:
+                columns = ' ' * (9 * len(REQUEST_PHASES) - 1)
+                label = f"{record['span']} {record.get('name') or record.get('host', '') + record.get('path', '')}".rstrip()
+            lines.append(f"{record['start_ms']:>9.1f} {record['ms']:>9.1f} {columns}  {label}")
+        # Callers that waited on an identical request in flight
+        coalesced = f" (+{summary['coalesced']} coalesced)" if summary['coalesced'] else ''
+        lines.append(
+            f"{summary['command']}: {summary['ms']:.1f} ms total, {summary['network_ms']:.1f} ms waiting on "
+            f"{summary['requests']} requests{coalesced}, {summary['decode_ms']:.1f} ms decoding, "
+            f"{summary['parse_ms']:.1f} ms parsing, {summary['render_ms']:.1f} ms rendering and other"
+        )
+        lines.extend(f"{record['host']}: {format_stats(record)}" for record in limits)
+        return '\n'.join(lines)
+
+def timed(span):
+    """
+    Decorates a parser method so each call is recorded as a span named
+    after its class.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not _timings.enabled:
+                return func(self, *args, **kwargs)
+            with _timings.span(span, name=type(self).__name__):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+_timings = _Timings()
+
+def get_timings():
+    """
+    Returns the process-wide timing collector.
+    """
+    return _timings
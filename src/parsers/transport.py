@@ -0,0 +1,257 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import logging
+import socket
+import threading
+import time
+import urllib3
+from urllib.parse import urlsplit
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+# Import Throne Modules
+from src.exceptions import ThroneConfigError
+from src.config import load_config
+from src.parsers.ratelimit import load_rate_limiter, RETRY_STATUSES
+from src.parsers import recorder
+from src.parsers.timings import get_timings
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+# Upstream hosts throne talks to. Each one gets its own keep-alive pool.
+UPSTREAM_HOSTS = (
+    'stat.ripe.net',
+    'api.throne.dev',
+    'api.shodan.io',
+    'www.peeringdb.com',
+    'ip-api.com',
+)
+
+# Defaults used when config.yml has no (or a partial) `transport` section.
+TRANSPORT_DEFAULTS = {
+    'timeout': 30,
+    'connect_timeout': 10,
+    'pool_maxsize': 10,
+    'dns_ttl': 300,
+    'retries': 2,
+    'hosts': {},
+}
+
+# RIPEstat asks clients to identify themselves on every call
+RIPESTAT_SOURCEAPP = 'throne-cli'
+
+class _DNSCache():
+    # This class caches getaddrinfo() results for upstream hostnames so
+    # every new pooled connection does not pay for a fresh DNS lookup.
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, host, port):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get((host, port))
+            if entry is not None and entry[0] > now:
+                return entry[1]
+        log.debug(f"Resolving {host}:{port}...")
+        addresses = []
+        for family, _, _, _, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        if not addresses:
+            return addresses
+        with self.lock:
+            self.entries[(host, port)] = (now + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host, port):
+        with self.lock:
+            self.entries.pop((host, port), None)
+
+# Shared DNS cache used by every pooled connection.
+_dns_cache = _DNSCache()
+
+# Phase timings for `throne --timings`
+timings = get_timings()
+
+class _CachedDNSMixin():
+    # Connects to the cached addresses of self.host instead of resolving
+    # the name again. TLS SNI and certificate checks still use self.host.
+    def _new_conn(self):
+        hostname = self._dns_host
+        started = time.perf_counter()
+        try:
+            addresses = _dns_cache.resolve(hostname, self.port)
+        except socket.gaierror as e:
+            raise NewConnectionError(self, f"Failed to resolve {hostname}: {e}")
+        if not addresses:
+            raise NewConnectionError(self, f"Failed to resolve {hostname}: no addresses returned")
+        resolved = time.perf_counter()
+        timings.phase('dns', resolved - started)
+        error = None
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+        finally:
+            self._dns_host = hostname
+            self._connected_at = time.perf_counter()
+            timings.phase('connect', self._connected_at - resolved)
+        # Every cached address failed, resolve again on the next attempt
+        _dns_cache.forget(hostname, self.port)
+        raise error
+
+class _CachedHTTPConnection(_CachedDNSMixin, HTTPConnection):
+    pass
+
+class _CachedHTTPSConnection(_CachedDNSMixin, HTTPSConnection):
+    def connect(self):
+        # The handshake is whatever connect() does after the socket is open
+        super().connect()
+        timings.phase('tls', time.perf_counter() - self._connected_at)
+
+class _CachedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CachedHTTPConnection
+
+class _CachedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CachedHTTPSConnection
+
+class _PoolManager(urllib3.PoolManager):
+    # PoolManager that applies per-host pool settings from config.yml.
+    def __init__(self, host_kw=None, **connection_pool_kw):
+        super().__init__(**connection_pool_kw)
+        self.host_kw = host_kw or {}
+        self.pool_classes_by_scheme = {
+            'http': _CachedHTTPConnectionPool,
+            'https': _CachedHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        if request_context is None:
+            request_context = self.connection_pool_kw.copy()
+        request_context.update(self.host_kw.get(host, {}))
+        log.debug(f"Opening connection pool for {scheme}://{host}:{port}")
+        return super()._new_pool(scheme, host, port, request_context)
+
+def _load_settings():
+    settings = dict(TRANSPORT_DEFAULTS)
+    transport_config = load_config().get('transport') or {}
+    if not isinstance(transport_config, dict):
+        raise ThroneConfigError("The `transport` section in config.yml must be a mapping.")
+    settings.update(transport_config)
+    return settings
+
+class _Transport():
+    # This class is the single HTTP transport shared by every command.
+    def __init__(self, settings=None):
+        if settings is None:
+            settings = _load_settings()
+        self.settings = settings
+        self.limiter = load_rate_limiter()
+        # Set by `throne --record/--replay`, see src/parsers/recorder.py
+        self.recorder = None
+        _dns_cache.ttl = settings['dns_ttl']
+        host_kw = {}
+        for host, host_settings in (settings['hosts'] or {}).items():
+            host_kw[host] = self._pool_kw(dict(settings, **host_settings))
+        self.pool = _PoolManager(
+            host_kw=host_kw,
+            num_pools=len(UPSTREAM_HOSTS) * 2,
+            # Throttled responses are retried by the rate limiter, not here
+            retries=urllib3.Retry(total=settings['retries'], redirect=5, raise_on_status=False, respect_retry_after_header=False),
+            **self._pool_kw(settings)
+        )
+
+    def _pool_kw(self, settings):
+        return {
+            'maxsize': settings['pool_maxsize'],
+            'timeout': urllib3.Timeout(connect=settings['connect_timeout'], read=settings['timeout']),
+        }
+
+    def reserve(self, connections):
+        # Makes pools opened from now on keep at least `connections` alive
+        kw_sets = [self.pool.connection_pool_kw] + list(self.pool.host_kw.values())
+        for kw in kw_sets:
+            kw['maxsize'] = max(kw['maxsize'], connections)
+
+    def request(self, method, url, headers=None, body=None, preload_content=True):
+        """
+        Sends a request within the upstream's rate limit. Throttled and
+        temporarily unavailable responses are retried with backoff; the last
+        response is returned once the retries are used up.
+        """
+        if not timings.enabled:
+            return self._request(method, url, headers, body, preload_content)
+        with timings.request(method, url) as span:
+            response = self._request(method, url, headers, body, preload_content)
+            span['status'] = response.status
+            return response
+
+    def _request(self, method, url, headers, body, preload_content):
+        if self.recorder is not None and self.recorder.mode == 'replay':
+            exchange, data = self.recorder.replay(method, url, body)
+            return recorder.response(exchange, data, preload_content)
+        original_url = url
+        parts = urlsplit(url)
+        limit = self.limiter.key(parts.hostname, parts.path)
+        if parts.hostname == 'stat.ripe.net' and 'sourceapp=' not in url:
+            url = f"{url}{'&' if '?' in url else '?'}sourceapp={RIPESTAT_SOURCEAPP}"
+        # Recorded bodies are read in full before the caller sees them
+        preload = preload_content or self.recorder is not None
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            waited = time.perf_counter()
+            self.limiter.wait(limit)
+            timings.phase('wait', time.perf_counter() - waited)
+            log.debug(f"{method} {url}")
+            sent, opened = time.perf_counter(), timings.opened()
+            # Timed requests read the body separately from the headers
+            response = self.pool.urlopen(method, url, headers=headers or {}, body=body, preload_content=preload and not timings.enabled)
+            if timings.enabled:
+                timings.first_byte(sent, opened)
+                if preload:
+                    started_body = time.perf_counter()
+                    response.data
+                    timings.phase('body', time.perf_counter() - started_body)
+            if response.status not in RETRY_STATUSES or attempt >= self.limiter.retry['attempts']:
+                break
+            delay = self.limiter.backoff(limit, attempt, response.headers.get('Retry-After'))
+            log.debug(f"{parts.hostname} answered {response.status}, retrying in {delay:.2f}s")
+            response.drain_conn()
+            response.release_conn()
+            time.sleep(delay)
+            timings.phase('wait', delay)
+            attempt += 1
+        if self.recorder is None:
+            return response
+        exchange = self.recorder.record(method, original_url, body, response, time.perf_counter() - started)
+        return recorder.response(exchange, response.data, preload_content)
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    """
+    Returns the process-wide transport, creating it on first use.
+    """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = _Transport()
+    return _transport
+
+def rate_limit_stats():
+    """
+    Returns the requests, throttling and retries per rate-limited host so
+    far, without creating the transport if no request was made.
+    """
+    return _transport.limiter.stats() if _transport is not None else {}
@@ -0,0 +1,251 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+# Import Throne Modules
+from src.exceptions import ThroneFormattingError
+from src.parsers import json_request
+from src.parsers.lg_parser import _LGParse
+from src.parsers.route_index import FAMILIES, format_prefix, parse_prefix
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+RIPEPREFIXOVER_URL = 'https://stat.ripe.net/data/prefix-overview/data.json?resource='
+RIPELG_URL = 'https://stat.ripe.net/data/looking-glass/data.json?resource='
+
+def covering_route(target, looking_glass):
+    """
+    Returns the most specific route any RIS peer has covering a target,
+    from the looking-glass response for it, or the target itself when no
+    peer has one. prefix-overview cannot tell, it describes a queried
+    prefix rather than the route announced for it.
+    """
+    family, network, length = parse_prefix(target)
+    bits = FAMILIES[family][1]
+    best = None
+    for rrc in looking_glass['data']['rrcs']:
+        for peer in rrc['peers']:
+            try:
+                route_family, route_network, route_length = parse_prefix(peer['prefix'])
+            except ThroneFormattingError:
+                continue
+            if route_family != family or route_length > length:
+                continue
+            if network >> (bits - route_length) != route_network >> (bits - route_length):
+                continue
+            if best is None or route_length > best[1]:
+                best = (route_network, route_length)
+    return format_prefix(family, *best) if best else target
+
+class _Scheduler():
+    # This class runs periodic jobs on a thread pool. Each job is due once
+    # per period, and a job still running when it is due again is skipped.
+    # Heap entries carry the generation of the job they were pushed for, so
+    # entries left behind by a removed or re-added job are dropped.
+    def __init__(self, workers=4):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='throne-watch')
+        self.heap = []
+        self.jobs = {}
+        self.running = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def add(self, key, func, period, delay=0.0):
+        with self.lock:
+            generation = next(self.counter)
+            self.jobs[key] = (func, period, generation)
+            heapq.heappush(self.heap, (time.monotonic() + delay, generation, key, generation))
+
+    def spread(self, jobs, period, window=None):
+        """
+        Adds (key, func) jobs with their first runs spread evenly over the
+        window (one period by default), so they never all fire at once.
+        """
+        jobs = list(jobs)
+        window = period if window is None else window
+        for i, (key, func) in enumerate(jobs):
+            self.add(key, func, period, delay=window * i / len(jobs))
+
+    def remove(self, key):
+        # Removed jobs are dropped from the heap when they come due
+        with self.lock:
+            self.jobs.pop(key, None)
+
+    def run(self, duration=None):
+        """
+        Runs due jobs until the duration has passed, or forever.
+        """
+        deadline = None if duration is None else time.monotonic() + duration
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                with self.lock:
+                    if not self.heap:
+                        delay = 1.0
+                    else:
+                        due, _, key, generation = self.heap[0]
+                        delay = due - time.monotonic()
+                        job = self.jobs.get(key)
+                        if job is None or job[2] != generation:
+                            heapq.heappop(self.heap)
+                            continue
+                        if delay <= 0:
+                            heapq.heappop(self.heap)
+                            func, period, _ = job
+                            heapq.heappush(self.heap, (due + period, next(self.counter), key, generation))
+                            self._start(key, func)
+                            continue
+                if deadline is not None:
+                    delay = min(delay, deadline - time.monotonic())
+                # Sleep in short slices so Ctrl-C is handled promptly
+                time.sleep(max(0.0, min(delay, 1.0)))
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def _start(self, key, func):
+        running = self.running.get(key)
+        if running is not None and not running.done():
+            log.debug(f"Skipping {key}, the previous run has not finished")
+            return
+        self.running[key] = self.pool.submit(func)
+
+def snapshot(overview, looking_glass):
+    """
+    Reduces prefix-overview and looking-glass responses to the state that
+    is compared between polls. Routes are keyed by collector and then by
+    (peer, prefix), since a peer can send several routes for a target.
+    """
+    routes = _LGParse(looking_glass).parse()
+    collectors = {}
+    for rrc, location, indexes in routes.view():
+        peers = {}
+        for index in indexes:
+            route = routes.peer(index)
+            peers[(route['peer'], route['prefix'])] = {'as_path': route['as_path'], 'community': route['community']}
+        if peers:
+            collectors[rrc] = peers
+    return {
+        'origins': sorted(asn['asn'] for asn in overview['data']['asns'] or []),
+        'collectors': collectors,
+    }
+
+def diff(old, new):
+    """
+    Returns the change events between two snapshots.
+    """
+    events = []
+    if old['origins'] != new['origins']:
+        events.append({'event': 'origin_change', 'old': old['origins'], 'new': new['origins']})
+    for rrc in sorted(new['collectors'].keys() - old['collectors'].keys()):
+        events.append({'event': 'collector_added', 'collector': rrc, 'peers': len(new['collectors'][rrc])})
+    for rrc in sorted(old['collectors'].keys() - new['collectors'].keys()):
+        events.append({'event': 'collector_withdrawn', 'collector': rrc})
+    for rrc in sorted(old['collectors'].keys() & new['collectors'].keys()):
+        old_peers, new_peers = old['collectors'][rrc], new['collectors'][rrc]
+        for peer, prefix in sorted(new_peers.keys() - old_peers.keys()):
+            events.append({'event': 'peer_added', 'collector': rrc, 'peer': peer, 'route': prefix, **new_peers[(peer, prefix)]})
+        for peer, prefix in sorted(old_peers.keys() - new_peers.keys()):
+            events.append({'event': 'peer_withdrawn', 'collector': rrc, 'peer': peer, 'route': prefix})
+        for key in sorted(old_peers.keys() & new_peers.keys()):
+            for field, event in (('as_path', 'path_change'), ('community', 'community_change')):
+                if old_peers[key][field] != new_peers[key][field]:
+                    events.append({
+                        'event': event, 'collector': rrc, 'peer': key[0], 'route': key[1],
+                        'old': old_peers[key][field], 'new': new_peers[key][field],
+                    })
+    return events
+
+class _PrefixWatcher():
+    # This class polls RIPEstat for a set of prefixes and writes NDJSON
+    # events when their routing changes. Targets that share a covering
+    # route are polled once as a group.
+    def __init__(self, targets, interval, emit, workers=4, resolve_every=10):
+        self.targets = list(dict.fromkeys(targets))
+        self.interval = interval
+        self.resolve_every = resolve_every
+        self.emit_line = emit
+        self.scheduler = _Scheduler(workers)
+        self.covering = {}
+        self.groups = {}
+        self.state = {}
+        self.lock = threading.Lock()
+
+    def emit(self, event, prefix, **fields):
+        with self.lock:
+            targets = sorted(self.groups.get(prefix, ()))
+        record = {
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'event': event,
+            'prefix': prefix,
+            'targets': targets,
+        }
+        record.update(fields)
+        with self.lock:
+            self.emit_line(json.dumps(record))
+
+    def _get(self, url):
+        # Polls must see changes, so the response cache is bypassed
+        return json_request._JSONRequest().get_json(url=url, use_cache=False)
+
+    def resolve(self, target):
+        """
+        Finds the route covering a target and moves it to that group.
+        """
+        try:
+            covering = covering_route(target, self._get(f'{RIPELG_URL}{target}'))
+        except Exception as e:
+            # A failed poll must not stop the watch; it is reported and retried
+            self.emit('error', target, message=f'resolve failed: {e}')
+            return
+        with self.lock:
+            previous = self.covering.get(target)
+            if previous == covering:
+                return
+            self.covering[target] = covering
+            if previous is not None:
+                self.groups[previous].discard(target)
+                if not self.groups[previous]:
+                    del self.groups[previous]
+                    self.state.pop(previous, None)
+                    self.scheduler.remove(('poll', previous))
+            new_group = covering not in self.groups
+            self.groups.setdefault(covering, set()).add(target)
+        if previous is not None:
+            self.emit('covering_change', covering, target=target, old=previous, new=covering)
+        if new_group:
+            self.scheduler.add(('poll', covering), lambda: self.poll(covering), self.interval)
+
+    def poll(self, prefix):
+        try:
+            new = snapshot(self._get(f'{RIPEPREFIXOVER_URL}{prefix}'), self._get(f'{RIPELG_URL}{prefix}'))
+        except Exception as e:
+            self.emit('error', prefix, message=str(e))
+            return
+        with self.lock:
+            # The group may have been dropped by resolve while this poll ran
+            if prefix not in self.groups:
+                return
+            old = self.state.get(prefix)
+            self.state[prefix] = new
+        if old is None:
+            log.debug(f"Baseline for {prefix}: origins {new['origins']}, {len(new['collectors'])} collectors")
+            return
+        for event in diff(old, new):
+            self.emit(event.pop('event'), prefix, **event)
+
+    def run(self, duration=None):
+        # Targets are resolved over the first interval, then every few intervals
+        self.scheduler.spread(
+            ((('resolve', target), lambda target=target: self.resolve(target)) for target in self.targets),
+            self.interval * self.resolve_every,
+            window=self.interval,
+        )
+        self.scheduler.run(duration)
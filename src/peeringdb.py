@@ -5,17 +5,13 @@
 import logging
 import click
 # Import Throne Modules
-from src.parsers import json_request
+from src.client import Client
+from src.parsers.pdb_mirror import _PDBMirror
 from src.exceptions import ThroneParsingError
 
 # Set log variable for verbose output
 log = logging.getLogger(__name__)
 
-# URL Variables
-PDB_ORG_ASN = "https://www.peeringdb.com/api/org?asn="
-PDB_IX_NAME = "https://www.peeringdb.com/api/ix?name_search="
-PDB_FAC_NAME = "https://www.peeringdb.com/api/fac?name_search="
-
 @click.group()
 def pdb():
     """
@@ -24,14 +20,27 @@ def pdb():
     pass
 
 @pdb.command()
+@click.option("--full", "-f", is_flag=True, help="Downloads everything again instead of only what changed.", default=False)
+def sync(full):
+    """
+    Mirrors PeeringDB into a local database.\n
+    Once a mirror exists, asn, ix and fac answer from it.
+    """
+    mirror = _PDBMirror()
+    counts = mirror.sync(full=full)
+    click.secho("---PeeringDB Sync---", fg="green")
+    for obj, last_sync, rows in mirror.stats():
+        click.echo(f"{obj}: {rows} objects ({counts.get(obj, 0)} received)")
+    click.secho(f"Mirror stored at {mirror.path}", fg="green")
+
+@pdb.command()
+@click.option("--live", "-l", is_flag=True, help="Queries the PeeringDB API even if a local mirror exists.", default=False)
 @click.argument('as_number', nargs=1, metavar="AS_NUM")
-def asn(as_number):
+def asn(as_number, live):
     """
     Retrieves information about an organization by AS#.
     """
-    url = "{0}{1}".format(PDB_ORG_ASN, as_number)
-    response = json_request._JSONRequest().get_json(url=url)
-    json = response
+    json = {'data': Client(pdb_live=live).pdb_org(as_number)}
     if json['data'] == []:
         raise ThroneParsingError(f"PeeringDB returned a blank result. Please check your query and try again. If the issue persists, manually query PeeringDB to see if the entry exists.\nJSON Returned: {json}")
     else:
@@ -47,14 +56,13 @@ def asn(as_number):
 @pdb.command()
 @click.option("--unformatted", "-u", is_flag=True, help="Returns output unformatted.", default=False)
 @click.option("--count", "-c", help="Changes the number of results returned.", default=3, show_default=3, metavar="NUMBER")
+@click.option("--live", "-l", is_flag=True, help="Queries the PeeringDB API even if a local mirror exists.", default=False)
 @click.argument('ix', nargs=1, metavar="IX")
-def ix(ix, unformatted, count):
+def ix(ix, unformatted, count, live):
     """
     Returns IX search output from PeeringDB.
     """
-    url = "{0}{1}&limit={2}".format(PDB_IX_NAME, ix, count)
-    response = json_request._JSONRequest().get_json(url=url)
-    json = response
+    json = {'data': Client(pdb_live=live).pdb_ix(ix, count)}
     if json['data'] == []:
         raise ThroneParsingError(f"PeeringDB returned a blank result. Please check your query and try again. If the issue persists, manually query PeeringDB to see if the entry exists.\nJSON Returned: {json}")
     else:
@@ -99,13 +107,13 @@ def ix(ix, unformatted, count):
 @pdb.command()
 @click.option("--unformatted", "-u", is_flag=True, help="Returns output unformatted.", default=False)
 @click.option("--count", "-c", help="Changes the number of results returned.", default=3, show_default=3, metavar="NUMBER")
+@click.option("--live", "-l", is_flag=True, help="Queries the PeeringDB API even if a local mirror exists.", default=False)
 @click.argument('fac', nargs=1, metavar="FACILITY")
-def fac(fac, unformatted, count):
+def fac(fac, unformatted, count, live):
     """
     Returns facility search output from PeeringDB.
     """
-    url = "{0}{1}&limit={2}".format(PDB_FAC_NAME, fac, count)
-    json = json_request._JSONRequest().get_json(url=url)
+    json = {'data': Client(pdb_live=live).pdb_fac(fac, count)}
     if json['data'] == []:
         raise ThroneParsingError(f"PeeringDB returned a blank result. Please check your query and try again. If the issue persists, manually query PeeringDB to see if the entry exists.\nJSON Returned: {json}")
     else:
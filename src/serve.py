@@ -0,0 +1,39 @@
+# LICENSED UNDER BSD-3-CLAUSE-CLEAR LICENSE
+# SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
+
+# Import Third Party Modules
+import logging
+import signal
+import sys
+import click
+# Import Throne Modules
+from src.parsers.daemon import API_METHODS, _Daemon
+from src.parsers.daemon_client import SOCKET_PATH
+
+# Set log variable for verbose output
+log = logging.getLogger(__name__)
+
+@click.command()
+@click.option("--socket", "socket_path", default=SOCKET_PATH, envvar='THRONE_SOCKET', show_default=True, type=click.Path(dir_okay=False), help="Unix socket to listen on.", metavar="PATH")
+@click.option("--port", type=click.IntRange(1, 65535), default=None, help="Also serves the JSON lookups on 127.0.0.1:PORT.")
+@click.option("--workers", type=click.IntRange(1), default=16, show_default=True, help="Commands and lookups handled at the same time.")
+def serve(socket_path, port, workers):
+    """
+    Runs a local daemon that answers throne commands. \n
+    While it is listening, `throne` sends each command to it instead of starting up, so connection pools,
+    caches and indexes stay warm. Global options, `api`, `bgp watch` and commands reading piped input still run in-process;
+    set THRONE_NO_DAEMON=1 to bypass it. GET /v1/ip, /v1/prefix, /v1/asn, /v1/prefixes, /v1/lg, /v1/domain and /v1/pdb/org|ix|fac
+    with ?query= return the lookups as JSON.
+    """
+    daemon = _Daemon(workers=workers)
+    daemon.warm()
+    daemon.listen(socket_path, port)
+    # systemd and friends stop services with SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    listening = f"{socket_path} and http://127.0.0.1:{port}" if port else socket_path
+    click.secho(f"Listening on {listening}", fg="green", err=True)
+    log.debug(f"Serving {', '.join(f'/v1/{name}' for name in API_METHODS)}")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -2,6 +2,8 @@
 # SEE PROVIDED LICENSE FILE IN ROOT DIRECTORY
 
 # Import Third Party Modules
+import itertools
+import json
 import logging
 import click
 import yaml
@@ -10,6 +12,7 @@ from pathlib import Path
 # Import Throne Modules
 from src.parsers import json_request, shodan_parser
 from src.exceptions import ThroneFormattingError, ThroneConfigError
+from src.config import load_config, reload_config
 
 # Set log variable for verbose output
 log = logging.getLogger(__name__)
@@ -18,11 +21,8 @@ log = logging.getLogger(__name__)
 home = os.path.expanduser("~")
 config_file = f'{home}/.throne/config.yml'
 
-try:
-    config = yaml.safe_load(open(config_file))
-    shodan_apikey = config['shodan_key']
-except:
-    pass
+if 'shodan_key' in load_config():
+    shodan_apikey = load_config()['shodan_key']
 
 # URLs
 SHODAN_HOST = 'https://api.shodan.io/shodan/host/'
@@ -55,6 +55,7 @@ def setapi():
                 config = yaml.safe_load(throne_config)
                 config.update(shodan_apikey)
                 yaml.safe_dump(shodan_apikey, throne_config)
+        reload_config()
         click.secho("Successfully set Shodan API key.", fg="green")
     except:
         raise ThroneConfigError("Failed to set Shodan API key.")
@@ -112,6 +113,55 @@ def myip(raw):
         click.secho("---Public IP Address---", fg="green")
         click.echo(f"{response}")
 
+def _domain_pages(url):
+    # Yields every page of a domain lookup in order. Shodan only says whether
+    # more pages follow, and every page costs a query credit, so pages are
+    # requested one at a time until it says there are none.
+    request = json_request._JSONRequest()
+    page = request.get_json(url=url)
+    yield page
+    number = 2
+    while page.get('more'):
+        page = request.get_json(url=f'{url}&page={number}')
+        yield page
+        number += 1
+
+def _render_records(name, records):
+    click.secho(f"--{name} Records--", fg="magenta")
+    types = [t for t in shodan_parser.DNS_RECORD_TYPES if t in records]
+    types += [t for t in records if t not in shodan_parser.DNS_RECORD_TYPES]
+    for record_type in types:
+        click.echo(f"{record_type} Records:")
+        for record in records[record_type]:
+            ports = ', '.join((str(x) for x in record['ports']))
+            if ports == "":
+                click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
+            else:
+                click.echo(f" Value: {record['value']}", nl=False)
+                click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
+
+def _dns_domain(domain, url, raw):
+    # Groups the records of every page by subdomain
+    pages = _domain_pages(url)
+    first = next(pages)
+    parser = shodan_parser._DNSDomain(domain)
+    results = parser.header(first)
+    groups = parser.parse(itertools.chain([first], pages))
+    if raw:
+        click.echo(json.dumps(results))
+        for name, records in groups:
+            click.echo(json.dumps({'domain': name, 'records': records}))
+        return
+    click.secho("---Shodan DNS Results---", fg="yellow")
+    click.secho("Domain: ", fg="green", nl=False)
+    click.echo(f"{results['domain']}")
+    click.secho("Shodan Tags: ", fg="green", nl=False)
+    click.echo(f"{', '.join(results['tags'])}")
+    click.secho("Subdomains: ", fg="green", nl=False)
+    click.echo(f"{', '.join(results['subdomains'])}")
+    for name, records in groups:
+        _render_records(name, records)
+
 @shodan.command()
 @click.option(
     '--query-type',
@@ -143,6 +193,9 @@ def dns(query_type, query, raw):
             url = '{0}resolve?hostnames={1}&key={2}'.format(SHODAN_DNS, query, shodan_apikey)
     except NameError:
         raise ThroneConfigError("Is your API key set? Run `throne shodan setapi` to set your API key.")
+    if "domain" in query_type:
+        _dns_domain(query, url, raw)
+        return
     response = json_request._JSONRequest().get_json(url=url)
     parse_json = shodan_parser._DNS(json_result=response, query_type=query_type)
     parse_json.parse()
@@ -161,162 +214,6 @@ def dns(query_type, query, raw):
                 click.secho(f"{result['hostname']}", fg="red", nl=False)
                 click.secho(" resolves to ", nl=False)
                 click.secho(f"{result['ip']}", fg="red")
-        if "domain" in query_type:
-            domain_tags = ', '.join(results['tags'])
-            subdomains = ', '.join(results['subdomains'])
-            all_domains = []
-            types = []
-            records = []
-            click.secho("Domain: ", fg="green", nl=False)
-            click.echo(f"{results['domain']}")
-            click.secho("Shodan Tags: ", fg="green", nl=False)
-            click.echo(f"{domain_tags}")
-            click.secho("Subdomains: ", fg="green", nl=False)
-            click.echo(f"{subdomains}")
-            for domains in results['records']:
-                for domain in domains.items():
-                    all_domains.append(domain[0])
-                    for record in domain[1]:
-                        records.append(record)
-                        record_types = record['type']
-                        if record_types not in types:
-                            types.append(record_types)
-                        else:
-                            pass
-            for domain in all_domains:
-                click.secho(f"--{domain} Records--", fg="magenta")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "A"):
-                        click.echo("A Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "A"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "AAAA"):
-                        click.echo("AAAA Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "AAAA"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "CNAME"):
-                        click.echo("CNAME Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "CNAME"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "MX"):
-                        click.echo("MX Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "MX"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "NS"):
-                        click.echo("NS Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "NS"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "PTR"):
-                        click.echo("PTR Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "PTR"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "CERT"):
-                        click.echo("CERT Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "CERT"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "SRV"):
-                        click.echo("SRV Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "SRV"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "TXT"):
-                        click.echo("TXT Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "TXT"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "SOA"):
-                        click.echo("SOA Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "SOA"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "DNSKEY"):
-                        click.echo("DNSKEY Records:")
-                        break
-                for record in records:
-                    if (record['domain'] == domain) and (record['type'] == "DNSKEY"):
-                        ports = ', '.join((str(x) for x in record['ports']))
-                        if ports == "":
-                            click.echo(f" Value: {record['value']} | Last Seen: {record['last_seen']}")
-                        else:
-                            click.echo(f" Value: {record['value']}", nl=False)
-                            click.echo(f" | Ports Opened: {ports} | Last Seen: {record['last_seen']}")
 
 @shodan.command()
 @click.option('--raw', '-r', is_flag=True)
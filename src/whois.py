@@ -4,28 +4,12 @@
 # Import Third Party Modules
 import logging
 import click
-import yaml
-import os
-from requests import request
 # Import Throne Modules
+from src.client import Client
 
 # Set log variable for verbose output
 log = logging.getLogger(__name__)
 
-# Get home directory
-home = os.path.expanduser("~")
-config_file = f'{home}/.throne/config.yml'
-
-try:
-    config = yaml.safe_load(open(config_file))
-    throne_apikey = config['throne_key']
-except:
-    throne_apikey = None
-
-# URLs
-THRONE_API = "https://api.throne.dev/"
-#THRONE_API = "https://api-dev.throne.dev/"
-
 @click.group()
 def whois():
     """
@@ -33,153 +17,65 @@ def whois():
     """
     pass
 
+def _render_contact(data):
+    # The throne API fills unknown contact fields with the string "null"
+    for field in ('name', 'org', 'address', 'phone', 'email'):
+        value = data.get(field)
+        if value is not None and "null" not in value:
+            click.echo(f" {field.capitalize()}: {value}")
+
 @whois.command()
 @click.argument('domain', nargs=1, metavar="DOMAIN_NAME")
 def domain(domain):
     """
     Get WHOIS information for a specified domain.
     """
-    if throne_apikey:
-        url = "{}whois/domain?query={}".format(THRONE_API, domain)
-        headers = {'Authorization': f'{throne_apikey}'}
-        response = request("GET", url, headers=headers)
-        result = response.json()
+    client = Client()
+    if client.throne_key:
+        result = client.whois_domain(domain)
         # Variables
-        domain_status = ', '.join(result['status'])
-        nameservers = ', '.join(result['whois']['nameservers'])
-        click.secho(f"---{result['domain']} WHOIS Information---", fg="yellow")
-        click.echo(f"Domain: {result['domain']}")
-        if domain_status !="":
+        domain_status = ', '.join(result.status)
+        nameservers = ', '.join(result.nameservers)
+        click.secho(f"---{result.domain} WHOIS Information---", fg="yellow")
+        click.echo(f"Domain: {result.domain}")
+        if domain_status != "":
             click.echo(f"Domain Status: {domain_status}")
-        else:
-            pass
-        try:
+        if nameservers != "":
             click.echo(f"Nameservers: {nameservers}")
-        except:
+        else:
             click.echo(f"Nameservers: No Nameservers Found.")
-        try:
-            for secure in result['whois']['dnssec']:
-                if secure['signed'] == False:
+        for secure in result.dnssec:
+            if secure.get('signed') == False:
+                click.echo(f"DNSSEC Enabled?: {secure['signed']}")
+            if secure.get('signed') == True:
+                for data in secure.get('dsData') or []:
                     click.echo(f"DNSSEC Enabled?: {secure['signed']}")
-                if secure['signed'] == True:
-                    for data in secure['dsData']:
-                        click.echo(f"DNSSEC Enabled?: {secure['signed']}")
-                        click.echo(f" Keytag: {data['keyTag']}\n Algorithm: {data['algorithm']}\n Digest: {data['digest']} \n Digest Type: {data['digestType']}")
-        except:
-            pass
+                    click.echo(f" Keytag: {data['keyTag']}\n Algorithm: {data['algorithm']}\n Digest: {data['digest']} \n Digest Type: {data['digestType']}")
         click.secho(f"--Contact Information--", fg="yellow")
-        for contact in result['registrar']['contact_info']:
+        registrar_contacts = result.registrar.get('contact_info') or {}
+        for contact in registrar_contacts:
             click.secho(f"Registrar {contact.capitalize()} Contact Information:", fg="green")
-            try:
-                for data in result['whois']['contact_info']['registrar']:
-                        if data['name'] is None:
-                            click.echo(f" Name: {result['registrar']['name']}")
-                        else:
-                            click.echo(f" Name: {data['name']}")
-                        if data['address'] != None:
-                            click.echo(f" Address: {data['address']}")
-            except KeyError:
-                click.echo(f" Name: {result['registrar']['name']}")
-            except:
-                pass
-            for data in result['registrar']['contact_info'][contact]:
+            if 'registrar' in result.contacts:
+                for data in result.contacts['registrar']:
+                    click.echo(f" Name: {data['name'] if data.get('name') is not None else result.registrar.get('name')}")
+                    if data.get('address') is not None:
+                        click.echo(f" Address: {data['address']}")
+            else:
+                click.echo(f" Name: {result.registrar.get('name')}")
+            for data in registrar_contacts[contact]:
                 click.echo(f" Phone: {data['phone']}\n Email: {data['email']}")
-        try:
-            for contact in result['whois']['contact_info']:
-                if "registrant" in contact:
-                    #contact = contact
-                    click.secho(f"{contact.capitalize()} Contact Information:", fg="green")
-                    for data in result['whois']['contact_info'][contact]:
-                        if "null" in data['name']:
-                            pass
-                        else:
-                            click.echo(f" Name: {data['name']}")
-                        if "null" in data['org']:
-                            pass
-                        else:
-                            click.echo(f" Org: {data['org']}")
-                        if "null" in data['address']:
-                            pass
-                        else:
-                            click.echo(f" Address: {data['address']}")
-                        if "null" in data['phone']:
-                            pass
-                        else:
-                            click.echo(f" Phone: {data['phone']}")
-                        if "null" in data['email']:
-                            pass
-                        else:
-                            click.echo(f" Email: {data['email']}")
-        except:
-            pass
-        
-        try:
-            for contact in result['whois']['contact_info']:
-                if "admin" in contact:
-                    #contact = contact
+        for role in ('registrant', 'admin', 'tech'):
+            for contact, contacts in result.contacts.items():
+                if role in contact:
                     click.secho(f"{contact.capitalize()} Contact Information:", fg="green")
-                    for data in result['whois']['contact_info'][contact]:
-                        if "null" in data['name']:
-                            pass
-                        else:
-                            click.echo(f" Name: {data['name']}")
-                        if "null" in data['org']:
-                            pass
-                        else:
-                            click.echo(f" Org: {data['org']}")
-                        if "null" in data['address']:
-                            pass
-                        else:
-                            click.echo(f" Address: {data['address']}")
-                        if "null" in data['phone']:
-                            pass
-                        else:
-                            click.echo(f" Phone: {data['phone']}")
-                        if "null" in data['email']:
-                            pass
-                        else:
-                            click.echo(f" Email: {data['email']}")
-        except:
-            pass
-
-        try:
-            for contact in result['whois']['contact_info']:
-                if "tech" in contact:
-                    #contact = contact
-                    click.secho(f"{contact.capitalize()} Contact Information:", fg="green")
-                    for data in result['whois']['contact_info'][contact]:
-                        if "null" in data['name']:
-                            pass
-                        else:
-                            click.echo(f" Name: {data['name']}")
-                        if "null" in data['org']:
-                            pass
-                        else:
-                            click.echo(f" Org: {data['org']}")
-                        if "null" in data['address']:
-                            pass
-                        else:
-                            click.echo(f" Address: {data['address']}")
-                        if "null" in data['phone']:
-                            pass
-                        else:
-                            click.echo(f" Phone: {data['phone']}")
-                        if "null" in data['email']:
-                            pass
-                        else:
-                            click.echo(f" Email: {data['email']}")
-        except:
-            pass
-
-        try:
-            if result['whois']['registration_info'] != {}:
-                click.secho(f"--Registration Info--", fg="yellow")
-                if result['whois']['registration_info']['expiration'] != "":
-                    click.echo(f"Expiration Date: {result['whois']['registration_info']['expiration']}")
-                if result['whois']['registration_info']['registration'] != "":
-                    click.echo(f"Registration Date: {result['whois']['registration_info']['registration']}")
-        except:
-            pass
-    if throne_apikey is None:
+                    for data in contacts:
+                        _render_contact(data)
+        if result.registration:
+            click.secho(f"--Registration Info--", fg="yellow")
+            if result.registration.get('expiration'):
+                click.echo(f"Expiration Date: {result.registration['expiration']}")
+            if result.registration.get('registration'):
+                click.echo(f"Registration Date: {result.registration['registration']}")
+    else:
         click.secho("throne API key required! Run `throne api set` to configure your API key.", fg="red")
-        click.secho("If you do not have an account, please register for one by visting https://api.throne.dev/auth/login and click 'Sign Up' at the bottom of the prompt", fg="red")
\ No newline at end of file
+        click.secho("If you do not have an account, please register for one by visting https://api.throne.dev/auth/login and click 'Sign Up' at the bottom of the prompt", fg="red")
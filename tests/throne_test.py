@@ -12,6 +12,14 @@ def test_ipgeo():
     assert "IP Address: 1.1.1.1" in response.output
     assert "AS Number: AS13335 Cloudflare, Inc." in response.output
 
+def test_ipgeo_batch():
+    print("Testing: throne ip geo --format csv 1.1.1.1 8.8.8.8 1.1.1.1")
+    response = runner.invoke(throne, ["ip", "geo", "--format", "csv", "1.1.1.1", "8.8.8.8", "1.1.1.1"])
+    assert response.exit_code == 0
+    assert response.output.startswith("query,status,")
+    assert len(response.output.splitlines()) == 3
+    assert "AS13335 Cloudflare, Inc." in response.output
+
 def test_ipinfo():
     print("Testing: throne ip info 1.1.1.1")
     response = runner.invoke(throne, ["ip", "info", "1.1.1.1"])
@@ -74,6 +82,13 @@ def test_bgplg_jp():
     assert "Origin AS: 13335" in response.output
     assert "Prefix: 1.1.1.0/24" in response.output
 
+def test_bgplg_rrc_peers():
+    print("Testing: throne bgp lg 1.1.1.1 from RRC00 with every peer")
+    response = runner.invoke(throne, ["bgp", "lg", "1.1.1.1", "--location", "RRC00", "--peers"])
+    assert response.exit_code == 0
+    assert "--RRC00 (" in response.output
+    assert response.output.count("Origin AS: 13335") > 1
+
 def test_bgpprefix():
     print("Testing: throne bgp prefix 1.1.1.0/24")
     response = runner.invoke(throne, ["bgp", "prefix", "1.1.1.0/24"])
@@ -170,4 +185,704 @@ def test_shodan_dns_domain():
     assert "---Shodan DNS Results---" in response.output
     assert "Domain: discord.com" in response.output
     assert "Shodan Tags:" in response.output
-    assert "Subdomains:" in response.output
\ No newline at end of file
+    assert "Subdomains:" in response.output
+
+def test_shodan_domain_pages(monkeypatch):
+    print("Testing: Shodan domain pages are fetched one at a time until the last")
+    from src import shodan
+    from src.parsers import json_request
+    pages = {
+        "https://api.shodan.io/dns/domain/example.com?key=k": {'more': True, 'data': [{'subdomain': 'www', 'type': 'A', 'value': '192.0.2.1'}]},
+        "https://api.shodan.io/dns/domain/example.com?key=k&page=2": {'more': True, 'data': [{'subdomain': 'mail', 'type': 'MX', 'value': 'mx.example.com'}]},
+        "https://api.shodan.io/dns/domain/example.com?key=k&page=3": {'more': False, 'data': [{'subdomain': 'www', 'type': 'AAAA', 'value': '2001:db8::1'}]},
+    }
+    requested = []
+    def get_json(self, url=None, headers=None, use_cache=True):
+        requested.append(url)
+        return pages[url]
+    monkeypatch.setattr(json_request._JSONRequest, "get_json", get_json)
+    fetched = list(shodan._domain_pages("https://api.shodan.io/dns/domain/example.com?key=k"))
+    assert requested == list(pages)
+    assert fetched == list(pages.values())
+
+def test_shodan_domain_parse():
+    print("Testing: Shodan domain records are grouped by subdomain across pages")
+    from src.parsers.shodan_parser import _DNSDomain
+    pages = [
+        {'data': [{'subdomain': 'www', 'type': 'A', 'value': '192.0.2.1', 'ports': [80, 80]}, {'subdomain': '', 'type': 'NS', 'value': 'ns1.example.com'}]},
+        {'data': [{'subdomain': 'mail', 'type': 'MX', 'value': 'mx.example.com'}, {'subdomain': 'www', 'type': 'A', 'value': '192.0.2.2'}]},
+    ]
+    groups = list(_DNSDomain("example.com").parse(pages))
+    assert [name for name, _ in groups] == ["www.example.com", "example.com", "mail.example.com"]
+    www = groups[0][1]
+    assert [record['value'] for record in www['A']] == ['192.0.2.1', '192.0.2.2']
+    assert www['A'][0]['ports'] == [80]
+
+def test_cache_stats(tmp_path, monkeypatch):
+    print("Testing: throne cache stats")
+    monkeypatch.setenv("THRONE_CACHE_DIR", str(tmp_path / "cache"))
+    response = runner.invoke(throne, ["cache", "stats"])
+    assert response.exit_code == 0
+    assert "---Response Cache---" in response.output
+    assert "Entries:" in response.output
+    assert f"Location: {tmp_path / 'cache' / 'responses.sqlite3'}" in response.output
+
+def test_cache_prune(tmp_path, monkeypatch):
+    print("Testing: throne cache prune")
+    monkeypatch.setenv("THRONE_CACHE_DIR", str(tmp_path / "cache"))
+    response = runner.invoke(throne, ["cache", "prune"])
+    assert response.exit_code == 0
+    assert "expired responses." in response.output
+
+def test_cache_ttls(monkeypatch):
+    print("Testing: cache.ttls overrides in config.yml")
+    import pytest
+    from src.exceptions import ThroneConfigError
+    from src.parsers import response_cache
+    monkeypatch.setattr(response_cache, "load_config", lambda: {'cache': {'ttls': {'api.shodan.io/dns/': 0, 'stat.ripe.net/': '60'}}})
+    assert response_cache._load_ttls() == (('api.shodan.io/dns/', 0.0), ('stat.ripe.net/', 60.0))
+    for ttls in ({'stat.ripe.net/': 'soon'}, {'stat.ripe.net/': None}, {'stat.ripe.net/': -5}, ['stat.ripe.net/']):
+        monkeypatch.setattr(response_cache, "load_config", lambda: {'cache': {'ttls': ttls}})
+        with pytest.raises(ThroneConfigError):
+            response_cache._load_ttls()
+
+def test_bgp_index_offline(tmp_path, monkeypatch):
+    print("Testing: throne bgp index build + throne bgp prefix --offline")
+    # Never overwrite the real index in ~/.throne/index
+    monkeypatch.setenv("THRONE_INDEX_DIR", str(tmp_path / "index"))
+    dump = tmp_path / "routes.txt"
+    dump.write_text("1.0.0.0/8 64496\n1.1.1.0/24 13335\nTABLE_DUMP2|1|B|192.0.2.1|64511|2001:db8::/32|64511 64497|IGP\n")
+    response = runner.invoke(throne, ["bgp", "index", "build", str(dump)])
+    assert response.exit_code == 0
+    assert "IPv4: 2 prefixes in 3 ranges" in response.output
+    response = runner.invoke(throne, ["bgp", "prefix", "--offline", "1.1.1.1"])
+    assert response.exit_code == 0
+    assert "Prefix: 1.1.1.0/24" in response.output
+    assert "Announced By: 13335" in response.output
+    response = runner.invoke(throne, ["ip", "info", "--offline", "--input", "-"], input="1.2.3.4\n2001:db8::1\n")
+    assert response.exit_code == 0
+    assert '"prefix": "1.0.0.0/8", "origin_as": 64496' in response.output
+    assert '"prefix": "2001:db8::/32", "origin_as": 64497' in response.output
+
+def test_route_index_prefix_queries(tmp_path):
+    print("Testing: prefix queries are answered by the covering route")
+    from src.parsers.route_index import build_index, _RouteIndex
+    dump = tmp_path / "routes.txt"
+    dump.write_text("10.0.0.0/8 100\n10.0.0.0/24 200\n10.0.0.0/25 300\n")
+    build_index([str(dump)], index_dir=str(tmp_path))
+    index = _RouteIndex(index_dir=str(tmp_path))
+    assert index.lookup("10.0.0.0/16") == ("10.0.0.0/8", 100)
+    assert index.lookup("10.0.0.0/8") == ("10.0.0.0/8", 100)
+    assert index.lookup("10.0.0.0/24") == ("10.0.0.0/24", 200)
+    assert index.lookup("10.0.0.0/26") == ("10.0.0.0/25", 300)
+    assert index.lookup("10.0.0.200") == ("10.0.0.0/24", 200)
+    assert index.lookup("0.0.0.0/0") is None
+
+def _looking_glass(*routes):
+    # A looking-glass response with one RRC00 peer per (prefix, as_path, community)
+    peers = [
+        {'asn_origin': as_path.split()[-1], 'as_path': as_path, 'community': community, 'last_updated': '', 'prefix': prefix,
+         'peer': f'198.51.100.{n}', 'origin': 'IGP', 'next_hop': f'198.51.100.{n}', 'latest_time': ''}
+        for n, (prefix, as_path, community) in enumerate(routes)
+    ]
+    return {'status': 'ok', 'time': '', 'cached': False,
+            'data': {'query_time': '', 'latest_time': '', 'rrcs': [{'rrc': 'RRC00', 'location': 'Amsterdam, Netherlands', 'peers': peers}]}}
+
+def test_lg_as_sets():
+    print("Testing: looking-glass AS paths with AS sets")
+    from src.parsers.lg_parser import _LGParse
+    routes = _LGParse(_looking_glass(("192.0.2.0/24", "64500 64510 {64496,64497}", ""), ("192.0.2.0/24", "64501 64496", ""))).parse()
+    assert routes.peer(0)['as_path'] == "64500 64510 {64496,64497}"
+    assert list(routes.as_path(0)) == [64500, 64510, 64496]
+    assert routes.peer(1)['as_path'] == "64501 64496"
+    assert list(routes.as_path(1)) == [64501, 64496]
+
+def test_watch_snapshot_diff():
+    print("Testing: bgp watch snapshots and change events")
+    from src.parsers.watch import covering_route, diff, snapshot
+    overview = {'data': {'asns': [{'asn': 64496}]}}
+    old = snapshot(overview, _looking_glass(("192.0.2.0/24", "64500 64496", "64500:1"), ("192.0.2.0/24", "64501 64496", "")))
+    assert old['origins'] == [64496]
+    assert old['collectors'] == {'RRC00': {
+        ('198.51.100.0', '192.0.2.0/24'): {'as_path': '64500 64496', 'community': '64500:1'},
+        ('198.51.100.1', '192.0.2.0/24'): {'as_path': '64501 64496', 'community': ''},
+    }}
+    new = snapshot({'data': {'asns': [{'asn': 64497}]}}, _looking_glass(("192.0.2.0/24", "64500 64510 64496", "64500:2")))
+    events = diff(old, new)
+    assert events == [
+        {'event': 'origin_change', 'old': [64496], 'new': [64497]},
+        {'event': 'peer_withdrawn', 'collector': 'RRC00', 'peer': '198.51.100.1', 'route': '192.0.2.0/24'},
+        {'event': 'path_change', 'collector': 'RRC00', 'peer': '198.51.100.0', 'route': '192.0.2.0/24', 'old': '64500 64496', 'new': '64500 64510 64496'},
+        {'event': 'community_change', 'collector': 'RRC00', 'peer': '198.51.100.0', 'route': '192.0.2.0/24', 'old': '64500:1', 'new': '64500:2'},
+    ]
+    # A peer sending a more-specific next to its route keeps both, and announcing it is an event
+    more_specific = _looking_glass(("192.0.2.0/24", "64500 64496", "64500:1"), ("192.0.2.0/24", "64501 64496", ""), ("192.0.2.0/25", "64501 64496", ""))
+    more_specific['data']['rrcs'][0]['peers'][2]['peer'] = '198.51.100.1'
+    both = snapshot(overview, more_specific)
+    assert len(both['collectors']['RRC00']) == 3
+    assert diff(old, both) == [
+        {'event': 'peer_added', 'collector': 'RRC00', 'peer': '198.51.100.1', 'route': '192.0.2.0/25', 'as_path': '64501 64496', 'community': ''},
+    ]
+    assert diff(both, old) == [{'event': 'peer_withdrawn', 'collector': 'RRC00', 'peer': '198.51.100.1', 'route': '192.0.2.0/25'}]
+    assert diff(old, snapshot(overview, _looking_glass())) == [{'event': 'collector_withdrawn', 'collector': 'RRC00'}]
+    assert diff(old, old) == []
+    routes = _looking_glass(("192.0.2.0/23", "64500 64496", ""), ("192.0.2.0/24", "64501 64496", ""), ("198.51.100.0/24", "64501 64497", ""))
+    assert covering_route("192.0.2.64/26", routes) == "192.0.2.0/24"
+    assert covering_route("192.0.2.0/24", routes) == "192.0.2.0/24"
+    assert covering_route("203.0.113.0/24", routes) == "203.0.113.0/24"
+
+def test_watch_scheduler():
+    print("Testing: bgp watch scheduler drops removed and replaced jobs")
+    from src.parsers.watch import _Scheduler
+    runs = {'kept': 0, 'removed': 0}
+    scheduler = _Scheduler(workers=2)
+    scheduler.add('kept', lambda: runs.__setitem__('kept', runs['kept'] + 1), 0.1)
+    scheduler.add('removed', lambda: runs.__setitem__('removed', runs['removed'] + 1), 0.1, delay=0.05)
+    scheduler.remove('removed')
+    # Re-adding must not leave the first heap entry running as well
+    scheduler.remove('kept')
+    scheduler.add('kept', lambda: runs.__setitem__('kept', runs['kept'] + 1), 0.1)
+    scheduler.run(0.35)
+    assert runs['removed'] == 0
+    assert 3 <= runs['kept'] <= 4
+
+def test_ip_geo_offline(tmp_path, monkeypatch):
+    print("Testing: throne ip geo-index build + throne ip geo --offline")
+    monkeypatch.setenv("THRONE_INDEX_DIR", str(tmp_path / "index"))
+    database = tmp_path / "geo.csv"
+    database.write_text(
+        "network,country_code,region,city,latitude,longitude\n"
+        "1.1.1.0/24,AU,Queensland,Brisbane,-27.47,153.02\n"
+        "8.8.8.0/24,US,California,Mountain View,N/A,N/A\n"
+        "8.8.4.0/24,US,California,Mountain View,37.4,-222.1\n"
+        "9.9.9.0/24,CH,,Zurich,,\n"
+    )
+    response = runner.invoke(throne, ["ip", "geo-index", "build", str(database)])
+    assert response.exit_code == 0
+    assert "IPv4: 2 ranges" in response.output
+    assert "Skipped 2 unparseable or overlapping rows." in response.output
+    response = runner.invoke(throne, ["ip", "geo", "--offline", "--format", "ndjson", "1.1.1.1", "8.8.8.8", "9.9.9.9"])
+    assert response.exit_code == 0
+    assert '"city": "Brisbane"' in response.output
+    assert '"lat": -27.47' in response.output
+    assert '"city": "Zurich", "lat": null' in response.output
+    assert '"status": "fail"' in response.output
+
+def test_replay(tmp_path):
+    print("Testing: throne --replay DIR bgp prefix 1.1.1.0/24")
+    from src.parsers import recorder
+    from src.parsers.timings import get_timings
+    from src.parsers.response_cache import get_cache
+    from src.parsers.transport import get_transport
+    body = b'{"data": {"resource": "1.1.1.0/24", "asns": [{"asn": 13335, "holder": "CLOUDFLARENET"}], "block": {"resource": "1.0.0.0/8", "desc": "APNIC", "name": "IANA"}}}'
+    exchange = {'status': 200, 'headers': {'Content-Type': 'application/json'}}
+    store = recorder._Recorder(str(tmp_path), 'record')
+    store.record('GET', 'https://stat.ripe.net/data/prefix-overview/data.json?resource=1.1.1.0/24', None, recorder.response(exchange, body), 0.0)
+    try:
+        response = runner.invoke(throne, ["--replay", str(tmp_path), "bgp", "prefix", "1.1.1.0/24"])
+        assert response.exit_code == 0
+        assert "Prefix: 1.1.1.0/24" in response.output
+        response = runner.invoke(throne, ["--replay", str(tmp_path), "bgp", "prefix", "9.9.9.0/24"])
+        assert "No recorded response" in str(response.exception)
+        response = runner.invoke(throne, ["--replay", str(tmp_path), "--timings", "bgp", "prefix", "1.1.1.0/24"])
+        assert response.exit_code == 0
+        assert "GET stat.ripe.net/data/prefix-overview/data.json 200" in response.output
+        assert "bgp prefix 1.1.1.0/24: " in response.output
+        get_timings().enabled = False
+        response = runner.invoke(throne, ["--replay", str(tmp_path), "bgp", "prefix", "1.1.1.0/24"], env={"THRONE_TIMINGS": "0"})
+        assert response.exit_code == 0
+        assert "GET stat.ripe.net" not in response.output
+        response = runner.invoke(throne, ["--replay", str(tmp_path), "bgp", "prefix", "1.1.1.0/24"], env={"THRONE_TIMINGS": "json"})
+        assert response.exit_code == 0
+        assert '"span": "request"' in response.output
+        response = runner.invoke(throne, ["--replay", str(tmp_path), "bgp", "prefix", "1.1.1.0/24"], env={"THRONE_TIMINGS": "yes"})
+        assert response.exit_code == 2
+        assert "THRONE_TIMINGS must be one of" in response.output
+    finally:
+        get_timings().enabled = False
+        get_transport().recorder = None
+        get_cache().enabled = True
+
+def test_ipinfo_input(tmp_path, monkeypatch):
+    print("Testing: throne --replay DIR ip info --input FILE")
+    import json
+    from benchmarks import stub
+    from src import config
+    from src.parsers import recorder
+    from src.parsers.response_cache import get_cache
+    from src.parsers.transport import get_transport
+    monkeypatch.setattr(config, "_config", {'throne_key': 'Bearer test'})
+    exchange = {'status': 200, 'headers': {'Content-Type': 'application/json'}}
+    store = recorder._Recorder(str(tmp_path / "recording"), 'record')
+    for address in ("1.1.1.1", "1.1.1.2"):
+        for url, fixture in ((f'https://api.throne.dev/whois/ip?query={address}', 'whois_ip'),
+                             (f'https://stat.ripe.net/data/prefix-overview/data.json?resource={address}', 'prefix_overview')):
+            store.record('GET', url, None, recorder.response(exchange, json.dumps(stub.load_fixture(fixture)).encode()), 0.0)
+    addresses = tmp_path / "addresses.txt"
+    addresses.write_text("# one per line\n1.1.1.1\n\n9.9.9.9\n1.1.1.2\n")
+    try:
+        response = runner.invoke(throne, ["--replay", str(tmp_path / "recording"), "ip", "info", "--input", str(addresses), "--threads", "2"])
+        assert response.exit_code == 0
+        records = {record['query']: record for record in map(json.loads, response.output.splitlines())}
+        assert sorted(records) == ["1.1.1.1", "1.1.1.2", "9.9.9.9"]
+        assert records["1.1.1.1"]['rir'] == "APNIC" and records["1.1.1.2"]['asns'][0]['asn'] == 13335
+        assert "No recorded response" in records["9.9.9.9"]['error']
+    finally:
+        get_transport().recorder = None
+        get_cache().enabled = True
+    response = runner.invoke(throne, ["ip", "info", "1.1.1.1", "--input", str(addresses)])
+    assert response.exit_code == 2 and "not both" in response.output
+    response = runner.invoke(throne, ["ip", "info", "--all", "--input", str(addresses)])
+    assert response.exit_code == 2 and "--all only works" in response.output
+
+def test_batch_bounded_map():
+    print("Testing: bounded_map keeps a bounded number of items in flight")
+    import threading
+    from src.parsers.batch import bounded_map
+    consumed = []
+    running = []
+    peak = []
+    lock = threading.Lock()
+    def items():
+        for item in range(20):
+            consumed.append(item)
+            yield item
+    def square(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(item)
+        if item == 7:
+            raise ValueError("seven")
+        return item * item
+    results = bounded_map(square, items(), workers=3)
+    first = next(results)
+    # No more than workers * 2 items are taken from the iterable ahead of the results
+    assert len(consumed) == 6
+    results = [first] + list(results)
+    assert sorted(item for item, _, _ in results) == list(range(20))
+    assert all(result == item * item for item, result, error in results if error is None)
+    assert [(item, str(error)) for item, _, error in results if error is not None] == [(7, "seven")]
+    assert max(peak) <= 3
+
+def test_client(tmp_path):
+    print("Testing: Client().lookup_prefix('1.1.1.0/24')")
+    from src.client import Client, to_dict
+    from src.parsers import recorder
+    from src.parsers.transport import get_transport
+    body = b'{"data": {"resource": "1.1.1.0/24", "announced": true, "asns": [{"asn": 13335, "holder": "CLOUDFLARENET"}], "block": {"resource": "1.0.0.0/8", "desc": "APNIC", "name": "IANA"}}}'
+    exchange = {'status': 200, 'headers': {'Content-Type': 'application/json'}}
+    store = recorder._Recorder(str(tmp_path), 'replay')
+    store.record('GET', 'https://stat.ripe.net/data/prefix-overview/data.json?resource=1.1.1.0/24', None, recorder.response(exchange, body), 0.0)
+    get_transport().recorder = store
+    try:
+        info = Client().lookup_prefix('1.1.1.0/24')
+        assert info.prefix == "1.1.1.0/24"
+        assert info.asns[0].asn == 13335
+        assert to_dict(info)['block'] == {'resource': '1.0.0.0/8', 'name': 'IANA', 'desc': 'APNIC'}
+    finally:
+        get_transport().recorder = None
+
+def test_serve(tmp_path):
+    print("Testing: GET /v1/prefix?query=1.1.1.0/24 on the throne serve socket")
+    import json
+    import socket
+    import threading
+    from src.parsers import recorder
+    from src.parsers.daemon import _Daemon
+    from src.parsers.daemon_client import local_command
+    from src.parsers.transport import get_transport
+    assert local_command(["--no-cache", "bgp", "prefix", "1.1.1.0/24"])
+    assert local_command(["bgp", "watch", "1.1.1.0/24"])
+    assert not local_command(["bgp", "prefix", "1.1.1.0/24"])
+    body = b'{"data": {"resource": "1.1.1.0/24", "announced": true, "asns": [{"asn": 13335, "holder": "CLOUDFLARENET"}], "block": {"resource": "1.0.0.0/8", "desc": "APNIC", "name": "IANA"}}}'
+    exchange = {'status': 200, 'headers': {'Content-Type': 'application/json'}}
+    store = recorder._Recorder(str(tmp_path / "recording"), 'replay')
+    store.record('GET', 'https://stat.ripe.net/data/prefix-overview/data.json?resource=1.1.1.0/24', None, recorder.response(exchange, body), 0.0)
+    get_transport().recorder = store
+    daemon = _Daemon(workers=2)
+    daemon.listen(str(tmp_path / "throne.sock"))
+    server = daemon.servers[0]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(str(tmp_path / "throne.sock"))
+        client.sendall(b"GET /v1/prefix?query=1.1.1.0/24 HTTP/1.0\r\n\r\n")
+        response = client.makefile('rb').read()
+        client.close()
+        headers, _, data = response.partition(b"\r\n\r\n")
+        assert headers.startswith(b"HTTP/1.0 200")
+        assert json.loads(data)['asns'] == [{'asn': 13335, 'holder': 'CLOUDFLARENET'}]
+        assert 'rate_limits' in daemon.status()
+    finally:
+        server.shutdown()
+        server.server_close()
+        daemon.pool.shutdown()
+        get_transport().recorder = None
+
+def test_serve_run(tmp_path, monkeypatch, capsys):
+    print("Testing: commands forwarded to throne serve and lookup errors")
+    import json
+    import socket
+    import sys
+    import threading
+    from src.parsers import daemon_client, recorder
+    from src.parsers.daemon import _Daemon, _ThreadLocalStream
+    from src.parsers.transport import get_transport
+    body = b'{"data": {"resource": "1.1.1.0/24", "announced": true, "asns": [{"asn": 13335, "holder": "CLOUDFLARENET"}], "block": {"resource": "1.0.0.0/8", "desc": "APNIC", "name": "IANA"}}}'
+    exchange = {'status': 200, 'headers': {'Content-Type': 'application/json'}}
+    store = recorder._Recorder(str(tmp_path / "recording"), 'replay')
+    store.record('GET', 'https://stat.ripe.net/data/prefix-overview/data.json?resource=1.1.1.0/24', None, recorder.response(exchange, body), 0.0)
+    get_transport().recorder = store
+    path = str(tmp_path / "throne.sock")
+    monkeypatch.setenv("THRONE_SOCKET", path)
+    monkeypatch.delenv("THRONE_NO_DAEMON", raising=False)
+    monkeypatch.delenv("THRONE_TIMINGS", raising=False)
+    # What serve_forever does before serving
+    for name in ('stdin', 'stdout', 'stderr'):
+        monkeypatch.setattr(sys, name, _ThreadLocalStream(getattr(sys, name)))
+    daemon = _Daemon(workers=2)
+    daemon.listen(path)
+    server = daemon.servers[0]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    def request(raw):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+        client.sendall(raw)
+        response = client.makefile('rb').read()
+        client.close()
+        headers, _, data = response.partition(b"\r\n\r\n")
+        return headers.split(b"\r\n")[0], data
+    try:
+        capsys.readouterr()
+        assert daemon_client.forward(["bgp", "prefix", "1.1.1.0/24"]) == 0
+        assert daemon_client.forward(["ip", "info"]) == 2
+        output = capsys.readouterr()
+        assert "Prefix: 1.1.1.0/24" in output.out
+        assert "Provide an IP_OR_PREFIX or use --input FILE." in output.err
+        assert daemon.commands == 2
+        run = json.dumps({'args': ["bgp", "watch", "1.1.1.0/24"]}).encode()
+        status, data = request(b"POST /run HTTP/1.0\r\nContent-Length: %d\r\n\r\n%s" % (len(run), run))
+        assert status.startswith(b"HTTP/1.0 400") and b"has to run in-process" in data
+        daemon.lookup = lambda method, query: {}['data']
+        status, data = request(b"GET /v1/prefix?query=1.1.1.0/24 HTTP/1.0\r\n\r\n")
+        assert status.startswith(b"HTTP/1.0 500")
+        assert json.loads(data) == {'error': "KeyError: 'data'"}
+    finally:
+        server.shutdown()
+        server.server_close()
+        daemon.pool.shutdown()
+        get_transport().recorder = None
+
+def test_rate_limiter(monkeypatch):
+    print("Testing: token bucket, Retry-After and backoff")
+    import pytest
+    from email.utils import formatdate
+    from src.exceptions import ThroneConfigError
+    from src.parsers import ratelimit
+    bucket = ratelimit._TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert 0.09 < bucket.reserve() <= 0.1
+    bucket.pause(1.0)
+    assert 1.0 < bucket.reserve() <= 1.2
+    assert ratelimit.retry_after("5") == 5.0
+    assert ratelimit.retry_after("-3") == 0.0
+    assert 25 < ratelimit.retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert ratelimit.retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0
+    assert ratelimit.retry_after("soon") is None
+    assert ratelimit.retry_after(None) is None
+    limiter = ratelimit._RateLimiter(
+        limits={'example.com': {'rate': 10, 'burst': 1}, 'example.com/batch': {'rate': 1, 'burst': 1}},
+        retry={'backoff': 1.0, 'max_backoff': 8.0},
+    )
+    assert limiter.key('example.com', '/batch/x') == 'example.com/batch'
+    assert limiter.key('example.com', '/json') == 'example.com'
+    # Retry-After is honored up to max_backoff, otherwise the backoff doubles with jitter
+    assert limiter.backoff('example.com', 0, '3') == 3.0
+    assert limiter.backoff('example.com', 0, '120') == 8.0
+    for attempt, ceiling in ((0, 1.0), (2, 4.0), (6, 8.0)):
+        assert ceiling / 2 <= limiter.backoff('example.com', attempt) <= ceiling
+    # Other requests to the host wait out the last backoff
+    assert limiter._bucket('example.com').reserve() > 4.0
+    assert limiter.stats()['example.com']['retries'] == 5
+    assert limiter._bucket('other.example') is None
+    for section in ({'example.com': 5}, {'example.com': {'burst': 5}}, {'example.com': {'rate': 'fast'}}, {'example.com': {'rate': 0}}):
+        monkeypatch.setattr(ratelimit, "load_config", lambda: {'rate_limits': section})
+        with pytest.raises(ThroneConfigError):
+            ratelimit.load_rate_limiter()
+    for retry in ({'attempts': 'three'}, {'attempts': 2.5}, {'backoff': -1}, {'max_backoff': None}, {'base': 1}):
+        monkeypatch.setattr(ratelimit, "load_config", lambda: {'retry': retry})
+        with pytest.raises(ThroneConfigError):
+            ratelimit.load_rate_limiter()
+    monkeypatch.setattr(ratelimit, "load_config", lambda: {
+        'rate_limits': {'example.com': {'rate': '2'}, 'stat.ripe.net': None},
+        'retry': {'attempts': '3', 'backoff': 0.5},
+    })
+    limiter = ratelimit.load_rate_limiter()
+    assert limiter.limits['example.com'] == {'rate': 2.0, 'burst': 1.0}
+    assert limiter.limits['stat.ripe.net'] is None
+    assert limiter.retry == {'attempts': 3, 'backoff': 0.5, 'max_backoff': 60.0}
+
+def test_json_stream(monkeypatch):
+    print("Testing: streamed JSON arrays split at every byte")
+    import json
+    import pytest
+    from src.exceptions import ThroneParsingError
+    from src.parsers import json_stream
+    document = {
+        'skipped': {'text': 'a "quoted" ] } string', 'list': [1, [2, {'matches': []}]], 'flag': False},
+        'data': {
+            'count': -12.5e3,
+            'matches': [
+                {'ip': '1.1.1.1', 'note': 'back\\slash "quote" tab\t', 'port': 443},
+                'café 😀 über', 'escaped',
+                -2.75e-3, 12345678901234567890, 0, True, None, [], {},
+                {'nested': {'matches': [7, 8]}},
+            ],
+        },
+    }
+    # Multi-byte UTF-8 split between chunks, and the same text as \uXXXX escapes
+    body = json.dumps(document, ensure_ascii=False).encode('utf-8').replace(b'"escaped"', b'"caf\\u00e9 \\ud83d\\ude00"')
+    expected = [item if item != 'escaped' else 'café 😀' for item in document['data']['matches']]
+    # Small enough that consumed text is trimmed while streaming
+    monkeypatch.setattr(json_stream, "TRIM_SIZE", 16)
+    for split in range(1, len(body)):
+        assert list(json_stream.iter_array([body[:split], body[split:]], ('data', 'matches'))) == expected
+    assert list(json_stream.iter_array([body[i:i + 1] for i in range(len(body))], ('data', 'matches'))) == expected
+    for size in (2, 3, 7):
+        chunks = [body[i:i + size] for i in range(0, len(body), size)]
+        assert list(json_stream.iter_array(chunks, ('data', 'matches'))) == expected
+    # A number split across chunks is not yielded until it is complete
+    assert list(json_stream.iter_array([b'[-2', b'.', b'5e', b'1', b'0, 1', b'2]'], ())) == [-2.5e10, 12]
+    assert list(json_stream.iter_array([b'{"a": [ ', b' ]}'], ('a',))) == []
+    assert json_stream.find_array(document, ('data', 'matches')) == document['data']['matches']
+    for stream in ([b'{"data": {"other": []}}'], [b'{"data": {"matches": [1, 2'], [b'{"data": []}']):
+        with pytest.raises(ThroneParsingError):
+            list(json_stream.iter_array(stream, ('data', 'matches')))
+    with pytest.raises(ThroneParsingError):
+        json_stream.find_array({'data': []}, ('data', 'matches'))
+
+def test_transport_no_addresses(monkeypatch):
+    print("Testing: a hostname that resolves to no addresses")
+    import pytest
+    import socket
+    from urllib3.exceptions import NewConnectionError
+    from src.parsers import transport
+    lookups = []
+    def getaddrinfo(*args):
+        lookups.append(args)
+        return []
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    connection = transport._CachedHTTPConnection('empty.example', 80)
+    for _ in range(2):
+        with pytest.raises(NewConnectionError):
+            connection._new_conn()
+    # An empty answer is not cached
+    assert len(lookups) == 2
+
+def test_pdb_mirror(tmp_path, monkeypatch):
+    print("Testing: PeeringDB mirror sync, deltas and name search")
+    import sqlite3
+    from src.parsers import json_request
+    from src.parsers.pdb_mirror import _PDBMirror
+    rows = {
+        'org': [{'id': 1, 'status': 'ok', 'name': 'Cloudflare, Inc.', 'aka': ''}, {'id': 2, 'status': 'ok', 'name': 'Example Networks', 'aka': 'EXNET'}],
+        'net': [{'id': 10, 'status': 'ok', 'asn': 13335, 'org_id': 1, 'name': 'Cloudflare'}, {'id': 11, 'status': 'ok', 'asn': 64496, 'org_id': 2, 'name': 'Example'}],
+        'ix': [{'id': 20, 'status': 'ok', 'org_id': 2, 'name': 'AMS-IX', 'name_long': 'Amsterdam Internet Exchange', 'aka': ''}],
+    }
+    urls = []
+    def iter_json(self, url=None, path=(), headers=None, use_cache=True):
+        urls.append(url)
+        obj = url.split('/api/')[1].split('?')[0]
+        return iter(rows.get(obj, []))
+    monkeypatch.setattr(json_request._JSONRequest, "iter_json", iter_json)
+    real_version = sqlite3.sqlite_version_info
+    for trigram, version in ((True, real_version), (False, (3, 31, 1))):
+        monkeypatch.setattr(sqlite3, "sqlite_version_info", version)
+        mirror = _PDBMirror(str(tmp_path / f"peeringdb-{trigram}.sqlite3"))
+        urls.clear()
+        assert mirror.sync()['org'] == 2
+        assert all(url.endswith('?depth=0') for url in urls)
+        assert mirror.exists() and mirror.trigram == trigram
+        assert mirror.org_by_asn(64496)[0]['name'] == "Example Networks"
+        assert [org['id'] for org in mirror.search('org', 'networks', 10)] == [2]
+        assert [org['id'] for org in mirror.search('org', 'xne', 10)] == [2]
+        assert [org['id'] for org in mirror.search('org', 'n', 1)] == [1]
+        assert [ix['id'] for ix in mirror.search('ix', 'dam inter', 10)] == [20]
+        # A delta renames one organization and deletes the other
+        delta = {'org': [{'id': 1, 'status': 'ok', 'name': 'Cloudflare Networks', 'aka': ''}, {'id': 2, 'status': 'deleted', 'name': 'Example Networks', 'aka': 'EXNET'}]}
+        full, rows = rows, delta
+        urls.clear()
+        assert mirror.sync() == {'org': 2, 'net': 0, 'ix': 0, 'ixlan': 0, 'ixpfx': 0, 'netixlan': 0, 'fac': 0, 'netfac': 0}
+        assert all('&since=' in url for url in urls)
+        assert mirror.org_by_asn(64496) == []
+        assert [org['id'] for org in mirror.search('org', 'networks', 10)] == [1]
+        assert mirror.search('org', 'exnet', 10) == []
+        assert dict((obj, count) for obj, _, count in mirror.stats())['org'] == 1
+        # Reopening keeps using the index the mirror was created with
+        monkeypatch.setattr(sqlite3, "sqlite_version_info", real_version)
+        reopened = _PDBMirror(mirror.path)
+        assert reopened.search('org', 'flare', 10)[0]['name'] == "Cloudflare Networks"
+        assert reopened.trigram == trigram
+        rows = full
+
+def test_async_json_request(monkeypatch):
+    print("Testing: gather_json order, duplicate URLs and errors")
+    import asyncio
+    import json
+    import pytest
+    from src.exceptions import ThroneHTTPError
+    from src.parsers import json_request
+    calls = []
+    def get(self, url, headers, use_cache):
+        calls.append((url, headers))
+        number = int(url.rsplit('=', 1)[1])
+        # Later URLs answer first
+        time.sleep(0.05 - number * 0.01)
+        if number == 3:
+            raise ThroneHTTPError(f"503\n{url}")
+        return json.dumps({'n': number, 'auth': (headers or {}).get('Authorization')}).encode(), False
+    monkeypatch.setattr(json_request._JSONRequest, "_get", get)
+    requests = json_request.AsyncJSONRequest(limit=2)
+    urls = ["https://example.com/?n=1", "https://example.com/?n=2", ("https://example.com/?n=1", {'Authorization': 'key'}), "https://example.com/?n=1", "https://example.com/?n=4"]
+    results = asyncio.run(requests.gather_json(urls))
+    assert [result['n'] for result in results] == [1, 2, 1, 1, 4]
+    assert [result['auth'] for result in results] == [None, None, 'key', None, None]
+    # The duplicate of the first URL is fetched once, other headers are another request
+    assert len(calls) == 4
+    assert asyncio.run(json_request.AsyncJSONRequest().get_json("https://example.com/?n=2")) == {'n': 2, 'auth': None}
+    with pytest.raises(ThroneHTTPError):
+        asyncio.run(json_request.AsyncJSONRequest().gather_json(["https://example.com/?n=1", "https://example.com/?n=3"]))
+    results = asyncio.run(json_request.AsyncJSONRequest().gather_json(["https://example.com/?n=3", "https://example.com/?n=2", "https://example.com/?n=3"], return_exceptions=True))
+    assert isinstance(results[0], ThroneHTTPError) and results[0] is results[2]
+    assert results[1] == {'n': 2, 'auth': None}
+
+def test_singleflight():
+    print("Testing: concurrent identical calls are coalesced")
+    import threading
+    from src.parsers.singleflight import _SingleFlight
+    flights = _SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return b'{}'
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do('key', fetch, endpoint='example')))
+    leader.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(flights.do('key', fetch, endpoint='example'))) for _ in range(4)]
+    for waiter in waiters:
+        waiter.start()
+    while flights.stats()['calls'] < 5:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join(5)
+    assert len(calls) == 1
+    assert results == [b'{}'] * 5
+    assert flights.stats()['endpoints']['example'] == {'calls': 5, 'coalesced': 4}
+
+def test_range_cache(tmp_path):
+    print("Testing: cached whois allocations answer addresses inside them")
+    from src.client import _span
+    from src.parsers.response_cache import _ResponseCache
+    cache = _ResponseCache(path=str(tmp_path / "responses.sqlite3"))
+    url = "https://api.throne.dev/whois/ip?query={}"
+    cache.set_range(url.format("10.0.0.1"), *_span("10.0.0.0/8"), b'"10/8"')
+    cache.set_range(url.format("10.1.2.3"), *_span("10.1.0.0/16"), b'"10.1/16"')
+    assert cache.get_range(url.format("10.200.0.1"), *_span("10.200.0.1")) == b'"10/8"'
+    assert cache.get_range(url.format("10.1.9.9"), *_span("10.1.9.9")) == b'"10.1/16"'
+    assert cache.get_range(url.format("10.1.0.0/24"), *_span("10.1.0.0/24")) == b'"10.1/16"'
+    assert cache.get_range(url.format("11.0.0.1"), *_span("11.0.0.1")) is None
+    assert cache.get_range(url.format("2001:db8::1"), *_span("2001:db8::1")) is None
+    assert cache.get_range("https://stat.ripe.net/data/prefix-overview/data.json?resource=10.0.0.1", *_span("10.0.0.1")) is None
+
+def test_sweep(tmp_path):
+    print("Testing: sweeps jump over allocations and announced prefixes")
+    from types import SimpleNamespace
+    from src.parsers.sweep import _Sweep
+    def lookup_ip(address):
+        queried.append(address)
+        low = int(address.split('.')[2]) < 2
+        return SimpleNamespace(
+            start_address="10.0.0.0" if low else "10.0.2.0", end_address="10.0.1.255" if low else "10.0.3.255",
+            rir="RIPE", name="LOW" if low else "HIGH", entities=[], announced=address.startswith("10.0.0."),
+            prefix="10.0.0.0/24", asns=[SimpleNamespace(asn=64500)])
+    queried = []
+    client = SimpleNamespace(lookup_ip=lookup_ip)
+    records = list(_Sweep(client, "10.0.0.0/22", workers=1).run())
+    assert [(r['start'], r['end']) for r in records] == [("10.0.0.0", "10.0.0.255"), ("10.0.1.0", "10.0.1.255"), ("10.0.2.0", "10.0.3.255")]
+    assert records[0]['asns'] == [64500] and records[1]['asns'] == [] and records[2]['holder'] == "HIGH"
+    state = str(tmp_path / "sweep.json")
+    queried = []
+    # Progress is saved once a record has been handled, here the first one
+    for record in _Sweep(client, "10.0.0.0/22", workers=1, state_path=state).run():
+        if record['start'] != "10.0.0.0":
+            break
+    queried = []
+    assert [r['start'] for r in _Sweep(client, "10.0.0.0/22", workers=1, state_path=state).run()] == ["10.0.1.0", "10.0.2.0"]
+    assert queried == ["10.0.1.0", "10.0.2.0"]
+    # Resuming with another thread count walks what is left, cut along the new sub-ranges
+    state = str(tmp_path / "threads.json")
+    for record in _Sweep(client, "10.0.0.0/22", workers=1, state_path=state).run():
+        if record['start'] != "10.0.0.0":
+            break
+    queried = []
+    records = list(_Sweep(client, "10.0.0.0/22", workers=4, state_path=state).run())
+    assert sorted(r['start'] for r in records) == ["10.0.1.0", "10.0.2.0", "10.0.3.0"]
+    assert sorted(queried) == ["10.0.1.0", "10.0.2.0", "10.0.3.0"]
+    # Any failed lookup becomes an error segment a /24 long
+    from urllib3.exceptions import NewConnectionError
+    def failing_lookup(address):
+        if address == "10.0.1.0":
+            raise KeyError('startAddress')
+        if address == "10.0.2.0":
+            raise NewConnectionError(None, "Failed to resolve api.throne.dev")
+        return lookup_ip(address)
+    records = list(_Sweep(SimpleNamespace(lookup_ip=failing_lookup), "10.0.0.0/22", workers=1).run())
+    assert [(r['start'], r['end'], 'error' in r) for r in records] == [
+        ("10.0.0.0", "10.0.0.255", False), ("10.0.1.0", "10.0.1.255", True), ("10.0.2.0", "10.0.2.255", True), ("10.0.3.0", "10.0.3.255", False),
+    ]
+
+def test_prefix_set():
+    print("Testing: prefix sets aggregate and combine address space")
+    from src.parsers.prefix_set import _PrefixSet
+    first = _PrefixSet(["10.0.0.0/24", "10.0.1.0/24", "10.0.0.0/25", "10.0.4.0/22", "2001:db8::/33", "2001:db8:8000::/33"])
+    second = _PrefixSet(["10.0.1.128/25", "10.0.6.0/23", "192.0.2.0/24"])
+    assert len(first) == 6
+    assert first.aggregate().prefixes() == ["10.0.0.0/23", "10.0.4.0/22", "2001:db8::/32"]
+    assert first.addresses() == {4: 1536, 6: 2 ** 96}
+    assert first.intersection(second).prefixes() == ["10.0.1.128/25", "10.0.6.0/23"]
+    assert first.difference(second).prefixes() == ["10.0.0.0/24", "10.0.1.0/25", "10.0.4.0/23", "2001:db8::/32"]
+    assert first.union(second).prefixes() == ["10.0.0.0/23", "10.0.4.0/22", "192.0.2.0/24", "2001:db8::/32"]
+
+def test_as_graph():
+    print("Testing: AS paths show upstreams, prepending and transit")
+    from src.parsers.as_graph import _ASGraph
+    from src.parsers.lg_parser import _LGParse
+    def response(*as_paths):
+        return _looking_glass(*(("192.0.2.0/24", as_path, "") for as_path in as_paths))
+    graph = _ASGraph()
+    record = graph.add("192.0.2.0/24", _LGParse(response("64500 64510 64496 64496 64496", "64501 64510 64496", "64502 64496")).parse())
+    assert record['origins'] == [64496]
+    assert record['upstreams'] == [{'asn': 64510, 'paths': 2}, {'asn': 64502, 'paths': 1}]
+    assert record['path_lengths'] == {'2': 1, '3': 2}
+    assert record['prepending'] == [{'asn': 64496, 'times': 3, 'paths': 1}]
+    assert record['transit'] == [64510]
+    graph.add("198.51.100.0/24", _LGParse(response("64500 64511 64497")).parse())
+    summary = graph.summary()
+    assert summary['prefixes'] == 2 and summary['adjacencies'] == 6
+    assert summary['upstreams']['64497'] == [{'asn': 64511, 'paths': 1}]
+    assert summary['transit'] == [64510, 64511]
+    # The origin RIS reports is used for the prefix and the summary alike
+    stripped = response("64500 64512")
+    stripped['data']['rrcs'][0]['peers'][0]['asn_origin'] = '64499'
+    assert graph.add("203.0.113.0/24", _LGParse(stripped).parse())['origins'] == [64499]
+    assert graph.summary()['upstreams']['64499'] == []